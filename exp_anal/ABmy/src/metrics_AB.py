@@ -5,7 +5,7 @@ import numpy as np
 import pandas as pd
 import logging
 
-from .pipeline import RatioMetricHypothesisTestingPipeline
+from .pipeline import BatchRatioMetricHypothesisTesting
 
 METRIC_LIST = [
     # market
@@ -184,13 +184,15 @@ METRIC_LIST = [
 
 
 def get_AB_results(df, alpha, metric_list=METRIC_LIST, groups={"control":"Control", "treatment":"GroupA"}):
+    tester = BatchRatioMetricHypothesisTesting(df, metric_list, groups)
+    tester.run()
+    results = {result["metric"]: result for result in tester.result.to_dict("records")}
     res_list = []
     for i in metric_list:
-        try:
-            pipeline = RatioMetricHypothesisTestingPipeline(df, i[0], i[1], i[2], groups)
-            pipeline.run()
-            res_list.append(pipeline.result)
-        except Exception as e:
+        if i[0] in results:
+            res_list.append(results[i[0]])
+        else:
+            e = tester.errors[i[0]]
             logging.warning(f"Ошибка при обработке метрики {i[0]}: {str(e)}")
             # Создаем пустую запись для ошибочной метрики
             error_result = {
@@ -193,14 +193,47 @@ def determine_bid_algorithm(row, t: float, alpha: float) -> str:
         return 'algo assignment error'
 
 
+def pack_object_prices(prices):
+    """
+    Object-колонку списков цен (available_prices_currency: list / np.ndarray в ячейках,
+    как отдаёт download_AB; Arrow-списки не поддерживаются) — в плоский массив.
+    Возвращает (values, offsets, valid): цены строки i — values[offsets[i]:offsets[i + 1]],
+    valid — в строке список / массив (а не None / NaN).
+    """
+    items = prices.to_numpy(dtype=object)
+    valid = np.fromiter((isinstance(x, (list, tuple, np.ndarray)) for x in items), dtype=bool, count=len(items))
+    lengths = np.zeros(len(items), dtype=np.int64)
+    lengths[valid] = [len(x) for x in items[valid]]
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    if lengths.sum() == 0:
+        return np.empty(0), offsets, valid
+    values = np.concatenate([np.asarray(x, dtype=np.float64).ravel() for x in items[valid]])
+    return values, offsets, valid
+
+
+def segment_max(values, offsets):
+    """
+    max() по строкам с семантикой встроенного max: NaN первым элементом даёт NaN,
+    NaN дальше по списку пропускается. Пустые строки — NaN.
+    """
+    lengths = np.diff(offsets)
+    result = np.full(len(lengths), np.nan)
+    nonempty = lengths > 0
+    if nonempty.any():
+        starts = offsets[:-1][nonempty]
+        result[nonempty] = np.where(np.isnan(values[starts]), np.nan, np.fmax.reduceat(values, starts))
+    return result
+
+
 def add_algo_name_new(df: pd.DataFrame, t: float, alpha: float) -> pd.DataFrame:
     """
-    Добавляет колонку 'algo_name_new' в датафрейм на основе определения алгоритма ставок.
+    Добавляет колонки 'eta_clipped', 'max_bid' и 'algo_name_new' — то же, что
+    determine_bid_algorithm, но сразу для всех строк.
     
     Parameters:
     -----------
     df : pandas.DataFrame
-        Датафрейм с необходимыми полями
+        Датафрейм с необходимыми полями (см. determine_bid_algorithm)
     t : float
         Минимальное значение для eta
     alpha : float
@@ -209,9 +242,34 @@ def add_algo_name_new(df: pd.DataFrame, t: float, alpha: float) -> pd.DataFrame:
     Returns:
     --------
     pandas.DataFrame
-        Датафрейм с добавленной колонкой 'algo_name_new'
+        Датафрейм с колонками:
+        - eta_clipped: max(eta, t)
+        - max_bid: int((1 + alpha) * max_price * (duration + eta) / (duration + t)), <NA> при ошибке
+        - algo_name_new: 'algo_default', 'algo_bidmph' или 'algo assignment error'
     """
-    df['algo_name_new'] = df.apply(lambda row: determine_bid_algorithm(row, t, alpha)[0], axis=1)
-    df['tmp'] = df.apply(lambda row: determine_bid_algorithm(row, t, alpha)[1], axis=1)
-    return df
+    eta = df['eta'].to_numpy(dtype=np.float64, na_value=np.nan)
+    # Шаг 0: max(eta, t) — NaN остаётся NaN, как у встроенного max
+    eta = np.where(t > eta, t, eta)
+    duration_seconds = df['duration_in_min'].to_numpy(dtype=np.float64, na_value=np.nan) * 60
 
+    # Шаг 1: max_bid
+    max_price = np.fmax(df['price_highrate_value'].to_numpy(dtype=np.float64, na_value=np.nan),
+                        df['price_start_value'].to_numpy(dtype=np.float64, na_value=np.nan))
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        max_bid = (1 + alpha) * max_price * (duration_seconds + eta) / (duration_seconds + t)
+    max_bid_ok = np.isfinite(max_bid)
+    max_bid = np.trunc(np.where(max_bid_ok, max_bid, 0))
+
+    # Шаг 2 и 3: максимум доступных цен и решение
+    values, offsets, prices_ok = pack_object_prices(df['available_prices_currency'])
+    max_available = segment_max(values, offsets)
+    ok = max_bid_ok & prices_ok & (np.diff(offsets) > 0)
+    algo_name = np.where(max_available <= max_bid, 'algo_default', 'algo_bidmph')
+    algo_name = np.where(ok, algo_name, 'algo assignment error')
+    if not max_bid_ok.all():
+        print(f"maxBid compute error: {(~max_bid_ok).sum()} rows")
+
+    df['eta_clipped'] = eta
+    df['max_bid'] = pd.arrays.IntegerArray(max_bid.astype(np.int64), ~max_bid_ok)
+    df['algo_name_new'] = pd.Categorical(algo_name)
+    return df
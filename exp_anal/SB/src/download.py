@@ -5,6 +5,9 @@ import numpy as np
 import pandas as pd
 
 from google.cloud import bigquery
+
+from .prepare import to_price_list
+
 client = bigquery.Client(project='analytics-dev-333113')
 
 
@@ -666,6 +669,9 @@ def download_bid_data(start_date, stop_date, city_id, user_name, printBool=False
     # SELECT *
     # FROM `analytics-dev-333113.temp.df_tender_{user_name}_exp`
     # """
-    return client.query(tmp_query).result().to_dataframe()
+    df = client.query(tmp_query).result().to_dataframe()
+    # Списки цен — одним Arrow ListArray вместо массива numpy на каждый бид
+    df['available_prices_currency'] = to_price_list(df['available_prices_currency'])
+    return df
 
 
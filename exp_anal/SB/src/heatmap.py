@@ -11,7 +11,7 @@ from typing import Callable, List, Optional, Tuple
 def calc_algo_mph(df, group_cols):
     result_df = (
         df[df['algo_name_new'] == 'algo_bidmph']
-        .groupby(group_cols)
+        .groupby(group_cols, observed=True)
         .size()
         .reset_index(name="algo_count_value")
     )
@@ -20,7 +20,7 @@ def calc_algo_mph(df, group_cols):
 # Функция для знаменателя
 def calc_total(df, group_cols):
     result_df = (
-        df.groupby(group_cols)
+        df.groupby(group_cols, observed=True)
         .size()
         .reset_index(name="total_count")
     )
@@ -1,10 +1,12 @@
 import warnings
 warnings.filterwarnings("ignore")
 
+from collections import namedtuple
+
 import numpy as np
 import pandas as pd
 
-from .pipeline import RatioMetricHypothesisTestingPipeline
+from .pipeline import BatchRatioMetricHypothesisTesting
 
 METRIC_LIST = [
     # market
@@ -212,220 +214,290 @@ METRIC_LIST = [
 
 
 def get_switchback_results(df, alpha, metric_list=METRIC_LIST, groups={"control":"Control", "treatment":"A"}):
-    res_list = []
-    for i in metric_list:
-        try:
-            pipeline = RatioMetricHypothesisTestingPipeline(df, i[0], i[1], i[2], groups)
-            pipeline.run()
-            res_list.append(pipeline.result)
-        except:
-            continue
-    df_res = pd.DataFrame(res_list)
+    # Все метрики за один проход; метрики, которые не удалось посчитать, пропускаются
+    tester = BatchRatioMetricHypothesisTesting(df, metric_list, groups)
+    tester.run()
+    df_res = tester.result
     df_res[f'is_significant'] = df_res['pvalue'] < alpha
     return df_res
 
+
+# Фильтры метрик и кэш масок одного прогона.
+# Каждое условие (option_number == 'option 1', is_bid_accepted, ...) считается один раз
+# на MaskCache и переиспользуется всеми метриками, которым он передан: metric_*(..., masks=...)
+# и calculate_absolute_metrics.
+BID_OPTIONS = {
+    'startprice': 'startprice',
+    'option1': 'option 1',
+    'option2': 'option 2',
+    'option3': 'option 3',
+    'other1': 'option 1+',
+    'other2': 'option 2+',
+    'other3': 'option 3+',
+}
+
+METRIC_FILTERS = {
+    # bids
+    'bid_accepted': lambda df: df.is_bid_accepted,
+    'bid_arrived': lambda df: df.is_bid_arrived,
+    'order_done': lambda df: df.is_order_done,
+    # orders
+    'order_with_tender': lambda df: df.is_order_with_tender,
+    'order_without_tender': lambda df: ~df.is_order_with_tender,
+    'order_accepted': lambda df: df.is_order_accepted,
+    'order_not_accepted': lambda df: ~df.is_order_accepted,
+    'order_arrived': lambda df: df.is_order_arrived,
+    'order_start_price_bid': lambda df: df.is_order_start_price_bid,
+    'by_minprice': lambda df: (df.price_start_usd >= df.minprice_usd*0.99) & (df.price_start_usd <= df.minprice_usd*1.01),
+    # recprice / orders
+    'surge_gr_1': lambda df: df.surge > 1,
+    'surge_le_1': lambda df: df.surge <= 1,
+}
+for _option, _value in BID_OPTIONS.items():
+    METRIC_FILTERS[f'option_{_option}'] = lambda df, value=_value: df.option_number == value
+
+
+class MaskCache:
+    """
+    Маски фильтров METRIC_FILTERS одного датафрейма (булевы массивы numpy) на один прогон.
+    Конъюнкция кэшируется так же, как одиночное условие: ('option_option1', 'bid_accepted').
+    Маски не следят за изменениями df: после перезаписи колонок нужен новый MaskCache.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self.masks = {}
+
+    def __call__(self, names=None):
+        if names is None:
+            names = ()
+        elif isinstance(names, str):
+            names = (names,)
+        key = tuple(names)
+        if key not in self.masks:
+            if len(key) == 0:
+                self.masks[key] = np.ones(len(self.df), dtype=bool)
+            elif len(key) == 1:
+                mask = pd.Series(METRIC_FILTERS[key[0]](self.df))
+                # NA в nullable-флагах отбрасывается, как при df[mask]
+                self.masks[key] = mask.to_numpy(dtype=bool, na_value=False)
+            else:
+                self.masks[key] = self(key[:-1]) & self(key[-1:])
+        return self.masks[key]
+
+
+def _filtered(df, *names, masks=None):
+    """
+    df[условие1 & условие2 & ...]. masks — MaskCache этого df, общий для метрик одного прогона;
+    без него маски считаются заново.
+    """
+    if masks is None:
+        masks = MaskCache(df)
+    return df[masks(names)]
+
+
 # temp
 def metric_bid2start_price_ratio(df, group_cols):
     df['bid2start_price_ratio'] = df['bid_price_currency'] / df['price_start_value']
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(bid2start_price_ratio_sum=('bid2start_price_ratio', 'sum'))
             .reset_index())
 
-def metric_bid_option_startprice2start_price_ratio(df, group_cols):
+def metric_bid_option_startprice2start_price_ratio(df, group_cols, masks=None):
     df['bid_option_startprice2start_price_ratio'] = df['bid_price_currency'] / df['price_start_value']
-    return (df[df.option_number == 'startprice']
-            .groupby(group_cols)
+    return (_filtered(df, 'option_startprice', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(bid_option_startprice2start_price_ratio_sum=('bid_option_startprice2start_price_ratio', 'sum'))
             .reset_index())
 
-def metric_bid_option_option12start_price_ratio(df, group_cols):
+def metric_bid_option_option12start_price_ratio(df, group_cols, masks=None):
     df['bid_option_option12start_price_ratio'] = df['bid_price_currency'] / df['price_start_value']
-    return (df[df.option_number == 'option 1']
-            .groupby(group_cols)
+    return (_filtered(df, 'option_option1', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(bid_option_option12start_price_ratio_sum=('bid_option_option12start_price_ratio', 'sum'))
             .reset_index())
 
-def metric_bid_option_option22start_price_ratio(df, group_cols):
+def metric_bid_option_option22start_price_ratio(df, group_cols, masks=None):
     df['bid_option_option22start_price_ratio'] = df['bid_price_currency'] / df['price_start_value']
-    return (df[df.option_number == 'option 2']
-            .groupby(group_cols)
+    return (_filtered(df, 'option_option2', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(bid_option_option22start_price_ratio_sum=('bid_option_option22start_price_ratio', 'sum'))
             .reset_index())
 
-def metric_bid_option_option32start_price_ratio(df, group_cols):
+def metric_bid_option_option32start_price_ratio(df, group_cols, masks=None):
     df['bid_option_option32start_price_ratio'] = df['bid_price_currency'] / df['price_start_value']
-    return (df[df.option_number == 'option 3']
-            .groupby(group_cols)
+    return (_filtered(df, 'option_option3', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(bid_option_option32start_price_ratio_sum=('bid_option_option32start_price_ratio', 'sum'))
             .reset_index())
 
-def metric_price_tender_accepted_usd_sum(df, group_cols):
-    return (df[df.is_order_accepted]
-            .groupby(group_cols)
+def metric_price_tender_accepted_usd_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'order_accepted', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(price_tender_accepted_usd_sum=('price_tender_usd', 'sum'))
             .reset_index())
 
-def metric_price_bid_accepted_currency_sum(df, group_cols):
-    return (df[df.is_bid_accepted]
-            .groupby(group_cols)
+def metric_price_bid_accepted_currency_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'bid_accepted', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(price_bid_accepted_currency_sum=('bid_price_currency', 'sum'))
             .reset_index())
 
-def metric_price_bid_done_currency_sum(df, group_cols):
-    return (df[df.is_bid_accepted & df.is_order_done]
-            .groupby(group_cols)
+def metric_price_bid_done_currency_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'bid_accepted', 'order_done', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(price_bid_done_currency_sum=('bid_price_currency', 'sum'))
             .reset_index())
 
-def metric_price_bid_done_option_startprice_currency_sum(df, group_cols):
-    return (df[(df.is_bid_accepted) & (df.is_order_done) & (df.option_number == 'startprice')]
-            .groupby(group_cols)
+def metric_price_bid_done_option_startprice_currency_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'bid_accepted', 'order_done', 'option_startprice', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(price_bid_done_option_startprice_currency_sum=('bid_price_currency', 'sum'))
             .reset_index())
 
-def metric_price_bid_done_option_option1_currency_sum(df, group_cols):
-    return (df[(df.is_bid_accepted) & (df.is_order_done) & (df.option_number == 'option 1')]
-            .groupby(group_cols)
+def metric_price_bid_done_option_option1_currency_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'bid_accepted', 'order_done', 'option_option1', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(price_bid_done_option_option1_currency_sum=('bid_price_currency', 'sum'))
             .reset_index())
 
-def metric_price_bid_done_option_option2_currency_sum(df, group_cols):
-    return (df[(df.is_bid_accepted) & (df.is_order_done) & (df.option_number == 'option 2')]
-            .groupby(group_cols)
+def metric_price_bid_done_option_option2_currency_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'bid_accepted', 'order_done', 'option_option2', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(price_bid_done_option_option2_currency_sum=('bid_price_currency', 'sum'))
             .reset_index())
 
-def metric_price_bid_done_option_option3_currency_sum(df, group_cols):
-    return (df[(df.is_bid_accepted) & (df.is_order_done) & (df.option_number == 'option 3')]
-            .groupby(group_cols)
+def metric_price_bid_done_option_option3_currency_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'bid_accepted', 'order_done', 'option_option3', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(price_bid_done_option_option3_currency_sum=('bid_price_currency', 'sum'))
             .reset_index())
 
 # from `indriver-e6e40.emart.incity_detail`
 def metric_orders_count(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(orders_count=('order_uuid', 'nunique'))
             .reset_index())
 
 def metric_tenders_count(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(tenders_count=('tenders_count', 'sum'))
             .reset_index())
 
 def metric_orders_with_bids_count(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(orders_with_bids_count=('is_order_with_tender', 'sum'))
             .reset_index())
 
-def metric_orders_with_accepted_bid_count(df, group_cols):
-    return (df[df.is_order_with_tender & df.is_order_accepted]
-            .groupby(group_cols)
+def metric_orders_with_accepted_bid_count(df, group_cols, masks=None):
+    return (_filtered(df, 'order_with_tender', 'order_accepted', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(orders_with_accepted_bid_count=('is_order_accepted', 'sum'))
             .reset_index())
 
-def metric_orders_without_accepted_bid_count(df, group_cols):
-    return (df[df.is_order_with_tender & ~df.is_order_accepted]
-            .groupby(group_cols)
+def metric_orders_without_accepted_bid_count(df, group_cols, masks=None):
+    return (_filtered(df, 'order_with_tender', 'order_not_accepted', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(orders_without_accepted_bid_count=('is_order_accepted', 'count'))
             .reset_index())
 
-def metric_orders_with_arivals_count(df, group_cols):
-    return (df[df.is_order_with_tender & df.is_order_accepted & df.is_order_arrived]
-            .groupby(group_cols)
+def metric_orders_with_arivals_count(df, group_cols, masks=None):
+    return (_filtered(df, 'order_with_tender', 'order_accepted', 'order_arrived', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(orders_with_arivals_count=('is_order_arrived', 'sum'))
             .reset_index())
 
-def metric_orders_without_bids_count(df, group_cols):
-    return (df[~df.is_order_with_tender]
-            .groupby(group_cols)
+def metric_orders_without_bids_count(df, group_cols, masks=None):
+    return (_filtered(df, 'order_without_tender', masks=masks)
+            .groupby(group_cols, observed=True)
             .size()
             .reset_index(name='orders_without_bids_count'))
 
 def metric_start_price_bid_orders_count(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(start_price_bid_orders_count=('is_order_start_price_bid', 'sum'))
             .reset_index())
 
 def metric_start_price_bid_accepted_orders_count(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(start_price_bid_accepted_orders_count=('is_order_accepted_start_price_bid', 'sum'))
             .reset_index())
 
 def metric_start_price_bid_rides_count(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(start_price_bid_rides_count=('is_order_done_start_price_bid', 'sum'))
             .reset_index())
 
 def metric_accepted_orders_count(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(accepted_orders_count=('is_order_accepted', 'sum'))
             .reset_index())
 
 def metric_rides_count(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(rides_count=('is_order_done', 'sum'))
             .reset_index())
 
 def metric_price_start_usd_sum(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(price_start_usd_sum=('price_start_usd', 'sum'))
             .reset_index())
 
-def metric_orders_without_bids_price_start_usd_sum(df, group_cols):
-    return (df[~df.is_order_with_tender]
-            .groupby(group_cols)
+def metric_orders_without_bids_price_start_usd_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'order_without_tender', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(orders_without_bids_price_start_usd_sum=('price_start_usd', 'sum'))
             .reset_index())
 
 def metric_rides_price_start_usd_sum(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(rides_price_start_usd_sum=('rides_price_start_usd', 'sum'))
             .reset_index())
 
 def metric_price_highrate_usd_sum(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(price_highrate_usd_sum=('price_highrate_usd', 'sum'))
             .reset_index())
 
-def metric_orders_without_bids_price_highrate_usd_sum(df, group_cols):
-    return (df[~df.is_order_with_tender]
-            .groupby(group_cols)
+def metric_orders_without_bids_price_highrate_usd_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'order_without_tender', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(orders_without_bids_price_highrate_usd_sum=('price_highrate_usd', 'sum'))
             .reset_index())
 
 def metric_rides_price_highrate_usd_sum(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(rides_price_highrate_usd_sum=('rides_price_highrate_usd', 'sum'))
             .reset_index())
 
 def metric_price_tender_usd_sum(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(price_tender_usd_sum=('price_tender_usd', 'sum'))
             .reset_index())
 
 def metric_price_done_usd_sum(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(price_done_usd_sum=('price_done_usd', 'sum'))
             .reset_index())
 
 def metric_good_orders_count(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(good_orders_count=('is_order_good', 'sum'))
             .reset_index())
 
@@ -433,141 +505,141 @@ def metric_good_orders_count(df, group_cols):
 # from `indriver-e6e40.ods_recprice_cdc.pricing_logs`
 def metric_calcprices_count(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(calcprices_count=('calcprice_uuid', 'nunique'))
             .reset_index())
 
 def metric_price_base_usd_sum(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(price_base_usd_sum=('price_base_usd', 'sum'))
             .reset_index())
 
 def metric_recprice_usd_sum(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(recprice_usd_sum=('recprice_usd', 'sum'))
             .reset_index())
 
 def metric_minprice_usd_sum(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(minprice_usd_sum=('minprice_usd', 'sum'))
             .reset_index())
 
 def metric_surge_sum(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(surge_sum=('surge', 'sum'))
             .reset_index())
 
-def metric_surge_gr_1_sum(df, group_cols):
-    return (df[df.surge > 1]
-            .groupby(group_cols)
+def metric_surge_gr_1_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'surge_gr_1', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(surge_gr_1_sum=('surge', 'sum'))
             .reset_index())
 
-def metric_surge_gr_1_calcprices_count(df, group_cols):
-    return (df[df.surge > 1]
-            .groupby(group_cols)
+def metric_surge_gr_1_calcprices_count(df, group_cols, masks=None):
+    return (_filtered(df, 'surge_gr_1', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(surge_gr_1_calcprices_count=('calcprice_uuid', 'nunique'))
             .reset_index())
 
-def metric_surge_le_1_sum(df, group_cols):
-    return (df[df.surge <= 1]
-            .groupby(group_cols)
+def metric_surge_le_1_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'surge_le_1', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(surge_le_1_sum=('surge', 'sum'))
             .reset_index())
 
-def metric_surge_le_1_calcprices_count(df, group_cols):
-    return (df[df.surge <= 1]
-            .groupby(group_cols)
+def metric_surge_le_1_calcprices_count(df, group_cols, masks=None):
+    return (_filtered(df, 'surge_le_1', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(surge_le_1_calcprices_count=('calcprice_uuid', 'nunique'))
             .reset_index())
 
 
 # from incity_and_pricing_tbl
-def metric_orders_by_minprice_count(df, group_cols):
-    return (df[(df.price_start_usd >= df.minprice_usd*0.99) & (df.price_start_usd <= df.minprice_usd*1.01)]
-            .groupby(group_cols)
+def metric_orders_by_minprice_count(df, group_cols, masks=None):
+    return (_filtered(df, 'by_minprice', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(orders_by_minprice_count=('order_uuid', 'nunique'))
             .reset_index())
 
-def metric_orders_by_minprice_with_bids_count(df, group_cols):
-    return (df[(df.price_start_usd >= df.minprice_usd*0.99) & (df.price_start_usd <= df.minprice_usd*1.01) & (df.is_order_with_tender)]
-            .groupby(group_cols)
+def metric_orders_by_minprice_with_bids_count(df, group_cols, masks=None):
+    return (_filtered(df, 'by_minprice', 'order_with_tender', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(orders_by_minprice_with_bids_count=('order_uuid', 'nunique'))
             .reset_index())
 
-def metric_accepted_orders_by_minprice_count(df, group_cols):
-    return (df[(df.price_start_usd >= df.minprice_usd*0.99) & (df.price_start_usd <= df.minprice_usd*1.01) & (df.is_order_accepted)]
-            .groupby(group_cols)
+def metric_accepted_orders_by_minprice_count(df, group_cols, masks=None):
+    return (_filtered(df, 'by_minprice', 'order_accepted', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(accepted_orders_by_minprice_count=('order_uuid', 'nunique'))
             .reset_index())
 
-def metric_rides_by_minprice_count(df, group_cols):
-    return (df[(df.price_start_usd >= df.minprice_usd*0.99) & (df.price_start_usd <= df.minprice_usd*1.01) & (df.is_order_done)]
-            .groupby(group_cols)
+def metric_rides_by_minprice_count(df, group_cols, masks=None):
+    return (_filtered(df, 'by_minprice', 'order_done', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(rides_by_minprice_count=('order_uuid', 'nunique'))
             .reset_index())
 
-def metric_surge_gr_1_orders_count(df, group_cols):
-    return (df[df.surge > 1]
-            .groupby(group_cols)
+def metric_surge_gr_1_orders_count(df, group_cols, masks=None):
+    return (_filtered(df, 'surge_gr_1', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(surge_gr_1_orders_count=('order_uuid', 'nunique'))
             .reset_index())
 
-def metric_surge_le_1_orders_count(df, group_cols):
-    return (df[df.surge <= 1]
-            .groupby(group_cols)
+def metric_surge_le_1_orders_count(df, group_cols, masks=None):
+    return (_filtered(df, 'surge_le_1', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(surge_le_1_orders_count=('order_uuid', 'nunique'))
             .reset_index())
 
-def metric_surge_gr_1_orders_with_bids_count(df, group_cols):
-    return (df[(df.surge > 1) & (df.is_order_with_tender)]
-            .groupby(group_cols)
+def metric_surge_gr_1_orders_with_bids_count(df, group_cols, masks=None):
+    return (_filtered(df, 'surge_gr_1', 'order_with_tender', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(surge_gr_1_orders_with_bids_count=('order_uuid', 'nunique'))
             .reset_index())
 
-def metric_surge_le_1_orders_with_bids_count(df, group_cols):
-    return (df[(df.surge <= 1) & (df.is_order_with_tender)]
-            .groupby(group_cols)
+def metric_surge_le_1_orders_with_bids_count(df, group_cols, masks=None):
+    return (_filtered(df, 'surge_le_1', 'order_with_tender', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(surge_le_1_orders_with_bids_count=('order_uuid', 'nunique'))
             .reset_index())
 
-def metric_surge_gr_1_start_price_bid_orders_count(df, group_cols):
-    return (df[(df.surge > 1) & (df.is_order_start_price_bid)]
-            .groupby(group_cols)
+def metric_surge_gr_1_start_price_bid_orders_count(df, group_cols, masks=None):
+    return (_filtered(df, 'surge_gr_1', 'order_start_price_bid', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(surge_gr_1_start_price_bid_orders_count=('order_uuid', 'nunique'))
             .reset_index())
 
-def metric_surge_le_1_start_price_bid_orders_count(df, group_cols):
-    return (df[(df.surge <= 1) & (df.is_order_start_price_bid)]
-            .groupby(group_cols)
+def metric_surge_le_1_start_price_bid_orders_count(df, group_cols, masks=None):
+    return (_filtered(df, 'surge_le_1', 'order_start_price_bid', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(surge_le_1_start_price_bid_orders_count=('order_uuid', 'nunique'))
             .reset_index())
 
-def metric_surge_gr_1_accepted_orders_count(df, group_cols):
-    return (df[(df.surge > 1) & (df.is_order_accepted)]
-            .groupby(group_cols)
+def metric_surge_gr_1_accepted_orders_count(df, group_cols, masks=None):
+    return (_filtered(df, 'surge_gr_1', 'order_accepted', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(surge_gr_1_accepted_orders_count=('order_uuid', 'nunique'))
             .reset_index())
 
-def metric_surge_le_1_accepted_orders_count(df, group_cols):
-    return (df[(df.surge <= 1) & (df.is_order_accepted)]
-            .groupby(group_cols)
+def metric_surge_le_1_accepted_orders_count(df, group_cols, masks=None):
+    return (_filtered(df, 'surge_le_1', 'order_accepted', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(surge_le_1_accepted_orders_count=('order_uuid', 'nunique'))
             .reset_index())
 
-def metric_surge_gr_1_rides_count(df, group_cols):
-    return (df[(df.surge > 1) & (df.is_order_done)]
-            .groupby(group_cols)
+def metric_surge_gr_1_rides_count(df, group_cols, masks=None):
+    return (_filtered(df, 'surge_gr_1', 'order_done', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(surge_gr_1_rides_count=('order_uuid', 'nunique'))
             .reset_index())
 
-def metric_surge_le_1_rides_count(df, group_cols):
-    return (df[(df.surge <= 1) & (df.is_order_done)]
-            .groupby(group_cols)
+def metric_surge_le_1_rides_count(df, group_cols, masks=None):
+    return (_filtered(df, 'surge_le_1', 'order_done', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(surge_le_1_rides_count=('order_uuid', 'nunique'))
             .reset_index())
 
@@ -575,307 +647,307 @@ def metric_surge_le_1_rides_count(df, group_cols):
 # from df_bids
 def metric_drivers_count(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(drivers_count=('driver_uuid', 'nunique'))
             .reset_index())
 
 def metric_bids_count(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(bids_count=('bid_uuid', 'nunique'))
             .reset_index())
 
 def metric_bids_arrived_count(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(bids_arrived_count=('is_bid_arrived', 'sum'))
             .reset_index())
 
-def metric_bids_for_done_orders_count(df, group_cols):
-    return (df[df.is_order_done]
-            .groupby(group_cols)
+def metric_bids_for_done_orders_count(df, group_cols, masks=None):
+    return (_filtered(df, 'order_done', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(bids_for_done_orders_count=('bid_uuid', 'nunique'))
             .reset_index())
 
 def metric_bids_bid_price_currency_sum(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(bids_bid_price_currency_sum=('bid_price_currency', 'sum'))
             .reset_index())
 
 def metric_accepted_bids_count(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(accepted_bids_count=('is_bid_accepted', 'sum'))
             .reset_index())
 
 def metric_done_bids_count(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(done_bids_count=('is_bid_done', 'sum'))
             .reset_index())
 
-def metric_accepted_bids_bid_price_currency_sum(df, group_cols):
-    return (df[df.is_bid_accepted]
-            .groupby(group_cols)
+def metric_accepted_bids_bid_price_currency_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'bid_accepted', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(accepted_bids_bid_price_currency_sum=('bid_price_currency', 'sum'))
             .reset_index())
 
-def metric_orders_with_bid_option_startprice_count(df, group_cols):
-    return (df[(df.option_number == 'startprice')]
-            .groupby(group_cols)
+def metric_orders_with_bid_option_startprice_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_startprice', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(orders_with_bid_option_startprice_count=('order_uuid', 'nunique'))
             .reset_index())
 
-def metric_rides_by_bid_option_startprice_count(df, group_cols):
-    return (df[(df.option_number == 'startprice') & (df.is_bid_accepted) & (df.is_order_done)]
-            .groupby(group_cols)
+def metric_rides_by_bid_option_startprice_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_startprice', 'bid_accepted', 'order_done', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(rides_by_bid_option_startprice_count=('order_uuid', 'nunique'))
             .reset_index())
 
-def TEST_rides_count_by_bids(df, group_cols):
-    return (df[df.is_order_done]
-            .groupby(group_cols)
+def TEST_rides_count_by_bids(df, group_cols, masks=None):
+    return (_filtered(df, 'order_done', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(TEST_rides_count_by_bids=('order_uuid', 'nunique'))
             .reset_index())
 
-def metric_bids_option_startprice_count(df, group_cols):
-    return (df[df.option_number == 'startprice']
-            .groupby(group_cols)
+def metric_bids_option_startprice_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_startprice', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(bids_option_startprice_count=('bid_uuid', 'nunique'))
             .reset_index())
 
-def metric_bids_option_startprice_bid_price_currency_sum(df, group_cols):
-    return (df[df.option_number == 'startprice']
-            .groupby(group_cols)
+def metric_bids_option_startprice_bid_price_currency_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'option_startprice', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(bids_option_startprice_bid_price_currency_sum=('bid_price_currency', 'sum'))
             .reset_index())
 
-def metric_accepted_bids_option_startprice_count(df, group_cols):
-    return (df[(df.option_number == 'startprice') & (df.is_bid_accepted)]
-            .groupby(group_cols)
+def metric_accepted_bids_option_startprice_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_startprice', 'bid_accepted', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(accepted_bids_option_startprice_count=('bid_uuid', 'nunique'))
             .reset_index())
 
-def metric_bids_option_startprice_accepted_bid_price_currency_sum(df, group_cols):
-    return (df[(df.option_number == 'startprice') & (df.is_bid_accepted)]
-            .groupby(group_cols)
+def metric_bids_option_startprice_accepted_bid_price_currency_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'option_startprice', 'bid_accepted', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(accepted_bids_option_startprice_bid_price_currency_sum=('bid_price_currency', 'sum'))
             .reset_index())
 
-def metric_orders_with_bid_option_option1_count(df, group_cols):
-    return (df[(df.option_number == 'option 1')]
-            .groupby(group_cols)
+def metric_orders_with_bid_option_option1_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_option1', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(orders_with_bid_option_option1_count=('order_uuid', 'nunique'))
             .reset_index())
 
-def metric_rides_by_bid_option_option1_count(df, group_cols):
-    return (df[(df.option_number == 'option 1') & (df.is_bid_accepted) & (df.is_order_done)]
-            .groupby(group_cols)
+def metric_rides_by_bid_option_option1_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_option1', 'bid_accepted', 'order_done', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(rides_by_bid_option_option1_count=('order_uuid', 'nunique'))
             .reset_index())
 
-def metric_bids_option_option1_count(df, group_cols):
-    return (df[df.option_number == 'option 1']
-            .groupby(group_cols)
+def metric_bids_option_option1_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_option1', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(bids_option_option1_count=('bid_uuid', 'nunique'))
             .reset_index())
 
-def metric_bids_option_option1_bid_price_currency_sum(df, group_cols):
-    return (df[df.option_number == 'option 1']
-            .groupby(group_cols)
+def metric_bids_option_option1_bid_price_currency_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'option_option1', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(bids_option_option1_bid_price_currency_sum=('bid_price_currency', 'sum'))
             .reset_index())
 
-def metric_accepted_bids_option_option1_count(df, group_cols):
-    return (df[(df.option_number == 'option 1') & (df.is_bid_accepted)]
-            .groupby(group_cols)
+def metric_accepted_bids_option_option1_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_option1', 'bid_accepted', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(accepted_bids_option_option1_count=('bid_uuid', 'nunique'))
             .reset_index())
 
-def metric_accepted_bids_option_option1_bid_price_currency_sum(df, group_cols):
-    return (df[(df.option_number == 'option 1') & (df.is_bid_accepted)]
-            .groupby(group_cols)
+def metric_accepted_bids_option_option1_bid_price_currency_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'option_option1', 'bid_accepted', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(accepted_bids_option_option1_bid_price_currency_sum=('bid_price_currency', 'sum'))
             .reset_index())
 
-def metric_orders_with_bid_option_option2_count(df, group_cols):
-    return (df[(df.option_number == 'option 2')]
-            .groupby(group_cols)
+def metric_orders_with_bid_option_option2_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_option2', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(orders_with_bid_option_option2_count=('order_uuid', 'nunique'))
             .reset_index())
 
-def metric_rides_by_bid_option_option2_count(df, group_cols):
-    return (df[(df.option_number == 'option 2') & (df.is_bid_accepted) & (df.is_order_done)]
-            .groupby(group_cols)
+def metric_rides_by_bid_option_option2_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_option2', 'bid_accepted', 'order_done', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(rides_by_bid_option_option2_count=('order_uuid', 'nunique'))
             .reset_index())
 
-def metric_bids_option_option2_count(df, group_cols):
-    return (df[df.option_number == 'option 2']
-            .groupby(group_cols)
+def metric_bids_option_option2_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_option2', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(bids_option_option2_count=('bid_uuid', 'nunique'))
             .reset_index())
 
-def metric_bids_option_option2_bid_price_currency_sum(df, group_cols):
-    return (df[df.option_number == 'option 2']
-            .groupby(group_cols)
+def metric_bids_option_option2_bid_price_currency_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'option_option2', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(bids_option_option2_bid_price_currency_sum=('bid_price_currency', 'sum'))
             .reset_index())
 
-def metric_accepted_bids_option_option2_count(df, group_cols):
-    return (df[(df.option_number == 'option 2') & (df.is_bid_accepted)]
-            .groupby(group_cols)
+def metric_accepted_bids_option_option2_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_option2', 'bid_accepted', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(accepted_bids_option_option2_count=('bid_uuid', 'nunique'))
             .reset_index())
 
-def metric_accepted_bids_option_option2_bid_price_currency_sum(df, group_cols):
-    return (df[(df.option_number == 'option 2') & (df.is_bid_accepted)]
-            .groupby(group_cols)
+def metric_accepted_bids_option_option2_bid_price_currency_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'option_option2', 'bid_accepted', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(accepted_bids_option_option2_bid_price_currency_sum=('bid_price_currency', 'sum'))
             .reset_index())
 
-def metric_orders_with_bid_option_option3_count(df, group_cols):
-    return (df[(df.option_number == 'option 3')]
-            .groupby(group_cols)
+def metric_orders_with_bid_option_option3_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_option3', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(orders_with_bid_option_option3_count=('order_uuid', 'nunique'))
             .reset_index())
 
-def metric_rides_by_bid_option_option3_count(df, group_cols):
-    return (df[(df.option_number == 'option 3') & (df.is_bid_accepted) & (df.is_order_done)]
-            .groupby(group_cols)
+def metric_rides_by_bid_option_option3_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_option3', 'bid_accepted', 'order_done', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(rides_by_bid_option_option3_count=('order_uuid', 'nunique'))
             .reset_index())
 
-def metric_bids_option_option3_count(df, group_cols):
-    return (df[df.option_number == 'option 3']
-            .groupby(group_cols)
+def metric_bids_option_option3_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_option3', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(bids_option_option3_count=('bid_uuid', 'nunique'))
             .reset_index())
 
-def metric_bids_option_option3_bid_price_currency_sum(df, group_cols):
-    return (df[df.option_number == 'option 3']
-            .groupby(group_cols)
+def metric_bids_option_option3_bid_price_currency_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'option_option3', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(bids_option_option3_bid_price_currency_sum=('bid_price_currency', 'sum'))
             .reset_index())
 
-def metric_accepted_bids_option_option3_count(df, group_cols):
-    return (df[(df.option_number == 'option 3') & (df.is_bid_accepted)]
-            .groupby(group_cols)
+def metric_accepted_bids_option_option3_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_option3', 'bid_accepted', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(accepted_bids_option_option3_count=('bid_uuid', 'nunique'))
             .reset_index())
 
-def metric_accepted_bids_option_option3_bid_price_currency_sum(df, group_cols):
-    return (df[(df.option_number == 'option 3') & (df.is_bid_accepted)]
-            .groupby(group_cols)
+def metric_accepted_bids_option_option3_bid_price_currency_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'option_option3', 'bid_accepted', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(accepted_bids_option_option3_bid_price_currency_sum=('bid_price_currency', 'sum'))
             .reset_index())
 
-def metric_orders_with_bid_option_other1_count(df, group_cols):
-    return (df[(df.option_number == 'option 1+')]
-            .groupby(group_cols)
+def metric_orders_with_bid_option_other1_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_other1', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(orders_with_bid_option_other1_count=('order_uuid', 'nunique'))
             .reset_index())
 
-def metric_rides_by_bid_option_other1_count(df, group_cols):
-    return (df[(df.option_number == 'option 1+') & (df.is_bid_accepted) & (df.is_order_done)]
-            .groupby(group_cols)
+def metric_rides_by_bid_option_other1_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_other1', 'bid_accepted', 'order_done', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(rides_by_bid_option_other1_count=('order_uuid', 'nunique'))
             .reset_index())
 
-def metric_bids_option_other1_count(df, group_cols):
-    return (df[df.option_number == 'option 1+']
-            .groupby(group_cols)
+def metric_bids_option_other1_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_other1', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(bids_option_other1_count=('bid_uuid', 'nunique'))
             .reset_index())
 
-def metric_bids_option_other1_bid_price_currency_sum(df, group_cols):
-    return (df[df.option_number == 'option 1+']
-            .groupby(group_cols)
+def metric_bids_option_other1_bid_price_currency_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'option_other1', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(bids_option_other1_bid_price_currency_sum=('bid_price_currency', 'sum'))
             .reset_index())
 
-def metric_accepted_bids_option_other1_count(df, group_cols):
-    return (df[(df.option_number == 'option 1+') & (df.is_bid_accepted)]
-            .groupby(group_cols)
+def metric_accepted_bids_option_other1_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_other1', 'bid_accepted', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(accepted_bids_option_other1_count=('bid_uuid', 'nunique'))
             .reset_index())
 
-def metric_accepted_bids_option_other1_bid_price_currency_sum(df, group_cols):
-    return (df[(df.option_number == 'option 1+') & (df.is_bid_accepted)]
-            .groupby(group_cols)
+def metric_accepted_bids_option_other1_bid_price_currency_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'option_other1', 'bid_accepted', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(accepted_bids_option_other1_bid_price_currency_sum=('bid_price_currency', 'sum'))
             .reset_index())
 
-def metric_orders_with_bid_option_other2_count(df, group_cols):
-    return (df[(df.option_number == 'option 2+')]
-            .groupby(group_cols)
+def metric_orders_with_bid_option_other2_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_other2', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(orders_with_bid_option_other2_count=('order_uuid', 'nunique'))
             .reset_index())
 
-def metric_rides_by_bid_option_other2_count(df, group_cols):
-    return (df[(df.option_number == 'option 2+') & (df.is_bid_accepted) & (df.is_order_done)]
-            .groupby(group_cols)
+def metric_rides_by_bid_option_other2_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_other2', 'bid_accepted', 'order_done', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(rides_by_bid_option_other2_count=('order_uuid', 'nunique'))
             .reset_index())
 
-def metric_bids_option_other2_count(df, group_cols):
-    return (df[df.option_number == 'option 2+']
-            .groupby(group_cols)
+def metric_bids_option_other2_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_other2', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(bids_option_other2_count=('bid_uuid', 'nunique'))
             .reset_index())
 
-def metric_bids_option_other2_bid_price_currency_sum(df, group_cols):
-    return (df[df.option_number == 'option 2+']
-            .groupby(group_cols)
+def metric_bids_option_other2_bid_price_currency_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'option_other2', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(bids_option_other2_bid_price_currency_sum=('bid_price_currency', 'sum'))
             .reset_index())
 
-def metric_accepted_bids_option_other2_count(df, group_cols):
-    return (df[(df.option_number == 'option 2+') & (df.is_bid_accepted)]
-            .groupby(group_cols)
+def metric_accepted_bids_option_other2_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_other2', 'bid_accepted', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(accepted_bids_option_other2_count=('bid_uuid', 'nunique'))
             .reset_index())
 
-def metric_accepted_bids_option_other2_bid_price_currency_sum(df, group_cols):
-    return (df[(df.option_number == 'option 2+') & (df.is_bid_accepted)]
-            .groupby(group_cols)
+def metric_accepted_bids_option_other2_bid_price_currency_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'option_other2', 'bid_accepted', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(accepted_bids_option_other2_bid_price_currency_sum=('bid_price_currency', 'sum'))
             .reset_index())
 
-def metric_orders_with_bid_option_other3_count(df, group_cols):
-    return (df[(df.option_number == 'option 3+')]
-            .groupby(group_cols)
+def metric_orders_with_bid_option_other3_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_other3', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(orders_with_bid_option_other3_count=('order_uuid', 'nunique'))
             .reset_index())
 
-def metric_rides_by_bid_option_other3_count(df, group_cols):
-    return (df[(df.option_number == 'option 3+') & (df.is_bid_accepted) & (df.is_order_done)]
-            .groupby(group_cols)
+def metric_rides_by_bid_option_other3_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_other3', 'bid_accepted', 'order_done', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(rides_by_bid_option_other3_count=('order_uuid', 'nunique'))
             .reset_index())
 
-def metric_bids_option_other3_count(df, group_cols):
-    return (df[df.option_number == 'option 3+']
-            .groupby(group_cols)
+def metric_bids_option_other3_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_other3', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(bids_option_other3_count=('bid_uuid', 'nunique'))
             .reset_index())
 
-def metric_bids_option_other3_bid_price_currency_sum(df, group_cols):
-    return (df[df.option_number == 'option 3+']
-            .groupby(group_cols)
+def metric_bids_option_other3_bid_price_currency_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'option_other3', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(bids_option_other3_bid_price_currency_sum=('bid_price_currency', 'sum'))
             .reset_index())
 
-def metric_accepted_bids_option_other3_count(df, group_cols):
-    return (df[(df.option_number == 'option 3+') & (df.is_bid_accepted)]
-            .groupby(group_cols)
+def metric_accepted_bids_option_other3_count(df, group_cols, masks=None):
+    return (_filtered(df, 'option_other3', 'bid_accepted', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(accepted_bids_option_other3_count=('bid_uuid', 'nunique'))
             .reset_index())
 
-def metric_accepted_bids_option_other3_bid_price_currency_sum(df, group_cols):
-    return (df[(df.option_number == 'option 3+') & (df.is_bid_accepted)]
-            .groupby(group_cols)
+def metric_accepted_bids_option_other3_bid_price_currency_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'option_other3', 'bid_accepted', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(accepted_bids_option_other3_bid_price_currency_sum=('bid_price_currency', 'sum'))
             .reset_index())
 
@@ -883,239 +955,303 @@ def metric_accepted_bids_option_other3_bid_price_currency_sum(df, group_cols):
 # time metrics
 def metric_time_to_1st_bid_sec_sum(df, group_cols):
     return (df.drop_duplicates(subset=['order_uuid'] + group_cols + ['time_to_1st_bid_sec'])
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(time_to_1st_bid_sec_sum=('time_to_1st_bid_sec', 'sum'))
             .reset_index())
 
 def metric_time_1st_bid_to_accept_sec_sum(df, group_cols):
     return (df.drop_duplicates(subset=['order_uuid'] + group_cols + ['time_1st_bid_to_accept_sec'])
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(time_1st_bid_to_accept_sec_sum=('time_1st_bid_to_accept_sec', 'sum'))
             .reset_index())
 
-def metric_rta_sum_orders(df, group_cols):
-    return (df[df.is_order_done]
-            .groupby(group_cols)
+def metric_rta_sum_orders(df, group_cols, masks=None):
+    return (_filtered(df, 'order_done', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(rta_sum_orders=('rta', 'sum'))
             .reset_index())
 
-def metric_rta_sum(df, group_cols):
-    return (df[df.is_bid_arrived]
-            .groupby(group_cols)
+def metric_rta_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'bid_arrived', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(rta_sum=('rta', 'sum'))
             .reset_index())
 
-def metric_rtr_sum(df, group_cols):
-    return (df[df.is_order_done]
-            .groupby(group_cols)
+def metric_rtr_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'order_done', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(rtr_sum=('rtr', 'sum'))
             .reset_index())
 
 def metric_eta_sum(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(eta_sum=('eta', 'sum'))
             .reset_index())
 
-def metric_eta_accepted_bids_sum(df, group_cols):
-    return (df[df.is_bid_accepted]
-            .groupby(group_cols)
+def metric_eta_accepted_bids_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'bid_accepted', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(eta_accepted_bids_sum=('eta', 'sum'))
             .reset_index())
 
-def metric_eta_done_bids_sum(df, group_cols):
-    return (df[df.is_bid_accepted & df.is_order_done]
-            .groupby(group_cols)
+def metric_eta_done_bids_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'bid_accepted', 'order_done', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(eta_done_bids_sum=('eta', 'sum'))
             .reset_index())
 
-def metric_eta_done_orders_sum(df, group_cols):
-    return (df[df.is_order_done]
-            .groupby(group_cols)
+def metric_eta_done_orders_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'order_done', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(eta_done_orders_sum=('eta', 'sum'))
             .reset_index())
 
 def metric_etr_sum(df, group_cols):
     return (df
-            .groupby(group_cols)
+            .groupby(group_cols, observed=True)
             .agg(etr_sum=('etr', 'sum'))
             .reset_index())
 
-def metric_etr_orders_without_bids_sum(df, group_cols):
-    return (df[~df.is_order_with_tender]
-            .groupby(group_cols)
+def metric_etr_orders_without_bids_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'order_without_tender', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(etr_orders_without_bids_sum=('etr', 'sum'))
             .reset_index())
 
-def metric_etr_orders_with_bids_sum(df, group_cols):
-    return (df[df.is_order_with_tender]
-            .groupby(group_cols)
+def metric_etr_orders_with_bids_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'order_with_tender', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(etr_orders_with_bids_sum=('etr', 'sum'))
             .reset_index())
 
-def metric_etr_orders_with_accepted_bids_sum(df, group_cols):
-    return (df[df.is_order_with_tender & df.is_order_accepted]
-            .groupby(group_cols)
+def metric_etr_orders_with_accepted_bids_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'order_with_tender', 'order_accepted', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(etr_orders_with_accepted_bids_sum=('etr', 'sum'))
             .reset_index())
 
-def metric_etr_orders_without_accepted_bids_sum(df, group_cols):
-    return (df[df.is_order_with_tender & ~df.is_order_accepted]
-            .groupby(group_cols)
+def metric_etr_orders_without_accepted_bids_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'order_with_tender', 'order_not_accepted', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(etr_orders_without_accepted_bids_sum=('etr', 'sum'))
             .reset_index())
 
-def metric_etr_done_orders_sum(df, group_cols):
-    return (df[df.is_order_done]
-            .groupby(group_cols)
+def metric_etr_done_orders_sum(df, group_cols, masks=None):
+    return (_filtered(df, 'order_done', masks=masks)
+            .groupby(group_cols, observed=True)
             .agg(etr_done_orders_sum=('etr', 'sum'))
             .reset_index())
 
-def calculate_absolute_metrics(df_recprice=None, df_order_with_recprice=None, df_bid=None, group_cols=None):
-    # Create an empty DataFrame with the grouping columns
-    dfm = pd.DataFrame(columns=group_cols)
-    
-    # Define metric groups by their source DataFrame
-    recprice_metrics = [
-        (metric_calcprices_count, df_recprice),
-        (metric_price_base_usd_sum, df_recprice),
-        (metric_recprice_usd_sum, df_recprice),
-        (metric_minprice_usd_sum, df_recprice),
-        (metric_surge_sum, df_recprice),
-        (metric_surge_gr_1_sum, df_recprice),
-        (metric_surge_gr_1_calcprices_count, df_recprice),
-        (metric_surge_le_1_sum, df_recprice),
-        (metric_surge_le_1_calcprices_count, df_recprice)
-    ]
-    
-    order_metrics = [
-        (metric_orders_count, df_order_with_recprice),
-        (metric_orders_without_bids_count, df_order_with_recprice),
-        (metric_tenders_count, df_order_with_recprice),
-        (metric_orders_with_bids_count, df_order_with_recprice),
-        (metric_orders_with_accepted_bid_count, df_order_with_recprice),
-        (metric_orders_without_accepted_bid_count, df_order_with_recprice),
-        (metric_orders_with_arivals_count, df_order_with_recprice),
-        (metric_start_price_bid_orders_count, df_order_with_recprice),
-        (metric_start_price_bid_accepted_orders_count, df_order_with_recprice),
-        (metric_start_price_bid_rides_count, df_order_with_recprice),
-        (metric_accepted_orders_count, df_order_with_recprice),
-        (metric_rides_count, df_order_with_recprice),
-        (metric_price_start_usd_sum, df_order_with_recprice),
-        (metric_rides_price_start_usd_sum, df_order_with_recprice),
-        (metric_orders_without_bids_price_start_usd_sum, df_order_with_recprice),
-        (metric_price_highrate_usd_sum, df_order_with_recprice),
-        (metric_rides_price_highrate_usd_sum, df_order_with_recprice),
-        (metric_orders_without_bids_price_highrate_usd_sum, df_order_with_recprice),
-        (metric_price_tender_usd_sum, df_order_with_recprice),
-        (metric_price_done_usd_sum, df_order_with_recprice),
-        (metric_price_tender_accepted_usd_sum, df_order_with_recprice),
-        (metric_good_orders_count, df_order_with_recprice),
-        (metric_orders_by_minprice_count, df_order_with_recprice),
-        (metric_orders_by_minprice_with_bids_count, df_order_with_recprice),
-        (metric_accepted_orders_by_minprice_count, df_order_with_recprice),
-        (metric_rides_by_minprice_count, df_order_with_recprice),
-        (metric_surge_gr_1_orders_count, df_order_with_recprice),
-        (metric_surge_le_1_orders_count, df_order_with_recprice),
-        (metric_surge_gr_1_orders_with_bids_count, df_order_with_recprice),
-        (metric_surge_le_1_orders_with_bids_count, df_order_with_recprice),
-        (metric_surge_gr_1_start_price_bid_orders_count, df_order_with_recprice),
-        (metric_surge_le_1_start_price_bid_orders_count, df_order_with_recprice),
-        (metric_surge_gr_1_accepted_orders_count, df_order_with_recprice),
-        (metric_surge_le_1_accepted_orders_count, df_order_with_recprice),
-        (metric_surge_gr_1_rides_count, df_order_with_recprice),
-        (metric_surge_le_1_rides_count, df_order_with_recprice),
-        (metric_rta_sum_orders, df_order_with_recprice),
-        (metric_rtr_sum, df_order_with_recprice),
-        (metric_etr_sum, df_order_with_recprice),
-        (metric_etr_orders_with_bids_sum, df_order_with_recprice),
-        (metric_etr_orders_with_accepted_bids_sum, df_order_with_recprice),
-        (metric_etr_orders_without_accepted_bids_sum, df_order_with_recprice),
-        (metric_etr_done_orders_sum, df_order_with_recprice),
-        (metric_etr_orders_without_bids_sum, df_order_with_recprice)
-    ]
-    
-    bid_metrics = [
-        # (metric_drivers_count, df_bid),
-        (metric_bids_count, df_bid),
-        (metric_bids_arrived_count, df_bid),
-        (metric_bids_for_done_orders_count, df_bid),
-        (metric_bids_bid_price_currency_sum, df_bid),
-        (metric_accepted_bids_count, df_bid),
-        (metric_done_bids_count, df_bid),
-        (metric_accepted_bids_bid_price_currency_sum, df_bid),
-        (TEST_rides_count_by_bids, df_bid),
-        (metric_price_bid_accepted_currency_sum, df_bid),
-        (metric_rides_by_bid_option_startprice_count, df_bid),
-        (metric_bids_option_startprice_count, df_bid),
-        (metric_bids_option_startprice_bid_price_currency_sum, df_bid),
-        (metric_accepted_bids_option_startprice_count, df_bid),
-        (metric_bids_option_startprice_accepted_bid_price_currency_sum, df_bid),
-        (metric_rides_by_bid_option_option1_count, df_bid),
-        (metric_bids_option_option1_count, df_bid),
-        (metric_bids_option_option1_bid_price_currency_sum, df_bid),
-        (metric_accepted_bids_option_option1_count, df_bid),
-        (metric_accepted_bids_option_option1_bid_price_currency_sum, df_bid),
-        (metric_rides_by_bid_option_option2_count, df_bid),
-        (metric_bids_option_option2_count, df_bid),
-        (metric_bids_option_option2_bid_price_currency_sum, df_bid),
-        (metric_accepted_bids_option_option2_count, df_bid),
-        (metric_accepted_bids_option_option2_bid_price_currency_sum, df_bid),
-        (metric_rides_by_bid_option_option3_count, df_bid),
-        (metric_bids_option_option3_count, df_bid),
-        (metric_bids_option_option3_bid_price_currency_sum, df_bid),
-        (metric_accepted_bids_option_option3_count, df_bid),
-        (metric_accepted_bids_option_option3_bid_price_currency_sum, df_bid),
-        (metric_rides_by_bid_option_other1_count, df_bid),
-        (metric_bids_option_other1_count, df_bid),
-        (metric_bids_option_other1_bid_price_currency_sum, df_bid),
-        (metric_accepted_bids_option_other1_count, df_bid),
-        (metric_accepted_bids_option_other1_bid_price_currency_sum, df_bid),
-        (metric_rides_by_bid_option_other2_count, df_bid),
-        (metric_bids_option_other2_count, df_bid),
-        (metric_bids_option_other2_bid_price_currency_sum, df_bid),
-        (metric_accepted_bids_option_other2_count, df_bid),
-        (metric_accepted_bids_option_other2_bid_price_currency_sum, df_bid),
-        (metric_rides_by_bid_option_other3_count, df_bid),
-        (metric_bids_option_other3_count, df_bid),
-        (metric_bids_option_other3_bid_price_currency_sum, df_bid),
-        (metric_accepted_bids_option_other3_count, df_bid),
-        (metric_accepted_bids_option_other3_bid_price_currency_sum, df_bid),
-        (metric_orders_with_bid_option_startprice_count, df_bid),
-        (metric_orders_with_bid_option_option1_count, df_bid),
-        (metric_orders_with_bid_option_option2_count, df_bid),
-        (metric_orders_with_bid_option_option3_count, df_bid),
-        (metric_orders_with_bid_option_other1_count, df_bid),
-        (metric_orders_with_bid_option_other2_count, df_bid),
-        (metric_orders_with_bid_option_other3_count, df_bid),
-        (metric_time_to_1st_bid_sec_sum, df_bid),
-        (metric_time_1st_bid_to_accept_sec_sum, df_bid),
-        (metric_eta_sum, df_bid),
-        (metric_eta_done_bids_sum, df_bid),
-        (metric_eta_done_orders_sum, df_bid),
-        (metric_eta_accepted_bids_sum, df_bid),
-        (metric_rta_sum, df_bid),
-        (metric_bid2start_price_ratio, df_bid),
-        (metric_bid_option_startprice2start_price_ratio, df_bid),
-        (metric_bid_option_option12start_price_ratio, df_bid),
-        (metric_bid_option_option22start_price_ratio, df_bid),
-        (metric_bid_option_option32start_price_ratio, df_bid),
+# Декларативный реестр абсолютных метрик для calculate_absolute_metrics.
+# Метрика — (источник, фильтр, колонка, агрегат, имя). Источник: 'bid' (df_bid),
+# 'recprice' (df_recprice), 'order' (df_order_with_recprice). Фильтр — None, имя
+# из METRIC_FILTERS или кортеж имён (условия через И). Колонка — имя или функция от df.
+# Агрегаты: sum, nunique, count, size и order_sum — сумма по уникальным
+# (order_uuid, группа, значение), как drop_duplicates в метриках времени.
+MetricSpec = namedtuple('MetricSpec', ['source', 'filter', 'column', 'agg', 'name'])
+
+def _bid_to_start_price(df):
+    return df['bid_price_currency'] / df['price_start_value']
+
+
+BID_METRICS = [
+    MetricSpec('bid', None, 'driver_uuid', 'nunique', 'drivers_count'),
+    MetricSpec('bid', None, 'bid_uuid', 'nunique', 'bids_count'),
+    MetricSpec('bid', None, 'is_bid_arrived', 'sum', 'bids_arrived_count'),
+    MetricSpec('bid', 'order_done', 'bid_uuid', 'nunique', 'bids_for_done_orders_count'),
+    MetricSpec('bid', None, 'bid_price_currency', 'sum', 'bids_bid_price_currency_sum'),
+    MetricSpec('bid', None, 'is_bid_accepted', 'sum', 'accepted_bids_count'),
+    MetricSpec('bid', None, 'is_bid_done', 'sum', 'done_bids_count'),
+    MetricSpec('bid', 'bid_accepted', 'bid_price_currency', 'sum', 'accepted_bids_bid_price_currency_sum'),
+    MetricSpec('bid', 'order_done', 'order_uuid', 'nunique', 'TEST_rides_count_by_bids'),
+    MetricSpec('bid', 'bid_accepted', 'bid_price_currency', 'sum', 'price_bid_accepted_currency_sum'),
+]
+for _option in BID_OPTIONS:
+    _filter = f'option_{_option}'
+    BID_METRICS += [
+        MetricSpec('bid', (_filter, 'bid_accepted', 'order_done'), 'order_uuid', 'nunique',
+                   f'rides_by_bid_option_{_option}_count'),
+        MetricSpec('bid', _filter, 'bid_uuid', 'nunique', f'bids_option_{_option}_count'),
+        MetricSpec('bid', _filter, 'bid_price_currency', 'sum', f'bids_option_{_option}_bid_price_currency_sum'),
+        MetricSpec('bid', (_filter, 'bid_accepted'), 'bid_uuid', 'nunique', f'accepted_bids_option_{_option}_count'),
+        MetricSpec('bid', (_filter, 'bid_accepted'), 'bid_price_currency', 'sum',
+                   f'accepted_bids_option_{_option}_bid_price_currency_sum'),
     ]
-    
-    # Process metrics for each DataFrame if it exists
-    dfm = metric_drivers_count(df_bid, group_cols)
-    for metric_func, df in bid_metrics:
-        if df is not None:
-            dfm = dfm.merge(metric_func(df, group_cols), on=group_cols, how='left')
-
-    for metric_func, df in recprice_metrics:
-        if df is not None:
-            dfm = dfm.merge(metric_func(df, group_cols), on=group_cols, how='left')
-            
-    for metric_func, df in order_metrics:
-        if df is not None:
-            dfm = dfm.merge(metric_func(df, group_cols), on=group_cols, how='left')
-            
+BID_METRICS += [MetricSpec('bid', f'option_{_option}', 'order_uuid', 'nunique', f'orders_with_bid_option_{_option}_count')
+                for _option in BID_OPTIONS]
+BID_METRICS += [
+    MetricSpec('bid', None, 'time_to_1st_bid_sec', 'order_sum', 'time_to_1st_bid_sec_sum'),
+    MetricSpec('bid', None, 'time_1st_bid_to_accept_sec', 'order_sum', 'time_1st_bid_to_accept_sec_sum'),
+    MetricSpec('bid', None, 'eta', 'sum', 'eta_sum'),
+    MetricSpec('bid', ('bid_accepted', 'order_done'), 'eta', 'sum', 'eta_done_bids_sum'),
+    MetricSpec('bid', 'order_done', 'eta', 'sum', 'eta_done_orders_sum'),
+    MetricSpec('bid', 'bid_accepted', 'eta', 'sum', 'eta_accepted_bids_sum'),
+    MetricSpec('bid', 'bid_arrived', 'rta', 'sum', 'rta_sum'),
+    MetricSpec('bid', None, _bid_to_start_price, 'sum', 'bid2start_price_ratio_sum'),
+]
+BID_METRICS += [MetricSpec('bid', f'option_{_option}', _bid_to_start_price, 'sum',
+                           f'bid_option_{_option}2start_price_ratio_sum')
+                for _option in ('startprice', 'option1', 'option2', 'option3')]
+
+RECPRICE_METRICS = [
+    MetricSpec('recprice', None, 'calcprice_uuid', 'nunique', 'calcprices_count'),
+    MetricSpec('recprice', None, 'price_base_usd', 'sum', 'price_base_usd_sum'),
+    MetricSpec('recprice', None, 'recprice_usd', 'sum', 'recprice_usd_sum'),
+    MetricSpec('recprice', None, 'minprice_usd', 'sum', 'minprice_usd_sum'),
+    MetricSpec('recprice', None, 'surge', 'sum', 'surge_sum'),
+    MetricSpec('recprice', 'surge_gr_1', 'surge', 'sum', 'surge_gr_1_sum'),
+    MetricSpec('recprice', 'surge_gr_1', 'calcprice_uuid', 'nunique', 'surge_gr_1_calcprices_count'),
+    MetricSpec('recprice', 'surge_le_1', 'surge', 'sum', 'surge_le_1_sum'),
+    MetricSpec('recprice', 'surge_le_1', 'calcprice_uuid', 'nunique', 'surge_le_1_calcprices_count'),
+]
+
+ORDER_METRICS = [
+    MetricSpec('order', None, 'order_uuid', 'nunique', 'orders_count'),
+    MetricSpec('order', 'order_without_tender', None, 'size', 'orders_without_bids_count'),
+    MetricSpec('order', None, 'tenders_count', 'sum', 'tenders_count'),
+    MetricSpec('order', None, 'is_order_with_tender', 'sum', 'orders_with_bids_count'),
+    MetricSpec('order', ('order_with_tender', 'order_accepted'), 'is_order_accepted', 'sum',
+               'orders_with_accepted_bid_count'),
+    MetricSpec('order', ('order_with_tender', 'order_not_accepted'), 'is_order_accepted', 'count',
+               'orders_without_accepted_bid_count'),
+    MetricSpec('order', ('order_with_tender', 'order_accepted', 'order_arrived'), 'is_order_arrived', 'sum',
+               'orders_with_arivals_count'),
+    MetricSpec('order', None, 'is_order_start_price_bid', 'sum', 'start_price_bid_orders_count'),
+    MetricSpec('order', None, 'is_order_accepted_start_price_bid', 'sum', 'start_price_bid_accepted_orders_count'),
+    MetricSpec('order', None, 'is_order_done_start_price_bid', 'sum', 'start_price_bid_rides_count'),
+    MetricSpec('order', None, 'is_order_accepted', 'sum', 'accepted_orders_count'),
+    MetricSpec('order', None, 'is_order_done', 'sum', 'rides_count'),
+    MetricSpec('order', None, 'price_start_usd', 'sum', 'price_start_usd_sum'),
+    MetricSpec('order', None, 'rides_price_start_usd', 'sum', 'rides_price_start_usd_sum'),
+    MetricSpec('order', 'order_without_tender', 'price_start_usd', 'sum', 'orders_without_bids_price_start_usd_sum'),
+    MetricSpec('order', None, 'price_highrate_usd', 'sum', 'price_highrate_usd_sum'),
+    MetricSpec('order', None, 'rides_price_highrate_usd', 'sum', 'rides_price_highrate_usd_sum'),
+    MetricSpec('order', 'order_without_tender', 'price_highrate_usd', 'sum',
+               'orders_without_bids_price_highrate_usd_sum'),
+    MetricSpec('order', None, 'price_tender_usd', 'sum', 'price_tender_usd_sum'),
+    MetricSpec('order', None, 'price_done_usd', 'sum', 'price_done_usd_sum'),
+    MetricSpec('order', 'order_accepted', 'price_tender_usd', 'sum', 'price_tender_accepted_usd_sum'),
+    MetricSpec('order', None, 'is_order_good', 'sum', 'good_orders_count'),
+    MetricSpec('order', 'by_minprice', 'order_uuid', 'nunique', 'orders_by_minprice_count'),
+    MetricSpec('order', ('by_minprice', 'order_with_tender'), 'order_uuid', 'nunique',
+               'orders_by_minprice_with_bids_count'),
+    MetricSpec('order', ('by_minprice', 'order_accepted'), 'order_uuid', 'nunique', 'accepted_orders_by_minprice_count'),
+    MetricSpec('order', ('by_minprice', 'order_done'), 'order_uuid', 'nunique', 'rides_by_minprice_count'),
+]
+for _suffix, _filters in (('orders_count', ()),
+                          ('orders_with_bids_count', ('order_with_tender',)),
+                          ('start_price_bid_orders_count', ('order_start_price_bid',)),
+                          ('accepted_orders_count', ('order_accepted',)),
+                          ('rides_count', ('order_done',))):
+    ORDER_METRICS += [MetricSpec('order', (_surge,) + _filters, 'order_uuid', 'nunique', f'{_surge}_{_suffix}')
+                      for _surge in ('surge_gr_1', 'surge_le_1')]
+ORDER_METRICS += [
+    MetricSpec('order', 'order_done', 'rta', 'sum', 'rta_sum_orders'),
+    MetricSpec('order', 'order_done', 'rtr', 'sum', 'rtr_sum'),
+    MetricSpec('order', None, 'etr', 'sum', 'etr_sum'),
+    MetricSpec('order', 'order_with_tender', 'etr', 'sum', 'etr_orders_with_bids_sum'),
+    MetricSpec('order', ('order_with_tender', 'order_accepted'), 'etr', 'sum', 'etr_orders_with_accepted_bids_sum'),
+    MetricSpec('order', ('order_with_tender', 'order_not_accepted'), 'etr', 'sum',
+               'etr_orders_without_accepted_bids_sum'),
+    MetricSpec('order', 'order_done', 'etr', 'sum', 'etr_done_orders_sum'),
+    MetricSpec('order', 'order_without_tender', 'etr', 'sum', 'etr_orders_without_bids_sum'),
+]
+
+METRIC_REGISTRY = BID_METRICS + RECPRICE_METRICS + ORDER_METRICS
+
+
+def _distinct_per_group(sorted_codes, mask, n_groups):
+    """nunique по группам среди строк mask; sorted_codes — (порядок, группы, значения) после сортировки."""
+    order, groups, value_codes = sorted_codes
+    selected = np.flatnonzero(mask[order] & (value_codes >= 0))
+    groups, value_codes = groups[selected], value_codes[selected]
+    new = np.ones(len(selected), dtype=bool)
+    new[1:] = (groups[1:] != groups[:-1]) | (value_codes[1:] != value_codes[:-1])
+    return np.bincount(groups[new], minlength=n_groups)
+
+
+def compute_source_metrics(df, specs, group_cols, masks=None):
+    """
+    Все метрики одного источника за один groupby: коды групп считаются один раз,
+    каждая метрика — bincount по маске своего фильтра (masks — MaskCache df).
+    Группа без строк под фильтром получает NaN, как left merge отдельной метрики.
+    """
+    grouped = df.groupby(group_cols, observed=True)
+    keys = grouped.size().index.to_frame(index=False)
+    n_groups = len(keys)
+    # Строки с NULL в ключах (dropna) не попадают ни в одну группу
+    codes = grouped.ngroup().to_numpy(dtype=np.float64, na_value=np.nan)
+    in_group = codes >= 0
+    codes = np.where(in_group, codes, 0).astype(np.int64)
+    if masks is None:
+        masks = MaskCache(df)
+    prepared = {}
+
+    def prepare(column, agg):
+        """Колонка в виде, нужном агрегату; считается один раз на (колонка, агрегат)."""
+        key = (column, agg)
+        if key not in prepared:
+            series = column(df) if callable(column) else df[column]
+            if agg == 'nunique':
+                value_codes, _ = pd.factorize(series)
+                order = np.lexsort((value_codes, codes))
+                prepared[key] = order, codes[order], value_codes[order]
+            elif agg == 'count':
+                prepared[key] = series.notna().to_numpy()
+            else:
+                values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+                integral = pd.api.types.is_bool_dtype(series) or pd.api.types.is_integer_dtype(series)
+                prepared[key] = np.where(np.isnan(values), 0.0, values), integral
+        return prepared[key]
+
+    columns = {}
+    for spec in specs:
+        mask = masks(spec.filter) & in_group
+        if spec.agg == 'order_sum':
+            mask = mask & ~df.duplicated(subset=['order_uuid'] + list(group_cols) + [spec.column]).to_numpy()
+        selected = codes[mask]
+        rows = np.bincount(selected, minlength=n_groups)
+        integral = True
+
+        if spec.agg == 'size':
+            result = rows
+        elif spec.agg == 'nunique':
+            result = _distinct_per_group(prepare(spec.column, 'nunique'), mask, n_groups)
+        elif spec.agg == 'count':
+            result = np.bincount(codes[mask & prepare(spec.column, 'count')], minlength=n_groups)
+        elif spec.agg in ('sum', 'order_sum'):
+            values, integral = prepare(spec.column, 'sum')
+            result = np.bincount(selected, weights=values[mask], minlength=n_groups)
+        else:
+            raise ValueError(f'Unknown aggregation: {spec.agg}')
+
+        empty = rows == 0
+        if integral and not empty.any():
+            columns[spec.name] = np.round(result).astype(np.int64)
+        else:
+            columns[spec.name] = np.where(empty, np.nan, result)
+
+    return pd.concat([keys, pd.DataFrame(columns)], axis=1)
+
+
+def calculate_absolute_metrics(df_recprice=None, df_order_with_recprice=None, df_bid=None, group_cols=None,
+                               registry=METRIC_REGISTRY):
+    """
+    Абсолютные метрики реестра registry по группам group_cols: один groupby на источник
+    и один merge источника на группы df_bid.
+    """
+    sources = {'bid': df_bid, 'recprice': df_recprice, 'order': df_order_with_recprice}
+    by_source = {}
+    for spec in registry:
+        by_source.setdefault(spec.source, []).append(spec)
+
+    # Маски — на этот вызов: изменения колонок между прогонами не видны старому кэшу
+    dfm = compute_source_metrics(df_bid, by_source.pop('bid', []), group_cols, MaskCache(df_bid))
+    for source, specs in by_source.items():
+        if sources[source] is not None:
+            masks = MaskCache(sources[source])
+            dfm = dfm.merge(compute_source_metrics(sources[source], specs, group_cols, masks), on=group_cols, how='left')
     return dfm
 
 
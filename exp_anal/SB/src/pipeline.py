@@ -1,4 +1,6 @@
 import numpy as np
+import pandas as pd
+from scipy.stats import t as student_t
 from scipy.stats import ttest_ind
 from statsmodels.stats.power import TTestIndPower
 
@@ -149,4 +151,141 @@ class RatioMetricHypothesisTestingPipeline:
             print(f"Error calculating obs needed: {e}")
             print(f"Calculating obs needed for metric: {self.metric}")
             print(f"Effect size: {self.result['effect_size']}")
-            self.result["obs_needed"] = None
\ No newline at end of file
+            self.result["obs_needed"] = None
+
+class BatchRatioMetricHypothesisTesting:
+    """
+    RatioMetricHypothesisTestingPipeline для всего списка метрик за один проход.
+    Строки делятся по group_name один раз; числители и знаменатели — матрицы
+    (строки × метрики), линеаризация, t-тест, Cohen's d и мощность считаются по столбцам.
+    Результат — self.result (DataFrame, строка на метрику, колонки как у pipeline.result),
+    метрики, которые посчитать не удалось, — в self.errors {metric: exception}.
+    """
+
+    def __init__(self, data, metric_list, groups):
+        self.control = groups["control"]
+        self.treatment = groups["treatment"]
+        self.errors = {}
+        self.metrics = []
+        for metric, numerator, denominator in metric_list:
+            missing = [column for column in (numerator, denominator) if column not in data.columns]
+            if missing:
+                self.errors[metric] = KeyError(f"{missing} not in index")
+            else:
+                self.metrics.append((metric, numerator, denominator))
+        self.data = data
+        self.result = pd.DataFrame()
+
+    def run(self):
+        self.split_groups()
+        if self.metrics:
+            self.calc_values()
+            self.linearize_data()
+            self.calc_pvalue()
+            self.calc_effect_size()
+            self.calc_power()
+            self.calc_obs_needed()
+            self.collect_result()
+
+    def split_groups(self):
+        """Матрицы числителей / знаменателей контроля и эксперимента (NaN -> 0)."""
+        columns = list(dict.fromkeys(column for _, num, den in self.metrics for column in (num, den)))
+        position = {column: i for i, column in enumerate(columns)}
+        self.num_index = np.array([position[num] for _, num, _ in self.metrics], dtype=np.int64)
+        self.den_index = np.array([position[den] for _, _, den in self.metrics], dtype=np.int64)
+
+        values = self.data[columns].to_numpy(dtype=np.float64, na_value=np.nan)
+        values[np.isnan(values)] = 0
+        group = self.data["group_name"]
+        self.values = {}
+        for name, value in (("control", self.control), ("treatment", self.treatment)):
+            rows = (group == value).to_numpy(dtype=bool, na_value=False)
+            if not rows.any():
+                # Как value_counts()[group] в pipeline: без строк группы не считается ни одна метрика
+                for metric, _, _ in self.metrics:
+                    self.errors[metric] = KeyError(value)
+                self.metrics = []
+                return
+            self.values[name] = values[rows]
+        self.n_obs_control = len(self.values["control"])
+        self.n_obs_experimental = len(self.values["treatment"])
+
+    def calc_values(self):
+        sums = {name: part.sum(axis=0) for name, part in self.values.items()}
+        numerators = {name: s[self.num_index] for name, s in sums.items()}
+        denominators = {name: s[self.den_index] for name, s in sums.items()}
+        # check_zero_denominator: у таких метрик остаются только n_obs
+        self.skip = (denominators["control"] == 0) | (denominators["treatment"] == 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.control_value = numerators["control"] / denominators["control"]
+            self.experimental_value = numerators["treatment"] / denominators["treatment"]
+            self.uplift_abs = self.experimental_value - self.control_value
+            self.uplift_rel = self.uplift_abs / self.control_value
+
+    def linearize_data(self):
+        """linearized = numerator - k * denominator, k — значение метрики в контроле."""
+        k = np.where(self.skip, 0, self.control_value)
+        self.linearized = {
+            name: part[:, self.num_index] - k * part[:, self.den_index]
+            for name, part in self.values.items()
+        }
+
+    def calc_pvalue(self):
+        """T-test for the means of two independent samples (ttest_ind, equal_var=True)"""
+        control_lin, experimental_lin = self.linearized["control"], self.linearized["treatment"]
+        n1, n2 = self.n_obs_control, self.n_obs_experimental
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.mean_control, self.mean_experimental = control_lin.mean(axis=0), experimental_lin.mean(axis=0)
+            s1, s2 = np.var(control_lin, axis=0, ddof=1), np.var(experimental_lin, axis=0, ddof=1)
+            self.pooled_var = ((n1 - 1) * s1 + (n2 - 1) * s2) / (n1 + n2 - 2)
+            statistic = (self.mean_control - self.mean_experimental) / np.sqrt(self.pooled_var * (1 / n1 + 1 / n2))
+        self.pvalue = 2 * student_t.sf(np.abs(statistic), n1 + n2 - 2)
+
+    def calc_effect_size(self):
+        """Cohen's d"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.effect_size = (self.mean_experimental - self.mean_control) / np.sqrt(self.pooled_var)
+
+    def calc_power(self):
+        # solve_power с power=None сводится к TTestIndPower.power — он принимает массивы
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.power = TTestIndPower().power(
+                effect_size=self.effect_size,
+                nobs1=self.n_obs_control,
+                alpha=0.05,
+                ratio=self.n_obs_experimental / self.n_obs_control,
+            )
+
+    def calc_obs_needed(self):
+        # Подбор корня — по метрике; для NaN effect size решатель всё равно вернёт NaN
+        power_analysis = TTestIndPower()
+        self.obs_needed = np.full(len(self.metrics), np.nan)
+        for i, (metric, _, _) in enumerate(self.metrics):
+            if self.skip[i] or np.isnan(self.effect_size[i]):
+                continue
+            try:
+                self.obs_needed[i] = 2 * power_analysis.solve_power(
+                    effect_size=self.effect_size[i], power=0.8, alpha=0.05
+                )
+            except Exception as e:
+                print(f"Error calculating obs needed: {e}")
+                print(f"Calculating obs needed for metric: {metric}")
+                print(f"Effect size: {self.effect_size[i]}")
+
+    def collect_result(self):
+        def masked(values):
+            return np.where(self.skip, np.nan, values)
+
+        self.result = pd.DataFrame({
+            "metric": [metric for metric, _, _ in self.metrics],
+            "control_value": masked(self.control_value),
+            "experimental_value": masked(self.experimental_value),
+            "uplift_abs": masked(self.uplift_abs),
+            "uplift_rel": masked(self.uplift_rel),
+            "pvalue": masked(self.pvalue),
+            "effect_size": masked(self.effect_size),
+            "n_obs_control": self.n_obs_control,
+            "n_obs_experimental": self.n_obs_experimental,
+            "power": masked(self.power),
+            "obs_needed": masked(self.obs_needed),
+        })
\ No newline at end of file
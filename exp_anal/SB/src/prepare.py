@@ -4,6 +4,8 @@ warnings.filterwarnings("ignore")
 import h3
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 
 
 def get_hex(df, hex_size):
@@ -26,6 +28,17 @@ def get_ts(df, date_column_name, by_time_resolution):
     return df
 
 
+# Низкокардинальные строковые колонки: хранятся как категории, сравнения идут по кодам
+CATEGORICAL_COLUMNS = ['option_number', 'group_name', 'order_type', 'city_id', 'hex_from_calc_7']
+
+
+def to_categorical(df, columns=CATEGORICAL_COLUMNS):
+    for column in columns:
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('category')
+    return df
+
+
 def prepare_recprice_data(df):
     df['group_name'] = df['recprice_group_name']
 #     df = df[
@@ -82,6 +95,7 @@ def prepare_order_data(df):
     df = get_ts(df, date_column_name='local_order_dttm', by_time_resolution='30min')
     df['time'] = df['ts'].dt.time 
     df = get_hex(df, hex_size=7)
+    df = to_categorical(df)
     df.reset_index(drop=True, inplace=True)
     return df
 
@@ -116,19 +130,15 @@ def prepare_bid_data(df, t_param):
     print(f"Dropped rows: {dropped_count} ({dropped_count/original_count:.2%})")
     print(f"Remaining rows: {len(df)}")
     
-    # Add new columns
-    df['price_diff'] = df.apply(
-        lambda row: (max(row['available_prices_currency']) - row['price_start_value']) / row['price_start_value']  
-        if isinstance(row['available_prices_currency'], (list, np.ndarray)) and len(row['available_prices_currency']) > 0
-        else 0, 
-        axis=1
-    )
-    df['unique_available_prices'] = df.apply(
-        lambda row: len(row['available_prices_currency'])
-        if isinstance(row['available_prices_currency'], (list, np.ndarray)) and len(row['available_prices_currency']) > 0
-        else 0, 
-        axis=1
-    )
+    # Add new columns: цены бида упакованы один раз, дальше — редукции по строкам
+    df['available_prices_currency'] = to_price_list(df['available_prices_currency'])
+    values, offsets, _ = pack_prices(df['available_prices_currency'])
+    lengths = np.diff(offsets)
+    price_start = df['price_start_value'].to_numpy(dtype=np.float64, na_value=np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        price_diff = (segment_max(values, offsets) - price_start) / price_start
+    df['price_diff'] = np.where(lengths > 0, price_diff, 0)
+    df['unique_available_prices'] = lengths
 
     # Группируем по order_uuid и находим min_utc_bid_dttm
     min_times = df.groupby('order_uuid', as_index=False)['utc_bid_dttm'].min()
@@ -166,6 +176,7 @@ def prepare_bid_data(df, t_param):
     df = get_ts(df, date_column_name='local_order_dttm', by_time_resolution='30min')
     df['time'] = df['ts'].dt.time 
     df = get_hex(df, hex_size=7)
+    df = to_categorical(df)
     df.reset_index(drop=True, inplace=True)
     return df
 
@@ -240,14 +251,67 @@ def determine_bid_algorithm(row, t: float, alpha: float,
         return 'algo assignment error'
 
 
-def add_algo_name_new(df: pd.DataFrame, t: float, alpha: float) -> pd.DataFrame:
+PRICE_LIST_DTYPE = pd.ArrowDtype(pa.list_(pa.float64()))
+
+
+def _is_price_list(prices):
+    return isinstance(prices.dtype, pd.ArrowDtype) and pa.types.is_list(prices.dtype.pyarrow_dtype)
+
+
+def to_price_list(prices):
+    """
+    Колонку списков цен — в упакованный Arrow ListArray (одни values + offsets на всю колонку)
+    вместо отдельного массива numpy на каждый бид. Не-списки (None / NaN) становятся null,
+    NaN внутри списков сохраняются.
+    """
+    if _is_price_list(prices):
+        return prices
+    items = prices.to_numpy(dtype=object).copy()
+    valid = np.fromiter((isinstance(x, (list, tuple, np.ndarray)) for x in items), dtype=bool, count=len(items))
+    items[~valid] = None
+    array = pa.array(items, type=PRICE_LIST_DTYPE.pyarrow_dtype)
+    return pd.Series(pd.arrays.ArrowExtensionArray(array), index=prices.index, name=prices.name)
+
+
+def pack_prices(prices):
+    """
+    Колонку списков цен (available_prices_currency) — в плоский массив.
+    Возвращает (values, offsets, valid): цены строки i — values[offsets[i]:offsets[i + 1]],
+    valid — в строке список / массив (а не None / NaN).
+    """
+    array = pa.array(to_price_list(prices))
+    lengths = pc.list_value_length(array).fill_null(0).to_numpy().astype(np.int64)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    values = pc.list_flatten(array).to_numpy(zero_copy_only=False).astype(np.float64)
+    valid = array.is_valid().to_numpy(zero_copy_only=False)
+    return values, offsets, valid
+
+
+def segment_max(values, offsets):
+    """
+    max() по строкам с семантикой встроенного max: NaN первым элементом даёт NaN,
+    NaN дальше по списку пропускается. Пустые строки — NaN.
+    """
+    lengths = np.diff(offsets)
+    result = np.full(len(lengths), np.nan)
+    nonempty = lengths > 0
+    if nonempty.any():
+        starts = offsets[:-1][nonempty]
+        result[nonempty] = np.where(np.isnan(values[starts]), np.nan, np.fmax.reduceat(values, starts))
+    return result
+
+
+def add_algo_name_new(df: pd.DataFrame, t: float, alpha: float,
+                      groups={"control":"Control", "treatment":"A"},
+                      coefficients_to_restore: list = [0.1, 0.2, 0.3]) -> pd.DataFrame:
     """
-    Добавляет колонку 'algo_name_new' в датафрейм на основе определения алгоритма ставок.
+    Добавляет колонки 'eta_clipped', 'max_bid' и 'algo_name_new' — то же, что
+    determine_bid_algorithm, но сразу для всех строк.
     
     Parameters:
     -----------
     df : pandas.DataFrame
-        Датафрейм с необходимыми полями
+        Датафрейм с необходимыми полями (см. determine_bid_algorithm)
     t : float
         Минимальное значение для eta
     alpha : float
@@ -256,9 +320,44 @@ def add_algo_name_new(df: pd.DataFrame, t: float, alpha: float) -> pd.DataFrame:
     Returns:
     --------
     pandas.DataFrame
-        Датафрейм с добавленной колонкой 'algo_name_new'
+        Датафрейм с колонками:
+        - eta_clipped: max(eta, t)
+        - max_bid: int((1 + alpha) * max_price * (duration + eta) / (duration + t)), <NA> при ошибке
+        - algo_name_new: 'algo_default', 'algo_bidmph' или 'algo assignment error'
     """
-    df['algo_name_new'] = df.apply(lambda row: determine_bid_algorithm(row, t, alpha)[0], axis=1)
-    df['tmp'] = df.apply(lambda row: determine_bid_algorithm(row, t, alpha)[1], axis=1)
-    return df
+    eta = df['eta'].to_numpy(dtype=np.float64, na_value=np.nan)
+    # Шаг 0: max(eta, t) — NaN остаётся NaN, как у встроенного max
+    eta = np.where(t > eta, t, eta)
+    duration_seconds = df['duration_in_min'].to_numpy(dtype=np.float64, na_value=np.nan) * 60
+
+    # Шаг 1: max_bid
+    max_price = np.fmax(df['price_highrate_value'].to_numpy(dtype=np.float64, na_value=np.nan),
+                        df['price_start_value'].to_numpy(dtype=np.float64, na_value=np.nan))
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        max_bid = (1 + alpha) * max_price * (duration_seconds + eta) / (duration_seconds + t)
+    max_bid_ok = np.isfinite(max_bid)
+    max_bid = np.trunc(np.where(max_bid_ok, max_bid, 0))
 
+    # Шаг 2: максимум доступных цен; у treatment — старт. цена, умноженная на коэффициенты
+    values, offsets, prices_ok = pack_prices(df['available_prices_currency'])
+    max_available = segment_max(values, offsets)
+    prices_ok &= np.diff(offsets) > 0
+    treatment = (df['group_name'] == groups['treatment']).to_numpy(dtype=bool, na_value=False)
+    if treatment.any():
+        start_price = df['price_start_value'].to_numpy(dtype=np.float64, na_value=np.nan)[treatment]
+        restored = start_price[:, None] * (1 + np.array(coefficients_to_restore, dtype=np.float64))[None, :]
+        if restored.shape[1] > 0:
+            max_available[treatment] = np.where(np.isnan(restored[:, 0]), np.nan, np.fmax.reduce(restored, axis=1))
+        prices_ok[treatment] = restored.shape[1] > 0
+
+    # Шаг 3: решение
+    ok = max_bid_ok & prices_ok
+    algo_name = np.where(max_available <= max_bid, 'algo_default', 'algo_bidmph')
+    algo_name = np.where(ok, algo_name, 'algo assignment error')
+    if not max_bid_ok.all():
+        print(f"maxBid compute error: {(~max_bid_ok).sum()} rows")
+
+    df['eta_clipped'] = eta
+    df['max_bid'] = pd.arrays.IntegerArray(max_bid.astype(np.int64), ~max_bid_ok)
+    df['algo_name_new'] = pd.Categorical(algo_name)
+    return df
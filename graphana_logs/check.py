@@ -1,7 +1,61 @@
 import json
 import pandas as pd
 import numpy as np
-import math
+
+def _round_up(prices, round_value):
+    """
+    Округление вверх до round_value в целых минорных единицах, как sanitizeBidPriceSteps в Go
+    (остаток со знаком делимого, при round_value <= 0 округления нет)
+    """
+    prices = np.asarray(prices, dtype=np.int64)
+    if round_value <= 0:
+        return prices
+    mod = np.fmod(prices, round_value)
+    return prices + np.where(mod != 0, round_value - mod, 0)
+
+
+def _go_div(a, b):
+    """Целочисленное деление Go: усечение к нулю"""
+    q = abs(a) // abs(b)
+    return -q if (a < 0) != (b < 0) else q
+
+
+def to_currency(prices, multiplier=100):
+    """Перевод минорных единиц в валюту — только на выходе"""
+    return [price / multiplier for price in prices]
+
+
+def compute_available_prices_minor(start_price, bidding_steps, round_value):
+    """
+    Доступные цены дефолтного алгоритма в минорных единицах (int64, как в Go)
+    Args:
+        start_price: начальная цена в минорных единицах
+        bidding_steps: массив процентов [15, 25, 40]
+        round_value: значение для округления в минорных единицах
+    Returns:
+        list: уникальные цены в минорных единицах
+    """
+    steps = np.asarray(bidding_steps, dtype=np.float64)
+    # int64(float64(StartPrice) * (1 + float64(step)*0.01)) — усечение к нулю
+    prices = (float(start_price) * (1 + steps * 0.01)).astype(np.int64)
+    return list(dict.fromkeys(_round_up(prices, round_value).tolist()))
+
+
+def compute_new_prices_minor(start_price, max_bid, bidding_steps_count, round_value):
+    """
+    Цены алгоритма bid_mph в минорных единицах (int64, как в Go)
+    Args:
+        start_price: начальная цена в минорных единицах
+        max_bid: максимальная ставка (усекается до целого, как int64(maxBid))
+        bidding_steps_count: количество шагов
+        round_value: значение для округления в минорных единицах
+    Returns:
+        list: уникальные цены в минорных единицах
+    """
+    step = _go_div(int(max_bid) - int(start_price), bidding_steps_count)
+    prices = [int(start_price) + n * step for n in range(1, bidding_steps_count + 1)]
+    return list(dict.fromkeys(_round_up(prices, round_value).tolist()))
+
 
 def compute_available_prices(start_price, bidding_steps, round_value, multiplier=100):
     """
@@ -14,10 +68,7 @@ def compute_available_prices(start_price, bidding_steps, round_value, multiplier
     Returns:
         list: массив доступных цен
     """
-    prices = [start_price * (1 + step/100) for step in bidding_steps]
-    # Округляем вверх до round_value и делим на multiplier
-    rounded_prices =  [math.ceil(price / round_value) * round_value / multiplier for price in prices]
-    return list(dict.fromkeys(rounded_prices))  # Сохраняем порядок и убираем дубликаты
+    return to_currency(compute_available_prices_minor(start_price, bidding_steps, round_value), multiplier)
 
 def compute_new_prices(start_price, max_bid, bidding_steps_count, round_value, multiplier=100):
     """
@@ -31,11 +82,7 @@ def compute_new_prices(start_price, max_bid, bidding_steps_count, round_value, m
     Returns:
         list: массив уникальных новых цен
     """
-    step = (max_bid - start_price) / bidding_steps_count
-    prices = [start_price + n * step for n in range(1, bidding_steps_count + 1)]
-    # Округляем вверх до round_value, делим на multiplier и оставляем только уникальные значения
-    rounded_prices = [math.ceil(price / round_value) * round_value / multiplier for price in prices]
-    return list(dict.fromkeys(rounded_prices))  # Сохраняем порядок и убираем дубликаты
+    return to_currency(compute_new_prices_minor(start_price, max_bid, bidding_steps_count, round_value), multiplier)
 
 def compute_new_prices_no_round(start_price, max_bid, bidding_steps_count, multiplier=100):
     """
@@ -77,8 +124,8 @@ def parse_logs(file_path):
             # Получаем multiplier из currency
             multiplier = log_dict['available_prices'][0]['currency']['multiplier']
             
-            # Извлекаем available_prices из JSON
-            available_prices = [price['value'] / multiplier for price in log_dict['available_prices']]
+            # Извлекаем available_prices из JSON (в минорных единицах, в валюту — на выходе)
+            available_prices_minor = [price['value'] for price in log_dict['available_prices']]
             
             # Создаем запись для DataFrame
             record = {
@@ -94,18 +141,19 @@ def parse_logs(file_path):
                 'round_value': params['RoundValue'],
                 'max_bidding_price': params['MaxBiddingPrice'],
                 'multiplier': multiplier,
-                'available_prices': available_prices,
+                'available_prices_minor': available_prices_minor,
+                'available_prices': to_currency(available_prices_minor, multiplier),
                 'span_id': log_dict['span_id'],
                 'trace_id': log_dict['trace_id'],
             }
             
             # Вычисляем default_prices с округлением
-            record['default_prices'] = compute_available_prices(
+            record['default_prices_minor'] = compute_available_prices_minor(
                 record['start_price'],
                 record['bidding_steps'],
-                record['round_value'],
-                multiplier
+                record['round_value']
             )
+            record['default_prices'] = to_currency(record['default_prices_minor'], multiplier)
             
             # Вычисляем max_bid
             max_bid = calculate_max_bid(
@@ -116,13 +164,13 @@ def parse_logs(file_path):
             )
             
             # Вычисляем exp_prices с округлением
-            record['exp_prices'] = compute_new_prices(
+            record['exp_prices_minor'] = compute_new_prices_minor(
                 record['start_price'],
                 max_bid,
                 len(record['bidding_steps']),
-                record['round_value'],
-                multiplier
+                record['round_value']
             )
+            record['exp_prices'] = to_currency(record['exp_prices_minor'], multiplier)
             
             # Вычисляем exp_prices без округления
             record['exp_prices_no_round'] = compute_new_prices_no_round(
@@ -0,0 +1,368 @@
+"""
+Бенчмарки всех реализаций шагов торга / MaxBid на одинаковых синтетических заказах.
+
+Каждая пара (реализация, размер) запускается в отдельном процессе, чтобы
+пиковый RSS (ru_maxrss) относился только к ней. Построчные реализации
+замеряются на подвыборке (--scalar-cap строк) — rows/s от этого не зависит,
+а 10M строк через DataFrame.apply заняли бы часы.
+
+Пример:
+    python benchmarks.py --sizes 1000,100000 --save-baseline baseline.json
+    python benchmarks.py --baseline baseline.json --max-regression 0.2
+"""
+import argparse
+import importlib.util
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from bidmph_delta import compute_steps, compute_steps_batch
+from bidmph_noexposure_delta import process_steps, process_steps_batch
+from bidsteps import AlgBidMph, Params, calc_max_bid
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIZES = (1_000, 100_000, 10_000_000)
+BATCH_CHUNK = 1_000_000
+
+
+def make_workload(n_rows: int, width: int = 3, seed: int = 42):
+    """
+    Синтетические заказы: дефолтные шаги start_price * (1 + [0.1, 0.2, ...]),
+    MaxBid вокруг последнего шага, чтобы примерно половина заказов пересчитывалась.
+    """
+    rng = np.random.default_rng(seed)
+    start_price = rng.integers(100, 5_000, n_rows)
+    coefficients = 1 + 0.1 * np.arange(1, width + 1)
+    default_steps = (start_price[:, None] * coefficients[None, :]).astype(np.int64)
+    lengths = rng.integers(1, width + 1, n_rows)
+    MaxBid = (start_price * rng.uniform(0.9, 1.5, n_rows)).astype(np.int64)
+    delta = rng.choice([0.0, 10.0, 50.0, 200.0], n_rows)
+    return default_steps, lengths, MaxBid, delta
+
+
+def make_orders(n_rows: int, seed: int = 42) -> dict:
+    """Заказы в терминах Go Params (минорные единицы, секунды) — общий вход для всех реализаций."""
+    rng = np.random.default_rng(seed)
+    start_price = rng.integers(1_000, 50_000, n_rows) * 100
+    return {
+        "start_price": start_price,
+        "recprice": (start_price * rng.uniform(0.8, 1.3, n_rows)).astype(np.int64),
+        "duration": rng.integers(120, 3_600, n_rows),
+        "eta": rng.integers(0, 900, n_rows),
+        "distance": rng.integers(500, 30_000, n_rows),
+        "round_value": np.full(n_rows, 100),
+        "steps": np.array([10, 20, 30]),
+    }
+
+
+def _load(relative_path: str, name: str):
+    """Импорт модуля из другой папки репозитория (скрипты не оформлены пакетами)."""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(REPO_ROOT, relative_path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# ── Реализации ────────────────────────────────────────────────────────────────
+# setup(orders) -> функция без аргументов, обрабатывающая все заказы.
+def _setup_compute_steps(orders):
+    default_steps, lengths, MaxBid, delta = make_workload(len(orders["start_price"]))
+    frame = pd.DataFrame({
+        "default_steps": [row[:k] for row, k in zip(default_steps.tolist(), lengths)],
+        "MaxBid": MaxBid,
+        "delta": delta,
+    })
+    return lambda: frame.apply(
+        lambda row: compute_steps(row["default_steps"], row["MaxBid"], row["delta"]), axis=1
+    )
+
+
+def _setup_compute_steps_batch(orders):
+    default_steps, lengths, MaxBid, delta = make_workload(len(orders["start_price"]))
+
+    def run():
+        for lo in range(0, len(lengths), BATCH_CHUNK):
+            hi = lo + BATCH_CHUNK
+            compute_steps_batch(default_steps[lo:hi], lengths[lo:hi], MaxBid[lo:hi], delta[lo:hi])
+    return run
+
+
+def _setup_process_steps(orders):
+    default_steps, lengths, MaxBid, delta = make_workload(len(orders["start_price"]))
+    rows = [row[:k] for row, k in zip(default_steps.tolist(), lengths)]
+    MaxBid, delta = MaxBid.tolist(), delta.tolist()
+    return lambda: [process_steps(*row) for row in zip(rows, MaxBid, delta)]
+
+
+def _setup_process_steps_batch(orders):
+    default_steps, lengths, MaxBid, delta = make_workload(len(orders["start_price"]))
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    values = default_steps[np.arange(default_steps.shape[1])[None, :] < lengths[:, None]]
+
+    def run():
+        for lo in range(0, len(lengths), BATCH_CHUNK):
+            hi = min(lo + BATCH_CHUNK, len(lengths))
+            process_steps_batch(
+                values[offsets[lo]:offsets[hi]], offsets[lo:hi + 1] - offsets[lo], MaxBid[lo:hi], delta[lo:hi]
+            )
+    return run
+
+
+def _setup_calculate_bid_buttons(orders):
+    module = _load("other/no_badbids_bidding_steps.py", "no_badbids_bidding_steps")
+    columns = [orders[c].tolist() for c in ("recprice", "start_price", "distance", "eta")]
+    steps = orders["steps"] / 100
+    return lambda: [
+        module.process_order(rec, start, dist, eta, 0.0, 0.0, len(steps), steps.max())
+        for rec, start, dist, eta in zip(*columns)
+    ]
+
+
+def _setup_compute_new_prices(orders):
+    module = _load("graphana_logs/check.py", "check")
+    columns = [orders[c].tolist() for c in ("recprice", "start_price", "duration", "eta", "round_value")]
+    count = len(orders["steps"])
+
+    def run():
+        for rec, start, duration, eta, round_value in zip(*columns):
+            max_bid = module.calculate_max_bid(rec, start, duration, eta)
+            module.compute_new_prices(start, max_bid, count, round_value)
+    return run
+
+
+def _prepare_frame(orders):
+    """Заказы в колонках exp_anal/SB/src/prepare.py."""
+    start = orders["start_price"] / 100
+    return pd.DataFrame({
+        "eta": orders["eta"],
+        "duration_in_min": orders["duration"] / 60,
+        "price_highrate_value": orders["recprice"] / 100,
+        "price_start_value": start,
+        "available_prices_currency": list(start[:, None] * (1 + orders["steps"] / 100)),
+        "group_name": "Control",
+    })
+
+
+def _setup_determine_bid_algorithm(orders):
+    module = _load("exp_anal/SB/src/prepare.py", "sb_prepare")  # нужен h3
+    frame = _prepare_frame(orders)
+    return lambda: frame.apply(lambda row: module.determine_bid_algorithm(row, 0.0, 0.0), axis=1)
+
+
+def _setup_add_algo_name_new(orders):
+    module = _load("exp_anal/SB/src/prepare.py", "sb_prepare")  # нужен h3
+    frame = _prepare_frame(orders)
+    return lambda: module.add_algo_name_new(frame, 0.0, 0.0)
+
+
+def _setup_bidsteps(orders):
+    n = len(orders["start_price"])
+    params = Params(
+        start_price=orders["start_price"],
+        recprice=orders["recprice"],
+        bidding_steps=np.tile(orders["steps"], n),
+        bidding_steps_offsets=np.arange(0, len(orders["steps"]) * n + 1, len(orders["steps"])),
+        percents_enabled=np.ones(n, dtype=bool),
+        round_value=orders["round_value"],
+        max_bidding_price=np.zeros(n, dtype=np.int64),
+        city_max_price=np.zeros(n, dtype=np.int64),
+        duration=orders["duration"],
+        eta=orders["eta"],
+    )
+    algorithm = AlgBidMph(alpha=0.0, t=0.0)
+
+    def run():
+        for lo in range(0, n, BATCH_CHUNK):
+            algorithm.calculate_bid_steps(params.slice(lo, lo + BATCH_CHUNK))
+    return run
+
+
+def _setup_calc_max_bid(orders):
+    n = len(orders["start_price"])
+    params = Params(
+        start_price=orders["start_price"], recprice=orders["recprice"],
+        bidding_steps=np.zeros(0, dtype=np.int64), bidding_steps_offsets=np.zeros(n + 1, dtype=np.int64),
+        percents_enabled=np.ones(n, dtype=bool), round_value=orders["round_value"],
+        max_bidding_price=np.zeros(n, dtype=np.int64), city_max_price=np.zeros(n, dtype=np.int64),
+        duration=orders["duration"], eta=orders["eta"],
+    )
+    return lambda: calc_max_bid(params, 0.0, 0.0)
+
+
+# name -> (setup, построчная ли реализация)
+IMPLEMENTATIONS = {
+    "compute_steps": (_setup_compute_steps, True),
+    "compute_steps_batch": (_setup_compute_steps_batch, False),
+    "process_steps": (_setup_process_steps, True),
+    "process_steps_batch": (_setup_process_steps_batch, False),
+    "calculate_bid_buttons": (_setup_calculate_bid_buttons, True),
+    "compute_new_prices": (_setup_compute_new_prices, True),
+    "determine_bid_algorithm": (_setup_determine_bid_algorithm, True),
+    "add_algo_name_new": (_setup_add_algo_name_new, False),
+    "bidsteps.bid_mph": (_setup_bidsteps, False),
+    "bidsteps.calc_max_bid": (_setup_calc_max_bid, False),
+}
+
+# Реализации, которые нельзя замерить локально
+SKIPPED = {
+    "simulation/get_data.py (SQL)": "выполняется в BigQuery; смотрите total_slot_ms в INFORMATION_SCHEMA.JOBS",
+}
+
+
+def run_one(name: str, n_rows: int, scalar_cap: int) -> dict:
+    """Замер одной реализации в текущем процессе."""
+    setup, scalar = IMPLEMENTATIONS[name]
+    rows = min(n_rows, scalar_cap) if scalar else n_rows
+    try:
+        run = setup(make_orders(rows))
+    except ImportError as e:
+        return {"implementation": name, "size": n_rows, "skipped": f"нет зависимости: {e.name}"}
+
+    t0 = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - t0
+    return {
+        "implementation": name,
+        "size": n_rows,
+        "rows": rows,
+        "rows_per_sec": rows / elapsed,
+        # ru_maxrss в Linux — в килобайтах
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def run_isolated(name: str, n_rows: int, scalar_cap: int) -> dict:
+    """run_one в дочернем процессе: пиковый RSS не смешивается между реализациями."""
+    command = [sys.executable, os.path.abspath(__file__), "--worker", name, str(n_rows), str(scalar_cap)]
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        error = (completed.stderr.strip().splitlines() or ["unknown error"])[-1]
+        return {"implementation": name, "size": n_rows, "skipped": f"ошибка: {error}"}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def find_regressions(results: list, baseline: dict, max_regression: float) -> list:
+    """Строки, где rows/s упал больше чем на max_regression относительно baseline."""
+    regressions = []
+    for result in results:
+        expected = baseline.get(f"{result['implementation']}@{result['size']}")
+        if expected and "rows_per_sec" in result and result["rows_per_sec"] < expected * (1 - max_regression):
+            regressions.append(
+                f"{result['implementation']}@{result['size']}: "
+                f"{result['rows_per_sec']:,.0f} rows/s < {expected:,.0f} * (1 - {max_regression})"
+            )
+    return regressions
+
+
+def bench_compute_steps(n_rows: int, scalar_rows: int, chunk_size: int) -> dict:
+    """compute_steps_batch против построчного compute_steps с проверкой совпадения результата."""
+    default_steps, lengths, MaxBid, delta = make_workload(n_rows)
+
+    # Скалярная версия — на подвыборке, время экстраполируется на строку.
+    # Базой служит чистый цикл compute_steps по спискам;
+    # построчный реплей через DataFrame.apply, как в ноутбуках, выводится для справки.
+    m = min(scalar_rows, n_rows)
+    orders = pd.DataFrame({
+        "default_steps": [row[:k] for row, k in zip(default_steps[:m].tolist(), lengths[:m])],
+        "MaxBid": MaxBid[:m],
+        "delta": delta[:m],
+    })
+    t0 = time.perf_counter()
+    scalar_result = [
+        compute_steps(*row)
+        for row in zip(orders["default_steps"], orders["MaxBid"].tolist(), orders["delta"].tolist())
+    ]
+    loop_rate = m / (time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    orders.apply(lambda row: compute_steps(row["default_steps"], row["MaxBid"], row["delta"]), axis=1)
+    apply_rate = m / (time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    for lo in range(0, n_rows, chunk_size):
+        hi = lo + chunk_size
+        batch_result, _ = compute_steps_batch(
+            default_steps[lo:hi], lengths[lo:hi], MaxBid[lo:hi], delta[lo:hi]
+        )
+        if lo == 0:
+            head = batch_result
+    batch_rate = n_rows / (time.perf_counter() - t0)
+
+    for i, expected in enumerate(scalar_result[:min(m, len(head))]):
+        got = head[i][~np.isnan(head[i])]
+        if got.tobytes() != np.asarray(expected, dtype=np.float64).tobytes():
+            raise AssertionError(f"row {i}: {got} != {expected}")
+
+    return {
+        "rows": n_rows,
+        "loop_rows_per_sec": loop_rate,
+        "apply_rows_per_sec": apply_rate,
+        "batch_rows_per_sec": batch_rate,
+        "speedup": batch_rate / loop_rate,
+        "speedup_vs_apply": batch_rate / apply_rate,
+    }
+
+
+def main() -> None:
+    if len(sys.argv) > 1 and sys.argv[1] == "--worker":
+        name, n_rows, scalar_cap = sys.argv[2], int(sys.argv[3]), int(sys.argv[4])
+        print(json.dumps(run_one(name, n_rows, scalar_cap)))
+        return
+
+    parser = argparse.ArgumentParser(description="Бенчмарк реализаций шагов торга / MaxBid")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in SIZES))
+    parser.add_argument("--only", help="реализации через запятую (по умолчанию все)")
+    parser.add_argument("--scalar-cap", type=int, default=100_000, help="строк для построчных реализаций")
+    parser.add_argument("--baseline", help="JSON {\"реализация@размер\": rows/s} для проверки регрессий")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="допустимое падение rows/s (доля)")
+    parser.add_argument("--save-baseline", help="сохранить текущие rows/s как baseline")
+    parser.add_argument("--min-speedup", type=float, help="проверить compute_steps_batch против compute_steps")
+    args = parser.parse_args()
+
+    names = args.only.split(",") if args.only else list(IMPLEMENTATIONS)
+    results = [
+        run_isolated(name, int(size), args.scalar_cap)
+        for size in args.sizes.split(",")
+        for name in names
+    ]
+
+    for result in results:
+        if "skipped" in result:
+            print(f"{result['implementation']:<26} {result['size']:>11,}  пропущено: {result['skipped']}")
+        else:
+            sampled = " (подвыборка)" if result["rows"] < result["size"] else ""
+            print(
+                f"{result['implementation']:<26} {result['size']:>11,}  "
+                f"{result['rows_per_sec']:>14,.0f} rows/s  {result['peak_rss_mb']:>8,.0f} MB{sampled}"
+            )
+    for name, reason in SKIPPED.items():
+        print(f"{name:<26} {'':>11}  пропущено: {reason}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({
+                f"{r['implementation']}@{r['size']}": r["rows_per_sec"] for r in results if "rows_per_sec" in r
+            }, f, indent=2)
+
+    failures = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures += find_regressions(results, json.load(f), args.max_regression)
+    if args.min_speedup:
+        stats = bench_compute_steps(max(int(s) for s in args.sizes.split(",")), args.scalar_cap, BATCH_CHUNK)
+        print(f"compute_steps_batch / compute_steps: {stats['speedup']:.1f}x "
+              f"(/ DataFrame.apply: {stats['speedup_vs_apply']:.1f}x)")
+        if stats["speedup"] < args.min_speedup:
+            failures.append(f"speedup {stats['speedup']:.1f}x < {args.min_speedup}x")
+    if failures:
+        raise SystemExit("\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,13 @@
 import argparse
-from typing import List
+from typing import List, Tuple, Union
+
+import numpy as np
+
+# Строк в блоке compute_steps_batch: ~30 промежуточных векторов блока помещаются в L2.
+BATCH_BLOCK = 16384
+# Сдвиг хвоста за пределами lengths при поиске max / min (больше любой цены).
+_PAD = 1e300
+
 
 def criterion_applies(default_steps: List[int], MaxBid: int) -> bool:
     """
@@ -34,7 +42,146 @@ def compute_steps(
     return result_steps
 
 
+def compute_steps_batch(
+    default_steps: np.ndarray,
+    lengths: np.ndarray,
+    MaxBid: np.ndarray,
+    delta_param: Union[float, np.ndarray],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Векторная версия compute_steps для батча заказов.
+
+    :param default_steps: 2D массив (n_orders, width) дефолтных шагов,
+        хвост строки за пределами lengths[i] игнорируется
+    :param lengths: длина дефолтного массива для каждой строки
+    :param MaxBid: MaxBid для каждой строки
+    :param delta_param: Δ_param — скаляр или вектор на строку
+    :return: (steps, applied) — матрица (n_orders, width) float64 с NaN-паддингом справа
+        (строка i совпадает с compute_steps для i-го заказа) и маска
+        применения нового алгоритма
+    """
+    default_steps = np.asarray(default_steps)
+    n, width = default_steps.shape
+    lengths = np.asarray(lengths, dtype=np.int64)
+    b = np.asarray(MaxBid, dtype=np.float64)
+    delta = np.broadcast_to(np.asarray(delta_param, dtype=np.float64), (n,))
+
+    result = np.empty((n, width))
+    applied = np.empty(n, dtype=bool)
+    nan = np.full(min(n, BATCH_BLOCK), np.nan)
+    # Считаем блоками по BATCH_BLOCK строк: промежуточные векторы остаются в кэше.
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        for lo in range(0, n, BATCH_BLOCK):
+            hi = min(lo + BATCH_BLOCK, n)
+            _steps_block(
+                default_steps[lo:hi], lengths[lo:hi], b[lo:hi], delta[lo:hi],
+                result[lo:hi], applied[lo:hi], nan[:hi - lo],
+            )
+
+    return result, applied
+
+
+def _bits_mask(mask: np.ndarray) -> np.ndarray:
+    """bool -> uint64: все биты единичные там, где mask."""
+    bits = mask.view(np.uint8).astype(np.uint64)
+    np.negative(bits, out=bits)
+    return bits
+
+
+def _select(bits: np.ndarray, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """
+    x там, где bits, иначе y — побитово, без ветвлений.
+    np.where на перемешанных масках упирается в промахи предсказателя переходов.
+    """
+    y_bits = y.view(np.uint64)
+    out = x.view(np.uint64) ^ y_bits
+    out &= bits
+    out ^= y_bits
+    return out.view(np.float64)
+
+
+def _steps_block(
+    steps: np.ndarray,
+    lengths: np.ndarray,
+    b: np.ndarray,
+    delta: np.ndarray,
+    out: np.ndarray,
+    applied: np.ndarray,
+    nan: np.ndarray,
+) -> None:
+    """Один блок compute_steps_batch; пишет шаги в out и маску в applied."""
+    width = steps.shape[1]
+    # Ширина массива шагов мала (3–5), поэтому считаем по колонкам:
+    # операции над векторами длины n быстрее редукций по короткой оси.
+    columns = [steps[:, j].astype(np.float64) for j in range(width)]
+    L = lengths.astype(np.float64)
+    first = columns[0]
+
+    # ── Шаг 3: критерий применимости ──────────────────────────────────────────
+    # Хвост за пределами lengths сдвигаем на ±_PAD, чтобы он не влиял на max / min.
+    top, a = first, first
+    for j in range(1, width):
+        pad = np.multiply(L <= j, _PAD)
+        top = np.fmax(top, columns[j] - pad)
+        a = np.fmin(a, columns[j] + pad)
+    np.less(b, top, out=applied)
+    empty = L < 1
+    if empty.any():
+        applied &= ~empty
+
+    # ── Шаг 4–5: границы диапазона и правило малого диапазона ─────────────────
+    span = b - a
+    collapsed = span < delta
+    collapsed &= applied
+    resliced = applied ^ collapsed
+
+    # ── Шаги 6–7: длина N в закрытой форме вместо цикла ───────────────────────
+    # Цикл останавливается на наибольшем N <= len, для которого
+    # (b - a) / (N - 1) >= Δ_param, но не опускается ниже 2.
+    # Δ = 0 и NaN дают NaN / inf, которые fmin сводит к len.
+    N = span / delta
+    np.floor(N, out=N)
+    N += 1
+    np.maximum(N, 2.0, out=N)
+    np.fmin(N, L, out=N)
+    if (delta < 0).any():
+        N = np.where(delta < 0, L, N)
+
+    # Коррекция на ±1 там, где деление в float дало другой floor:
+    # условие проверяется ровно тем же выражением, что и в цикле.
+    down = span / (N - 1) < delta
+    down &= N > 2
+    up = span / N < delta
+    up |= N >= L
+    N -= down
+    N += ~up
+
+    # ── Шаг 8: равномерное разрезание [a, b] ──────────────────────────────────
+    delta_final = span / (N - 1)
+    keep = ~applied
+    count = L * keep
+    count += N * resliced
+    count += collapsed
+
+    keep_bits = _bits_mask(keep)
+    head = _select(keep_bits, first, _select(_bits_mask(collapsed), b, a))
+    out[:, 0] = _select(_bits_mask(count > 0), head, nan) if empty.any() else head
+    for j in range(1, width):
+        value = _select(keep_bits, columns[j], a + j * delta_final)
+        out[:, j] = _select(_bits_mask(count > j), value, nan)
+
+
 # ────────────────────────────────────────────────────────────────────────────────
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Алгоритм bid-MPH Δ для одного заказа (поток заказов — stream.py)"
+    )
+    parser.add_argument("--steps", required=True, help="дефолтные шаги через запятую, например 110,120,130")
+    parser.add_argument("--MaxBid", type=int, required=True)
+    parser.add_argument("--delta", type=float, default=0.0, help="Δ_param")
+    return parser.parse_args()
+
+
 def main() -> None:
     args = parse_args()
 
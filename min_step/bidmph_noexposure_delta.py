@@ -1,4 +1,6 @@
-from typing import List
+from typing import List, Tuple, Union
+
+import numpy as np
 
 def is_applicable(steps: List[int], max_bit: int) -> bool:
     if not steps:                       
@@ -32,4 +34,63 @@ def process_steps(
         if (max_bit - prev) < delta:
             t.pop(-2)                   # Удаляем prev, оставляя только MaxBid
 
-    return t
\ No newline at end of file
+    return t
+
+
+def process_steps_batch(
+    values: np.ndarray,
+    offsets: np.ndarray,
+    max_bit: np.ndarray,
+    delta: Union[int, np.ndarray],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Векторная версия process_steps для батча заказов в CSR-формате.
+
+    Шаги заказа i лежат в values[offsets[i]:offsets[i + 1]]; результат
+    возвращается в том же формате, без Python-списка на каждую строку.
+
+    :param values: плоский int64 массив шагов всех заказов
+    :param offsets: границы строк, длина n_orders + 1, offsets[0] == 0
+    :param max_bit: MaxBid для каждого заказа
+    :param delta: Δ — скаляр или вектор на заказ
+    :return: (values, offsets) итоговых массивов
+    """
+    values = np.asarray(values, dtype=np.int64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    n = len(offsets) - 1
+    max_bit = np.broadcast_to(np.asarray(max_bit, dtype=np.int64), (n,))
+    delta = np.broadcast_to(np.asarray(delta), (n,))
+
+    lengths = np.diff(offsets)
+    row_id = np.repeat(np.arange(n), lengths)
+
+    # 1. Проверка применимости: max_bit < max(steps) по непустым строкам
+    nonempty = lengths > 0
+    row_max = np.zeros(n, dtype=np.int64)
+    if nonempty.any():
+        row_max[nonempty] = np.maximum.reduceat(values, offsets[:-1][nonempty])
+    applied = nonempty & (max_bit < row_max)
+
+    # 2. Построение T: в применённых строках остаются шаги < max_bit
+    keep = ~applied[row_id] | (values < max_bit[row_id])
+    kept = values[keep]
+    kept_row = row_id[keep]
+    kept_counts = np.bincount(kept_row, minlength=n)
+    kept_offsets = np.concatenate(([0], np.cumsum(kept_counts)))
+
+    # 3. Контроль Δ: последний оставшийся шаг — это prev перед MaxBid
+    has_prev = applied & (kept_counts > 0)
+    prev = np.zeros(n, dtype=np.int64)
+    prev[has_prev] = kept[kept_offsets[1:][has_prev] - 1]
+    dropped = has_prev & ((max_bit - prev) < delta)
+
+    out_counts = kept_counts + applied - dropped
+    out_offsets = np.concatenate(([0], np.cumsum(out_counts)))
+    out = np.empty(out_offsets[-1], dtype=np.int64)
+
+    position = np.arange(len(kept)) - kept_offsets[kept_row]
+    survives = position < kept_counts[kept_row] - dropped[kept_row]
+    out[out_offsets[kept_row[survives]] + position[survives]] = kept[survives]
+    out[out_offsets[1:][applied] - 1] = max_bit[applied]
+
+    return out, out_offsets
@@ -0,0 +1,611 @@
+"""
+Колоночный порт Go-пакета bidsteps (algorithm.go, custom_steps.go).
+
+Все алгоритмы считаются сразу для массива заказов: параметры лежат в
+колонках Params, шаги торга — в CSR-раскладке (плоский int64 массив
+values + offsets, строка i = values[offsets[i]:offsets[i + 1]]).
+Арифметика повторяет Go: int64, деление с отбрасыванием дробной части,
+int64(float64) — усечение к нулю.
+"""
+import json
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+ALGORITHM_DEFAULT = ""
+ALGORITHM_BID_MPH = "bid_mph"
+ALGORITHM_BID_MPH_NO_EXPOSURE = "bid_mph_no_exposure"
+ALGORITHM_BID_WITH_RECPRICE = "with_recprice"
+ALGORITHM_BID_WITHOUT_RECPRICE = "without_recprice"
+ALGORITHM_FIXED_RANGE = "fixed_range"
+
+ALGORITHM_BID_MPH_DEFAULT = ALGORITHM_BID_MPH + "_default"
+ALGORITHM_BID_MPH_RECALCULATED = ALGORITHM_BID_MPH + "_recalculated"
+ALGORITHM_BID_MPH_NO_EXPOSURE_DEFAULT = ALGORITHM_BID_MPH_NO_EXPOSURE + "_default"
+ALGORITHM_BID_MPH_NO_EXPOSURE_RECALCULATED = ALGORITHM_BID_MPH_NO_EXPOSURE + "_recalculated"
+
+
+# ── CSR helpers ───────────────────────────────────────────────────────────────
+def pack_ragged(rows: Iterable[Sequence[int]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Список списков -> (values, offsets)."""
+    rows = [[] if row is None else list(row) for row in rows]
+    lengths = np.fromiter((len(row) for row in rows), dtype=np.int64, count=len(rows))
+    offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+    values = np.fromiter(
+        (x for row in rows for x in row), dtype=np.int64, count=int(offsets[-1])
+    )
+    return values, offsets
+
+
+def unpack_ragged(values: np.ndarray, offsets: np.ndarray) -> List[List[int]]:
+    """(values, offsets) -> список списков."""
+    return [values[lo:hi].tolist() for lo, hi in zip(offsets[:-1], offsets[1:])]
+
+
+def to_currency(values: np.ndarray, offsets: np.ndarray, multiplier) -> np.ndarray:
+    """
+    Перевод минорных единиц в валюту на выходе: multiplier — скаляр или
+    вектор на строку. Внутри движков цены остаются int64.
+    """
+    multiplier = np.asarray(multiplier)
+    if multiplier.ndim:
+        multiplier = multiplier[_row_ids(offsets)]
+    return values / multiplier
+
+
+def compact_steps(values: np.ndarray) -> np.ndarray:
+    """int32 для хранения, если все цены помещаются, иначе int64."""
+    values = np.asarray(values, dtype=np.int64)
+    info = np.iinfo(np.int32)
+    if len(values) == 0 or (values.min() >= info.min and values.max() <= info.max):
+        return values.astype(np.int32)
+    return values
+
+
+def _row_ids(offsets: np.ndarray) -> np.ndarray:
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+
+def _row_max(values: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Максимум по строке; для пустых строк — минимальный int64."""
+    n = len(offsets) - 1
+    result = np.full(n, np.iinfo(np.int64).min, dtype=np.int64)
+    nonempty = np.diff(offsets) > 0
+    if nonempty.any():
+        result[nonempty] = np.maximum.reduceat(values, offsets[:-1][nonempty])
+    return result
+
+
+def _compress(values: np.ndarray, offsets: np.ndarray, keep: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Оставляет в каждой строке элементы по маске keep."""
+    n = len(offsets) - 1
+    counts = np.bincount(_row_ids(offsets)[keep], minlength=n)
+    return values[keep], np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+
+
+def _gather(values: np.ndarray, offsets: np.ndarray, index: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Собирает строки index из (values, offsets) в новую CSR-таблицу."""
+    lengths = np.diff(offsets)[index]
+    out_offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+    position = np.arange(out_offsets[-1]) - np.repeat(out_offsets[:-1], lengths)
+    return values[np.repeat(offsets[:-1][index], lengths) + position], out_offsets
+
+
+def _select(mask: np.ndarray, a: Tuple[np.ndarray, np.ndarray], b: Tuple[np.ndarray, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Построчный where для CSR: строки из a там, где mask, иначе из b."""
+    a_values, a_offsets = a
+    b_values, b_offsets = b
+    a_keep = mask[_row_ids(a_offsets)]
+    b_keep = ~mask[_row_ids(b_offsets)]
+    lengths = np.where(mask, np.diff(a_offsets), np.diff(b_offsets))
+    out_offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+    out = np.empty(out_offsets[-1], dtype=np.int64)
+    out[np.repeat(mask, lengths)] = a_values[a_keep]
+    out[~np.repeat(mask, lengths)] = b_values[b_keep]
+    return out, out_offsets
+
+
+def _go_div(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Целочисленное деление Go: усечение к нулю, а не floor."""
+    q = np.abs(a) // np.abs(b)
+    return np.where((a < 0) != (b < 0), -q, q)
+
+
+def _go_int64(x: np.ndarray) -> np.ndarray:
+    """int64(float64) из Go: усечение к нулю."""
+    with np.errstate(invalid="ignore", over="ignore"):
+        return np.asarray(x).astype(np.int64)
+
+
+# ── Params / Result ───────────────────────────────────────────────────────────
+@dataclass
+class Params:
+    """
+    Колоночный аналог Go Params: по одному значению на заказ,
+    BiddingSteps — в CSR (bidding_steps, bidding_steps_offsets).
+    """
+    start_price: np.ndarray
+    recprice: np.ndarray
+    bidding_steps: np.ndarray
+    bidding_steps_offsets: np.ndarray
+    percents_enabled: np.ndarray
+    round_value: np.ndarray
+    max_bidding_price: np.ndarray
+    city_max_price: np.ndarray
+    duration: np.ndarray
+    eta: np.ndarray
+    distance: Optional[np.ndarray] = None
+    price_range_min: Optional[np.ndarray] = None
+    price_range_max: Optional[np.ndarray] = None
+
+    def __post_init__(self):
+        n = len(self.start_price)
+        for name in ("price_range_min", "price_range_max", "distance"):
+            if getattr(self, name) is None:
+                setattr(self, name, np.zeros(n, dtype=np.int64))
+
+    def __len__(self) -> int:
+        return len(self.start_price)
+
+    def slice(self, lo: int, hi: int) -> "Params":
+        """Строки [lo, hi) — для обработки чанками."""
+        offsets = self.bidding_steps_offsets
+        hi = min(hi, len(self))
+        columns = {
+            name: getattr(self, name)[lo:hi]
+            for name in (
+                "start_price", "recprice", "percents_enabled", "round_value", "max_bidding_price",
+                "city_max_price", "duration", "eta", "distance", "price_range_min", "price_range_max",
+            )
+        }
+        return Params(
+            bidding_steps=self.bidding_steps[offsets[lo]:offsets[hi]],
+            bidding_steps_offsets=offsets[lo:hi + 1] - offsets[lo],
+            **columns,
+        )
+
+    def take(self, index: np.ndarray) -> "Params":
+        """Строки по индексу — для группировки заказов по конфигу."""
+        steps, offsets = _gather(self.bidding_steps, self.bidding_steps_offsets, index)
+        columns = {
+            name: getattr(self, name)[index]
+            for name in (
+                "start_price", "recprice", "percents_enabled", "round_value", "max_bidding_price",
+                "city_max_price", "duration", "eta", "distance", "price_range_min", "price_range_max",
+            )
+        }
+        return Params(bidding_steps=steps, bidding_steps_offsets=offsets, **columns)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "Params":
+        """
+        Собирает Params из DataFrame с колонками как в Go/логах:
+        StartPrice, Recprice, BiddingSteps (списки), PercentsEnabled,
+        RoundValue, MaxBiddingPrice, CityMaxPrice, Duration, ETA, ...
+        Отсутствующие числовые колонки считаются нулями.
+        """
+        n = len(df)
+
+        def column(name, dtype=np.int64):
+            if name not in df:
+                return np.zeros(n, dtype=dtype)
+            return df[name].fillna(0).to_numpy(dtype=dtype)
+
+        steps, offsets = pack_ragged(df["BiddingSteps"])
+        return cls(
+            start_price=column("StartPrice"),
+            recprice=column("Recprice"),
+            bidding_steps=steps,
+            bidding_steps_offsets=offsets,
+            percents_enabled=column("PercentsEnabled", bool),
+            round_value=column("RoundValue"),
+            max_bidding_price=column("MaxBiddingPrice"),
+            city_max_price=column("CityMaxPrice"),
+            duration=column("Duration"),
+            eta=column("ETA"),
+            distance=column("Distance"),
+            price_range_min=column("PriceRangeMin"),
+            price_range_max=column("PriceRangeMax"),
+        )
+
+
+@dataclass
+class Result:
+    algorithm_name: np.ndarray
+    bid_steps: np.ndarray
+    bid_steps_offsets: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.algorithm_name)
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({
+            "AlgorithmName": self.algorithm_name,
+            "BidSteps": unpack_ragged(self.bid_steps, self.bid_steps_offsets),
+        })
+
+
+def _names(n: int, name: str) -> np.ndarray:
+    return np.full(n, name, dtype=object)
+
+
+# ── sanitizeBidPriceSteps ─────────────────────────────────────────────────────
+def sanitize_bid_price_steps(params: Params, values: np.ndarray, offsets: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Округление вверх, отбрасывание <= 0 и дублей, лимиты CityMaxPrice/MaxBiddingPrice."""
+    row = _row_ids(offsets)
+    values = values.astype(np.int64, copy=True)
+
+    # 1 - round up (остаток как в Go: знак делимого)
+    round_value = params.round_value[row]
+    rounding = round_value > 0
+    mod = np.fmod(values, np.where(rounding, round_value, 1))
+    values += np.where(rounding & (mod != 0), round_value - mod, 0)
+
+    values, offsets = _compress(values, offsets, values > 0)
+    row = _row_ids(offsets)
+
+    # 2 - соседние одинаковые цены внутри строки
+    same_row = np.zeros(len(values), dtype=bool)
+    same_row[1:] = row[1:] == row[:-1]
+    duplicate = np.zeros(len(values), dtype=bool)
+    duplicate[1:] = values[1:] == values[:-1]
+    values, offsets = _compress(values, offsets, ~(same_row & duplicate))
+    row = _row_ids(offsets)
+
+    # 3, 4 - первая цена выше лимита заменяется лимитом, остальные отбрасываются
+    city_max = params.city_max_price[row]
+    max_bidding = params.max_bidding_price[row]
+    over_city = (city_max > 0) & (values > city_max)
+    over_bidding = (max_bidding > 0) & (values > max_bidding)
+    over = over_city | over_bidding
+    values = np.where(over_city, city_max, np.where(over_bidding, max_bidding, values))
+
+    over_cum = np.cumsum(over)
+    over_before_row = np.concatenate(([0], over_cum))[offsets[:-1]]
+    over_before = over_cum - over - over_before_row[row]
+    return _compress(values, offsets, over_before == 0)
+
+
+# ── calcMaxBid ────────────────────────────────────────────────────────────────
+def calc_max_bid(params: Params, alpha_param, t_param: float) -> np.ndarray:
+    """
+    calcMaxBid для всех заказов. alpha_param может быть вектором — тогда
+    результат имеет форму (n_orders, len(alpha_param)).
+    """
+    recprice = params.recprice.astype(np.float64)
+    startprice = params.start_price.astype(np.float64)
+    duration = params.duration.astype(np.float64)
+    eta = np.maximum(params.eta.astype(np.float64), t_param)
+    alpha = np.asarray(alpha_param, dtype=np.float64)
+
+    price = np.maximum(recprice, startprice)
+    duration_eta = duration + eta
+    duration_t = duration + t_param
+    if alpha.ndim:
+        price, duration_eta, duration_t = price[:, None], duration_eta[:, None], duration_t[:, None]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        max_bid = (1 + alpha) * price * duration_eta / duration_t
+    return _go_int64(max_bid)
+
+
+# ── Algorithms ────────────────────────────────────────────────────────────────
+@dataclass(frozen=True)
+class Segment:
+    start: int
+    values: Tuple[int, ...]
+
+
+class AlgDefault:
+    algorithm_name = ALGORITHM_DEFAULT
+
+    def modify(self, params: Params) -> Params:
+        return params
+
+    def default_bid_steps(self, params: Params) -> Tuple[np.ndarray, np.ndarray]:
+        offsets = params.bidding_steps_offsets
+        row = _row_ids(offsets)
+        start = params.start_price[row]
+        steps = params.bidding_steps
+        percents = start.astype(np.float64) * (1 + steps.astype(np.float64) * 0.01)
+        values = np.where(params.percents_enabled[row], _go_int64(percents), start + steps)
+        return sanitize_bid_price_steps(params, values, offsets)
+
+    def calculate_bid_steps(self, params: Params) -> Result:
+        values, offsets = self.default_bid_steps(params)
+        return Result(_names(len(params), self.algorithm_name), values, offsets)
+
+
+@dataclass(frozen=True)
+class AlgBidMph(AlgDefault):
+    """{"algorithm_name": "bid_mph", "alpha": 0, "t": 0}"""
+    alpha: float = 0.0
+    t: float = 0.0
+
+    def calculate_bid_steps(self, params: Params) -> Result:
+        values, offsets = self.default_bid_steps(params)
+        n_steps = np.diff(offsets)
+
+        max_bid = calc_max_bid(params, self.alpha, self.t)
+        recalculated = (n_steps > 0) & (params.duration != 0) & (_row_max(values, offsets) > max_bid)
+
+        # recalculated: StartPrice + (i + 1) * (maxBid - StartPrice) / nSteps
+        row = _row_ids(offsets)
+        step = _go_div(max_bid - params.start_price, np.maximum(n_steps, 1))
+        position = np.arange(len(values)) - offsets[row]
+        new_values = params.start_price[row] + (position + 1) * step[row]
+        new_values, new_offsets = sanitize_bid_price_steps(
+            params, *_compress(new_values, offsets, recalculated[row])
+        )
+        values, offsets = _select(recalculated, (new_values, new_offsets), (values, offsets))
+        names = np.where(recalculated, ALGORITHM_BID_MPH_RECALCULATED, ALGORITHM_BID_MPH_DEFAULT).astype(object)
+        return Result(names, values, offsets)
+
+
+@dataclass(frozen=True)
+class AlgBidMphNoExposure(AlgDefault):
+    """{"algorithm_name": "bid_mph_no_exposure", "alpha": 0, "t": 0}"""
+    alpha: float = 0.0
+    t: float = 0.0
+
+    def calculate_bid_steps(self, params: Params) -> Result:
+        values, offsets = self.default_bid_steps(params)
+        active = (np.diff(offsets) > 0) & (params.duration != 0)
+
+        row = _row_ids(offsets)
+        max_bid = calc_max_bid(params, self.alpha, self.t)[row]
+        capped = active[row] & (values > max_bid)
+        values = np.where(capped, max_bid, values)
+        recalculated = np.bincount(row[capped], minlength=len(params)) > 0
+
+        resanitized = sanitize_bid_price_steps(params, values, offsets)
+        values, offsets = _select(active, resanitized, (values, offsets))
+        names = np.where(
+            recalculated, ALGORITHM_BID_MPH_NO_EXPOSURE_RECALCULATED, ALGORITHM_BID_MPH_NO_EXPOSURE_DEFAULT
+        ).astype(object)
+        return Result(names, values, offsets)
+
+
+@dataclass(frozen=True)
+class AlgWithRecprice(AlgDefault):
+    """{"algorithm_name": "with_recprice", "segments": [{"start": 0, "values": [5, 10, 15]}, ...]}"""
+    segments: Tuple[Segment, ...] = ()
+    algorithm_name = ALGORITHM_BID_WITH_RECPRICE
+
+    def modify(self, params: Params) -> Params:
+        if not validate_segments(self.segments):
+            return params
+
+        compiled = compile_segments(self.segments)
+        price = np.maximum(params.recprice, params.start_price)
+        shifted = params.start_price < params.recprice
+        steps, offsets = _gather(compiled.values, compiled.offsets, compiled.lookup(price))
+
+        # Для StartPrice < Recprice стартом становится Recprice, а к шагам
+        # добавляется 0 в начало без последнего значения сегмента.
+        steps, offsets = _shift_steps(steps, offsets, shifted)
+
+        return replace(
+            params,
+            start_price=np.where(shifted, params.recprice, params.start_price),
+            bidding_steps=steps,
+            bidding_steps_offsets=offsets,
+        )
+
+
+@dataclass(frozen=True)
+class AlgWithoutRecprice(AlgDefault):
+    """{"algorithm_name": "without_recprice", "segments": [...], "without_recprice": true}"""
+    segments: Tuple[Segment, ...] = ()
+    algorithm_name = ALGORITHM_BID_WITHOUT_RECPRICE
+
+    def modify(self, params: Params) -> Params:
+        if not validate_segments(self.segments):
+            return params
+
+        compiled = compile_segments(self.segments)
+        steps, offsets = _gather(compiled.values, compiled.offsets, compiled.lookup(params.start_price))
+        return replace(params, bidding_steps=steps, bidding_steps_offsets=offsets)
+
+
+@dataclass(frozen=True)
+class AlgFixedRange(AlgDefault):
+    """{"algorithm_name": "fixed_range", "ratio": 0.98}"""
+    ratio: float = 0.0
+    algorithm_name = ALGORITHM_FIXED_RANGE
+
+    def modify(self, params: Params) -> Params:
+        recprice = params.recprice.astype(np.float64)
+        return replace(
+            params,
+            price_range_min=_go_int64(recprice * self.ratio),
+            price_range_max=_go_int64(recprice * (1 + (1 - self.ratio))),
+        )
+
+    def calculate_bid_steps(self, params: Params) -> Result:
+        low, high = params.price_range_min, params.price_range_max
+        third = _go_div(high - low, np.full(len(params), 3, dtype=np.int64))
+        values = np.stack([low + third, low + third * 2, high], axis=1).ravel()
+        offsets = np.arange(0, 3 * len(params) + 1, 3, dtype=np.int64)
+        values, offsets = sanitize_bid_price_steps(params, values, offsets)
+        return Result(_names(len(params), self.algorithm_name), values, offsets)
+
+
+# ── Segments ──────────────────────────────────────────────────────────────────
+# validateSegments / findSegment не входят в min_step/*.go; поведение
+# восстановлено по использованию: сегменты непусты и упорядочены по start,
+# выбирается последний сегмент со start <= price (или первый, если цена ниже).
+def validate_segments(segments: Sequence[Segment]) -> bool:
+    if not segments:
+        return False
+    starts = [s.start for s in segments]
+    return all(s.values for s in segments) and starts == sorted(starts)
+
+
+def find_segment(price: np.ndarray, segments: Sequence[Segment]) -> np.ndarray:
+    return compile_segments(tuple(segments)).lookup(price)
+
+
+@dataclass(frozen=True)
+class CompiledSegments:
+    """
+    Сегменты одного конфига, подготовленные для поиска по массиву цен:
+    отсортированные границы starts и значения сегментов в CSR.
+    """
+    starts: np.ndarray
+    values: np.ndarray
+    offsets: np.ndarray
+
+    def lookup(self, price: np.ndarray) -> np.ndarray:
+        """Индекс последнего сегмента со start <= price (0, если цена ниже всех)."""
+        index = np.searchsorted(self.starts, price, side="right") - 1
+        return np.maximum(index, 0)
+
+
+@lru_cache(maxsize=256)
+def compile_segments(segments: Tuple[Segment, ...]) -> CompiledSegments:
+    """Компилируется один раз на конфиг; segments — кортеж, чтобы работал кэш."""
+    values, offsets = pack_ragged(s.values for s in segments)
+    starts = np.array([s.start for s in segments], dtype=np.int64)
+    for array in (starts, values, offsets):
+        array.flags.writeable = False
+    return CompiledSegments(starts, values, offsets)
+
+
+def _shift_steps(values: np.ndarray, offsets: np.ndarray, mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Для строк mask: [0] + row[:last], где last = 1 для одного значения,
+    иначе len(row) - 1. Остальные строки не меняются.
+    """
+    lengths = np.diff(offsets)
+    out_lengths = np.where(mask, np.maximum(lengths, 2), lengths)
+    out_offsets = np.concatenate(([0], np.cumsum(out_lengths))).astype(np.int64)
+
+    row = np.repeat(np.arange(len(lengths)), out_lengths)
+    position = np.arange(out_offsets[-1]) - out_offsets[:-1][row]
+    shift = mask[row].astype(np.int64)
+    source = offsets[:-1][row] + position - shift
+    zero = (shift == 1) & (position == 0)
+    out = values[np.where(zero, offsets[:-1][row], source)]
+    out[zero] = 0
+    return out, out_offsets
+
+
+# ── Settings JSON ─────────────────────────────────────────────────────────────
+def parse_custom_bid_settings(json_data: str) -> AlgDefault:
+    """Аналог parseCustomBidSettings: выбор алгоритма по algorithm_name."""
+    settings = json.loads(json_data)
+    name = settings.get("algorithm_name", "")
+    segments = tuple(
+        Segment(int(s.get("start", 0)), tuple(int(v) for v in s.get("values") or ()))
+        for s in settings.get("segments") or ()
+    )
+
+    if name == ALGORITHM_BID_MPH:
+        return AlgBidMph(alpha=float(settings.get("alpha", 0)), t=float(settings.get("t", 0)))
+    if name == ALGORITHM_BID_MPH_NO_EXPOSURE:
+        return AlgBidMphNoExposure(alpha=float(settings.get("alpha", 0)), t=float(settings.get("t", 0)))
+    if name == ALGORITHM_BID_WITH_RECPRICE:
+        return AlgWithRecprice(segments=segments)
+    if name == ALGORITHM_BID_WITHOUT_RECPRICE:
+        return AlgWithoutRecprice(segments=segments)
+    if name == ALGORITHM_FIXED_RANGE:
+        return AlgFixedRange(ratio=float(settings.get("ratio", 0)))
+
+    # backward compatibility
+    if not segments:
+        raise ValueError("invalid settings: segments are empty")
+    if settings.get("without_recprice"):
+        return AlgWithoutRecprice(segments=segments)
+    return AlgWithRecprice(segments=segments)
+
+
+class SettingsRegistry:
+    """
+    Кэш разобранных настроек: каждая строка JSON разбирается один раз,
+    одинаковые по содержимому конфиги (разный порядок ключей, пробелы)
+    получают один и тот же неизменяемый объект алгоритма.
+    Вытеснение — LRU по строкам, не больше maxsize.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._by_json: "OrderedDict[str, AlgDefault]" = OrderedDict()
+        self._interned = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, json_data: str) -> AlgDefault:
+        algorithm = self._by_json.get(json_data)
+        if algorithm is not None:
+            self.hits += 1
+            self._by_json.move_to_end(json_data)
+            return algorithm
+
+        self.misses += 1
+        parsed = parse_custom_bid_settings(json_data)
+        algorithm = self._interned.setdefault(parsed, parsed)
+        self._by_json[json_data] = algorithm
+        if len(self._by_json) > self.maxsize:
+            self._by_json.popitem(last=False)
+            self._interned = {a: a for a in self._by_json.values()}
+        return algorithm
+
+    def __len__(self) -> int:
+        return len(self._by_json)
+
+    def clear(self) -> None:
+        self._by_json.clear()
+        self._interned.clear()
+        self.hits = self.misses = 0
+
+
+SETTINGS_REGISTRY = SettingsRegistry()
+
+
+def calculate_bid_steps(params: Params, settings: Optional[str] = None) -> Result:
+    """
+    Аналог NewCustomBidStepsSettings + CalculateBidSteps для всех заказов сразу.
+    Без settings используется дефолтный алгоритм с исходным PercentsEnabled.
+    """
+    if settings is None:
+        return AlgDefault().calculate_bid_steps(params)
+
+    algorithm = SETTINGS_REGISTRY.get(settings)
+    params = replace(params, percents_enabled=np.ones(len(params), dtype=bool))
+    return algorithm.calculate_bid_steps(algorithm.modify(params))
+
+
+def calculate_bid_steps_grouped(params: Params, settings: Sequence[Optional[str]]) -> Result:
+    """
+    calculate_bid_steps с настройками на каждый заказ: заказы группируются
+    по строке настроек (None — дефолтный алгоритм), каждая группа считается
+    одним батчем, результат возвращается в исходном порядке строк.
+    """
+    codes, uniques = pd.factorize(pd.Series(settings, dtype=object), use_na_sentinel=True)
+    order = np.argsort(codes, kind="stable")
+    bounds = np.flatnonzero(np.diff(codes[order])) + 1
+
+    names, values, lengths = [], [], []
+    for index in np.split(order, bounds):
+        if len(index) == 0:
+            continue
+        code = codes[index[0]]
+        result = calculate_bid_steps(params.take(index), None if code < 0 else uniques[code])
+        names.append(result.algorithm_name)
+        values.append(result.bid_steps)
+        lengths.append(np.diff(result.bid_steps_offsets))
+
+    if not names:
+        return Result(_names(0, ALGORITHM_DEFAULT), np.zeros(0, dtype=np.int64), np.zeros(1, dtype=np.int64))
+
+    # Группы идут в порядке order — возвращаем строки на исходные позиции
+    grouped_offsets = np.concatenate(([0], np.cumsum(np.concatenate(lengths)))).astype(np.int64)
+    inverse = np.empty_like(order)
+    inverse[order] = np.arange(len(order))
+    bid_steps, offsets = _gather(np.concatenate(values), grouped_offsets, inverse)
+    return Result(np.concatenate(names)[inverse], bid_steps, offsets)
@@ -0,0 +1,224 @@
+"""
+Потоковый прогон заказов через батч-версии алгоритмов шагов.
+
+Заказы читаются чанками из NDJSON / CSV / Parquet (файл или stdin),
+каждый чанк считается одним вызовом батч-движка, результат пишется
+в stdout (NDJSON) или Parquet. В памяти одновременно только один чанк;
+пропускная способность печатается в stderr.
+
+Пример:
+    zcat orders.ndjson.gz | python stream.py - --algorithm bidsteps > steps.ndjson
+    python stream.py dump.parquet --algorithm bid_mph_delta --delta 50 --output steps.parquet
+"""
+import argparse
+import itertools
+import json
+import sys
+import time
+from typing import Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from bidmph_delta import compute_steps_batch
+from bidmph_noexposure_delta import process_steps_batch
+from bidsteps import Params, calculate_bid_steps_grouped, pack_ragged, unpack_ragged
+
+ALGORITHMS = ("bidsteps", "bid_mph_delta", "bid_mph_noexposure_delta")
+FORMATS = ("ndjson", "csv", "parquet")
+
+
+# ── Чтение ────────────────────────────────────────────────────────────────────
+def _detect_format(path: str) -> str:
+    for fmt, suffixes in (("parquet", (".parquet", ".pq")), ("csv", (".csv",))):
+        if path.endswith(suffixes):
+            return fmt
+    return "ndjson"
+
+
+def _parse_list(cell) -> List[int]:
+    """Ячейка CSV со списком: "[10, 20, 30]" или "10,20,30"."""
+    if isinstance(cell, str):
+        cell = cell.strip()
+        if cell.startswith("["):
+            return json.loads(cell)
+        return [int(x) for x in cell.split(",") if x.strip()]
+    if cell is None or (isinstance(cell, float) and np.isnan(cell)):
+        return []
+    return list(cell)
+
+
+def read_chunks(path: str, fmt: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """Чанки заказов по chunk_size строк; path == "-" — stdin (кроме Parquet)."""
+    if fmt == "parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Для Parquet нужен pyarrow: pip install pyarrow")
+        if path == "-":
+            raise SystemExit("Parquet читается только из файла: формату нужен seek")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+        return
+
+    stream = sys.stdin if path == "-" else open(path, "r")
+    try:
+        if fmt == "csv":
+            yield from pd.read_csv(stream, chunksize=chunk_size)
+            return
+        while True:
+            lines = [line for line in itertools.islice(stream, chunk_size) if line.strip()]
+            if not lines:
+                return
+            yield pd.DataFrame.from_records([json.loads(line) for line in lines])
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def _expand_params(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Выгрузка логов: Params лежат JSON-строкой в колонке params."""
+    if "params" not in chunk or "StartPrice" in chunk:
+        return chunk
+    params = pd.DataFrame.from_records([json.loads(p) for p in chunk["params"]], index=chunk.index)
+    return pd.concat([chunk.drop(columns="params"), params], axis=1)
+
+
+# ── Расчёт чанка ──────────────────────────────────────────────────────────────
+def _pad(values: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """CSR -> прямоугольная матрица (n, max_len), хвосты заполнены нулями."""
+    lengths = np.diff(offsets)
+    width = max(int(lengths.max(initial=0)), 1)
+    row = np.repeat(np.arange(len(lengths)), lengths)
+    padded = np.zeros((len(lengths), width), dtype=np.int64)
+    padded[row, np.arange(len(values)) - offsets[:-1][row]] = values
+    return padded
+
+
+def process_chunk(chunk: pd.DataFrame, algorithm: str, delta: float) -> pd.DataFrame:
+    """
+    bidsteps — колонки Go Params (или JSON в params) и необязательная Settings;
+    bid_mph_delta / bid_mph_noexposure_delta — default_steps, MaxBid и
+    необязательная delta (по умолчанию --delta).
+    """
+    if algorithm == "bidsteps":
+        chunk = _expand_params(chunk)
+        if chunk["BiddingSteps"].dtype == object and isinstance(chunk["BiddingSteps"].iloc[0], str):
+            chunk = chunk.assign(BiddingSteps=chunk["BiddingSteps"].map(_parse_list))
+        settings = [None] * len(chunk)
+        if "Settings" in chunk:
+            settings = chunk["Settings"].astype(object).where(chunk["Settings"].notna(), None).tolist()
+        return calculate_bid_steps_grouped(Params.from_frame(chunk), settings).to_frame()
+
+    values, offsets = pack_ragged(chunk["default_steps"].map(_parse_list))
+    max_bid = chunk["MaxBid"].to_numpy(dtype=np.int64)
+    deltas = chunk["delta"].to_numpy(dtype=np.float64) if "delta" in chunk else delta
+
+    if algorithm == "bid_mph_delta":
+        steps, applied = compute_steps_batch(_pad(values, offsets), np.diff(offsets), max_bid, deltas)
+        return pd.DataFrame({
+            "steps": [row[~np.isnan(row)].tolist() for row in steps],
+            "applied": applied,
+        })
+
+    values, offsets = process_steps_batch(values, offsets, max_bid, deltas)
+    return pd.DataFrame({"steps": unpack_ragged(values, offsets)})
+
+
+# ── Запись ────────────────────────────────────────────────────────────────────
+class ParquetSink:
+    """Дописывает чанки в один Parquet-файл через pyarrow.ParquetWriter."""
+
+    def __init__(self, path: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Для Parquet нужен pyarrow: pip install pyarrow")
+        self._pa, self._pq = pa, pq
+        self.path = path
+        self.writer = None
+
+    def write(self, frame: pd.DataFrame) -> None:
+        table = self._pa.Table.from_pandas(frame, preserve_index=False)
+        if self.writer is None:
+            self.writer = self._pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+
+
+class NdjsonSink:
+    def __init__(self, stream=sys.stdout):
+        self.stream = stream
+
+    def write(self, frame: pd.DataFrame) -> None:
+        # json.dumps, а не DataFrame.to_json: тот округляет float до 10 знаков
+        columns = list(frame.columns)
+        rows = zip(*(frame[c].tolist() for c in columns))
+        self.stream.writelines(
+            json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows
+        )
+
+    def close(self) -> None:
+        self.stream.flush()
+
+
+def run(
+    path: str,
+    algorithm: str,
+    fmt: Optional[str] = None,
+    output: Optional[str] = None,
+    chunk_size: int = 100_000,
+    delta: float = 0.0,
+    keep: List[str] = (),
+) -> int:
+    """Прогоняет файл целиком, возвращает число обработанных заказов."""
+    fmt = fmt or _detect_format(path)
+    sink = ParquetSink(output) if output else NdjsonSink()
+    rows = 0
+    t0 = time.perf_counter()
+    try:
+        for chunk in read_chunks(path, fmt, chunk_size):
+            result = process_chunk(chunk.reset_index(drop=True), algorithm, delta)
+            for column in reversed(keep):
+                result.insert(0, column, chunk[column].to_numpy())
+            sink.write(result)
+
+            rows += len(chunk)
+            elapsed = time.perf_counter() - t0
+            print(f"{rows:,} заказов, {rows / elapsed:,.0f} rows/s", file=sys.stderr)
+    finally:
+        sink.close()
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Потоковый прогон заказов через алгоритмы шагов")
+    parser.add_argument("input", help="файл NDJSON / CSV / Parquet или - для stdin")
+    parser.add_argument("--algorithm", choices=ALGORITHMS, default="bidsteps")
+    parser.add_argument("--format", choices=FORMATS, help="по умолчанию — по расширению, иначе NDJSON")
+    parser.add_argument("--output", help="Parquet-файл (по умолчанию NDJSON в stdout)")
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    parser.add_argument("--delta", type=float, default=0.0, help="Δ, если в записях нет колонки delta")
+    parser.add_argument("--keep", default="", help="колонки входа через запятую, копируемые в выход (например, order_id)")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    rows = run(
+        args.input,
+        args.algorithm,
+        fmt=args.format,
+        output=args.output,
+        chunk_size=args.chunk_size,
+        delta=args.delta,
+        keep=[c for c in args.keep.split(",") if c],
+    )
+    elapsed = time.perf_counter() - t0
+    print(f"итого {rows:,} заказов за {elapsed:.1f} с ({rows / max(elapsed, 1e-9):,.0f} rows/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
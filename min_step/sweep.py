@@ -0,0 +1,121 @@
+"""
+Перебор сетки (alpha, t, delta) за один проход по выгрузке заказов.
+
+Дефолтные шаги считаются один раз, MaxBid (calcMaxBid) — на чанк сразу для
+всех alpha, а метрики compute_steps по delta получаются бродкастингом
+без пересчёта массивов шагов.
+"""
+import argparse
+import itertools
+import time
+from typing import Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from bidsteps import AlgDefault, Params, calc_max_bid
+
+
+def _row_reduce(ufunc, values: np.ndarray, offsets: np.ndarray, empty) -> np.ndarray:
+    result = np.full(len(offsets) - 1, empty, dtype=np.float64)
+    nonempty = np.diff(offsets) > 0
+    if nonempty.any():
+        result[nonempty] = ufunc.reduceat(values, offsets[:-1][nonempty])
+    return result
+
+
+def sweep(
+    orders: Union[Params, pd.DataFrame],
+    alphas: Sequence[float],
+    ts: Sequence[float],
+    deltas: Sequence[float],
+    chunk_size: int = 100_000,
+) -> pd.DataFrame:
+    """
+    Агрегаты алгоритма bid-MPH Δ для каждой точки сетки alpha × t × delta.
+
+    :param orders: Params или DataFrame с колонками Go (StartPrice, Recprice,
+        BiddingSteps, Duration, ETA, RoundValue, ...)
+    :return: DataFrame с колонками alpha, t, delta, orders_count,
+        applied_share — доля заказов, где MaxBid < max(default_steps),
+        mean_step_spread — средний разброс max - min итоговых шагов,
+        above_max_bid_share — доля дефолтных шагов выше MaxBid
+    """
+    params = orders if isinstance(orders, Params) else Params.from_frame(orders)
+    alphas = np.asarray(alphas, dtype=np.float64)
+    deltas = np.asarray(deltas, dtype=np.float64)
+
+    shape = (len(ts), len(alphas), len(deltas))
+    applied_sum = np.zeros(shape[:2])
+    above_sum = np.zeros(shape[:2])
+    spread_sum = np.zeros(shape)
+    orders_count = 0
+    steps_count = 0
+
+    for lo in range(0, len(params), chunk_size):
+        chunk = params.slice(lo, lo + chunk_size)
+        values, offsets = AlgDefault().default_bid_steps(chunk)
+        lengths = np.diff(offsets)
+        row = np.repeat(np.arange(len(chunk)), lengths)
+
+        top = _row_reduce(np.maximum, values, offsets, -np.inf)
+        low = _row_reduce(np.minimum, values, offsets, np.inf)
+        # Как в Go: без шагов или без Duration алгоритм не применяется
+        active = (lengths > 0) & (chunk.duration != 0)
+        default_spread = np.where(lengths > 0, top - low, 0.0)
+
+        orders_count += len(chunk)
+        steps_count += int(lengths[active].sum())
+
+        for i, t in enumerate(ts):
+            max_bid = calc_max_bid(chunk, alphas, t).astype(np.float64)  # (rows, alphas)
+            applied = active[:, None] & (max_bid < top[:, None])
+            applied_sum[i] += applied.sum(axis=0)
+
+            above = active[row, None] & (values[:, None] > max_bid[row])
+            above_sum[i] += above.sum(axis=0)
+
+            # Итоговый массив: [MaxBid] при (b - a) < Δ, иначе равномерная
+            # нарезка [a, b] с разбросом b - a; без применения — дефолтный.
+            span = max_bid - low[:, None]
+            collapsed = span[:, :, None] < deltas[None, None, :]
+            spread = np.where(collapsed | (lengths[:, None, None] < 2), 0.0, span[:, :, None])
+            spread = np.where(applied[:, :, None], spread, default_spread[:, None, None])
+            spread_sum[i] += spread.sum(axis=0)
+
+    grid = pd.DataFrame(
+        list(itertools.product(ts, alphas, deltas)), columns=["t", "alpha", "delta"]
+    )
+    grid["orders_count"] = orders_count
+    grid["applied_share"] = np.repeat(applied_sum.ravel(), len(deltas)) / max(orders_count, 1)
+    grid["mean_step_spread"] = spread_sum.ravel() / max(orders_count, 1)
+    grid["above_max_bid_share"] = np.repeat(above_sum.ravel(), len(deltas)) / max(steps_count, 1)
+    return grid[["alpha", "t", "delta", "orders_count", "applied_share", "mean_step_spread", "above_max_bid_share"]]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Перебор сетки alpha × t × delta по выгрузке заказов")
+    parser.add_argument("extract", help="parquet-выгрузка заказов с колонками Go Params")
+    parser.add_argument("--alphas", default="0,0.05,0.1,0.15,0.2")
+    parser.add_argument("--ts", default="0,60,120,240,300")
+    parser.add_argument("--deltas", default="0,50,100")
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    parser.add_argument("--output", help="CSV с результатом (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    def floats(text):
+        return [float(x) for x in text.split(",") if x.strip()]
+
+    orders = pd.read_parquet(args.extract)
+    t0 = time.perf_counter()
+    result = sweep(orders, floats(args.alphas), floats(args.ts), floats(args.deltas), args.chunk_size)
+    print(f"{len(result)} точек × {len(orders):,} заказов за {time.perf_counter() - t0:.1f} с")
+
+    if args.output:
+        result.to_csv(args.output, index=False)
+    else:
+        print(result.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Подбор (alpha, t) для города / типа заказа под целевое значение метрики.
+
+Поиск coarse-to-fine: сетка вокруг лучшей точки сужается на каждом уровне,
+кандидаты оцениваются на стратифицированной подвыборке через sweep, а
+несколько лучших перепроверяются на полных данных.
+"""
+import argparse
+import time
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from sweep import sweep
+
+OBJECTIVES = ("applied_share", "above_max_bid_share")
+
+
+def stratified_sample(
+    df: pd.DataFrame, strata: Optional[Sequence[str]], frac: float, seed: int = 42, min_rows: int = 50
+) -> pd.DataFrame:
+    """Детерминированная подвыборка с одинаковой долей в каждой страте (не меньше min_rows)."""
+    if frac >= 1:
+        return df
+    if not strata:
+        return df.sample(n=max(min(len(df), min_rows), int(len(df) * frac)), random_state=seed)
+
+    def take(group):
+        n = max(min(len(group), min_rows), int(round(len(group) * frac)))
+        return group.sample(n=n, random_state=seed)
+
+    return df.groupby(list(strata), group_keys=False, observed=True).apply(take)
+
+
+def tune(
+    orders: pd.DataFrame,
+    target: float,
+    objective: str = "applied_share",
+    alpha_range: Tuple[float, float] = (0.0, 0.5),
+    t_range: Tuple[float, float] = (0.0, 600.0),
+    grid_size: int = 7,
+    levels: int = 4,
+    tol: float = 0.002,
+    sample_frac: float = 0.1,
+    strata: Optional[Sequence[str]] = ("eta_bin",),
+    top_k: int = 3,
+    seed: int = 42,
+) -> dict:
+    """
+    Ищет (alpha, t), при которых objective на заказах ближе всего к target.
+
+    :param objective: applied_share — доля пересчитанных заказов,
+        above_max_bid_share — доля дефолтных шагов выше MaxBid (плохие биды)
+    :param strata: колонки для стратификации подвыборки; eta_bin считается
+        из ETA по минутам, если его нет в выгрузке
+    :return: словарь с alpha, t, значениями метрик на полных данных,
+        ошибкой и числом оценённых точек
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"objective должен быть одним из {OBJECTIVES}")
+
+    if strata and "eta_bin" in strata and "eta_bin" not in orders:
+        orders = orders.assign(eta_bin=orders["ETA"] // 60)
+    sample = stratified_sample(orders, strata, sample_frac, seed)
+
+    (alpha_lo, alpha_hi), (t_lo, t_hi) = alpha_range, t_range
+    evaluated = []
+    best_error = np.inf
+    level = 0
+
+    for level in range(1, levels + 1):
+        alphas = np.linspace(alpha_lo, alpha_hi, grid_size)
+        ts = np.linspace(t_lo, t_hi, grid_size)
+        result = sweep(sample, alphas, ts, [0.0])
+        result["error"] = (result[objective] - target).abs()
+        evaluated.append(result)
+
+        best = result.loc[result["error"].idxmin()]
+        improvement = best_error - best["error"]
+        best_error = min(best_error, best["error"])
+
+        # Ранняя остановка: цель достигнута или уровень ничего не улучшил
+        if best["error"] <= tol or improvement < tol / 10:
+            break
+
+        alpha_step = (alpha_hi - alpha_lo) / (grid_size - 1)
+        t_step = (t_hi - t_lo) / (grid_size - 1)
+        alpha_lo = max(alpha_range[0], best["alpha"] - alpha_step)
+        alpha_hi = min(alpha_range[1], best["alpha"] + alpha_step)
+        t_lo = max(t_range[0], best["t"] - t_step)
+        t_hi = min(t_range[1], best["t"] + t_step)
+
+    candidates = (pd.concat(evaluated)
+                  .drop_duplicates(["alpha", "t"])
+                  .nsmallest(top_k, "error"))
+
+    # Перепроверка лучших кандидатов на полных данных
+    full = sweep(orders, candidates["alpha"].unique(), candidates["t"].unique(), [0.0])
+    full = full.merge(candidates[["alpha", "t"]], on=["alpha", "t"])
+    full["error"] = (full[objective] - target).abs()
+    best = full.loc[full["error"].idxmin()]
+
+    return {
+        "alpha": best["alpha"],
+        "t": best["t"],
+        "objective": objective,
+        "target": target,
+        "applied_share": best["applied_share"],
+        "above_max_bid_share": best["above_max_bid_share"],
+        "error": best["error"],
+        "orders_count": int(best["orders_count"]),
+        "points_evaluated": int(sum(len(r) for r in evaluated)),
+        "levels": level,
+    }
+
+
+def tune_by_group(
+    orders: pd.DataFrame, group_cols: Sequence[str] = ("city_id", "type_name"), **kwargs
+) -> pd.DataFrame:
+    """tune для каждого города / типа заказа; kwargs передаются в tune."""
+    rows = []
+    for keys, group in orders.groupby(list(group_cols), observed=True):
+        t0 = time.perf_counter()
+        result = tune(group, **kwargs)
+        keys = keys if isinstance(keys, tuple) else (keys,)
+        rows.append({**dict(zip(group_cols, keys)), **result, "seconds": time.perf_counter() - t0})
+    return pd.DataFrame(rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Подбор alpha/t по городам под целевую метрику")
+    parser.add_argument("extract", help="parquet-выгрузка заказов с колонками Go Params и city_id, type_name")
+    parser.add_argument("--target", type=float, required=True)
+    parser.add_argument("--objective", choices=OBJECTIVES, default="applied_share")
+    parser.add_argument("--sample-frac", type=float, default=0.1)
+    parser.add_argument("--output", help="CSV с результатом (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    result = tune_by_group(
+        pd.read_parquet(args.extract),
+        target=args.target,
+        objective=args.objective,
+        sample_frac=args.sample_frac,
+    )
+    if args.output:
+        result.to_csv(args.output, index=False)
+    else:
+        print(result.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+Агрегация метрик бидов по сетке eta × AtoB для draw_heatmap.
+
+Построчные метрики (bid_metrics) считаются один раз; сетка
+строится за один проход: ключ группы и номера бинов складываются в один
+целочисленный код, средние — взвешенные bincount. Смена ширины бина
+(1 минута / 5 минут) пересчитывает только коды и bincount.
+
+Пример:
+    binned = prepare_binning(simulate(extract, city_type_params))
+    pictures_1m = aggregate_bins(binned, eta_width=60, atob_width=60)
+    pictures_5m = aggregate_bins(binned, eta_width=300, atob_width=300)
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+
+GROUP_KEYS = ['city_id', 'geo', 'type_name']
+METRIC_COLUMNS = ['percent_range_simulated_avg', 'distinct_bids_simulated_avg', 'NearestBid2Rec_simulated_avg',
+                  'percent_range_avg', 'distinct_bids_avg', 'NearestBid2Rec_avg']
+
+
+# ── Построчные метрики ────────────────────────────────────────────────────────
+def safe_divide(a, b):
+    """SAFE_DIVIDE: NULL при нулевом делителе."""
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(b == 0, np.nan, a / np.where(b == 0, 1, b))
+
+
+def _last(values, offsets):
+    """Последний элемент строки (NaN для пустых)."""
+    lengths = np.diff(offsets)
+    result = np.full(len(lengths), np.nan)
+    result[lengths > 0] = values[offsets[1:][lengths > 0] - 1]
+    return result
+
+
+def distinct_count(values, offsets):
+    """Число различных значений в строке."""
+    row = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    order = np.lexsort((values, row))
+    values, row = values[order], row[order]
+    new = np.ones(len(values), dtype=bool)
+    new[1:] = (row[1:] != row[:-1]) | (values[1:] != values[:-1])
+    return np.bincount(row[new], minlength=len(offsets) - 1)
+
+
+def _nearest_to(values, offsets, target):
+    """MIN(SAFE_DIVIDE(ABS(b - target), target)) по строке (NaN для пустых)."""
+    lengths = np.diff(offsets)
+    row = np.repeat(np.arange(len(lengths)), lengths)
+    distance = np.abs(values - target[row]) / np.where(target[row] == 0, np.nan, target[row])
+    result = np.full(len(lengths), np.nan)
+    nonempty = lengths > 0
+    if nonempty.any():
+        result[nonempty] = np.fmin.reduceat(distance, offsets[:-1][nonempty])
+    return result
+
+
+def bid_metrics(simulation):
+    """Построчные метрики финального SELECT: диапазон, число различных бидов, близость к рекомендованной."""
+    frame = simulation.frame
+    start_price = frame['start_price_value'].to_numpy()
+    price_highrate = frame['price_highrate_value'].to_numpy()
+    metrics = {}
+    for suffix, (values, offsets) in (('_simulated', simulation.simulated_bids), ('', simulation.available_prices)):
+        metrics[f'percent_range{suffix}'] = safe_divide(_last(values, offsets) - start_price, start_price)
+        metrics[f'distinct_bids{suffix}'] = distinct_count(values, offsets).astype(np.float64)
+        metrics[f'NearestBid2Rec{suffix}'] = _nearest_to(values, offsets, price_highrate)
+    return pd.DataFrame(metrics, index=frame.index)
+
+
+# ── Сетка eta × AtoB ──────────────────────────────────────────────────────────
+def prepare_binning(simulation, keys=GROUP_KEYS, weights=None):
+    """
+    Коды групп, eta / AtoB, хэш заказа и построчные метрики — всё, что нужно для любой ширины бина.
+    weights — веса строк (обратные вероятности выборки из preview.py): средние становятся взвешенными.
+    """
+    frame = simulation.frame
+    metrics = bid_metrics(simulation)
+    eta = frame['eta'].to_numpy(dtype=np.float64, na_value=np.nan)
+    atob = frame['AtoB_seconds'].to_numpy(dtype=np.float64, na_value=np.nan)
+    # Строки без eta / AtoB не попадают ни в один бин при любой ширине
+    valid = ~np.isnan(eta) & ~np.isnan(atob)
+    group_codes = frame.groupby(keys, dropna=False, sort=False).ngroup().to_numpy()
+    groups = frame[keys].drop_duplicates().reset_index(drop=True)
+
+    # NaN -> 0 с нулевым весом: AVG без NULL, как в SQL, без масок на каждый пересчёт
+    weight = 1.0 if weights is None else np.asarray(weights, dtype=np.float64)[valid]
+    sums, counts = {}, {}
+    for name in metrics.columns:
+        values = metrics[name].to_numpy()[valid]
+        present = ~np.isnan(values)
+        sums[f'{name}_avg'] = np.where(present, values, 0.0) * weight
+        counts[f'{name}_avg'] = present * weight
+    order_uuid = frame['order_uuid'] if 'order_uuid' in frame else pd.Series(np.arange(len(frame)))
+    return {
+        'group_codes': group_codes[valid],
+        'order_hash': pd.util.hash_array(order_uuid.to_numpy(dtype=object))[valid],
+        'groups': groups,
+        'eta': eta[valid],
+        'AtoB_seconds': atob[valid],
+        'sums': sums,
+        'counts': counts,
+    }
+
+
+def _assign_cells(binned, eta_width, atob_width):
+    """Номер непустой ячейки (группа, eta_bin, AtoB_seconds_bin) для каждой строки и ключи ячеек."""
+    group = binned['group_codes']
+    eta_index = np.floor(binned['eta'] / eta_width).astype(np.int64)
+    atob_index = np.floor(binned['AtoB_seconds'] / atob_width).astype(np.int64)
+    eta_min, atob_min = eta_index.min(initial=0), atob_index.min(initial=0)
+    n_eta = int(eta_index.max(initial=0) - eta_min) + 1
+    n_atob = int(atob_index.max(initial=0) - atob_min) + 1
+
+    # Один код на ячейку (группа, eta, AtoB); в результате — только непустые
+    code = (group * n_eta + (eta_index - eta_min)) * n_atob + (atob_index - atob_min)
+    n_dense = len(binned['groups']) * n_eta * n_atob
+    if n_dense <= 4 * len(code) + 1024:
+        # Плотная сетка помещается в память: перенумерация через bincount, без сортировки
+        occupied = np.bincount(code, minlength=n_dense) > 0
+        cells = np.flatnonzero(occupied)
+        cell_code = (np.cumsum(occupied) - 1)[code]
+    else:
+        cells, cell_code = np.unique(code, return_inverse=True)
+
+    keys = binned['groups'].iloc[cells // (n_eta * n_atob)].reset_index(drop=True)
+    keys['eta_bin'] = ((cells // n_atob) % n_eta + eta_min) * eta_width
+    keys['AtoB_seconds_bin'] = (cells % n_atob + atob_min) * atob_width
+    return cell_code, keys
+
+
+def aggregate_bins(binned, eta_width=60, atob_width=60):
+    """
+    Средние метрик по (группа, eta_bin, AtoB_seconds_bin), как AVG в get_pictures_data:
+    бин — FLOOR(x / width) * width, NULL-значения метрик не учитываются.
+    Возвращает длинную таблицу: ключи группы, eta_bin, AtoB_seconds_bin, bids_cnt и метрики.
+    """
+    cell_code, result = _assign_cells(binned, eta_width, atob_width)
+    n_cells = len(result)
+    result['bids_cnt'] = np.bincount(cell_code, minlength=n_cells)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for name, values in binned['sums'].items():
+            sums = np.bincount(cell_code, weights=values, minlength=n_cells)
+            counts = np.bincount(cell_code, weights=binned['counts'][name], minlength=n_cells)
+            result[name] = np.where(counts > 0, sums / counts, np.nan)
+    return result
+
+
+def _poisson_table(bits=16):
+    """Квантильная функция Poisson(1) на 2**bits равновероятных точках: uint16 -> вес 0..k."""
+    k = np.arange(32)
+    cdf = np.cumsum(np.exp(-1.0) / np.cumprod(np.concatenate(([1.0], k[1:].astype(np.float64)))))
+    u = (np.arange(2 ** bits) + 0.5) / 2 ** bits
+    return np.searchsorted(cdf, u).astype(np.float32)
+
+
+_POISSON = _poisson_table()
+
+
+def _order_buckets(cell_code, order_hash, buckets):
+    """
+    Корзина каждого бида: в ячейках, где различных заказов не больше buckets, —
+    ранг заказа внутри ячейки (у каждого заказа своя корзина), в остальных — order_hash % buckets.
+    """
+    order = np.lexsort((order_hash, cell_code))
+    cell, hashes = cell_code[order], order_hash[order]
+    new_cell = np.ones(len(cell), dtype=bool)
+    new_cell[1:] = cell[1:] != cell[:-1]
+    new_order = new_cell.copy()
+    new_order[1:] |= hashes[1:] != hashes[:-1]
+    # Порядковый номер заказа в ячейке: накопленное число новых заказов минус значение на старте ячейки
+    seen = np.cumsum(new_order) - 1
+    rank = seen - seen[new_cell][np.cumsum(new_cell) - 1]
+    n_orders = np.bincount(cell[new_order], minlength=cell_code.max(initial=-1) + 1)
+
+    bucket = np.empty(len(order), dtype=np.int64)
+    bucket[order] = np.where(n_orders[cell] <= buckets, rank, (hashes % np.uint64(buckets)).astype(np.int64))
+    return bucket
+
+
+def bootstrap_bins(binned, eta_width=60, atob_width=60, replicates=200, level=0.95, buckets=32, seed=0,
+                   memory_mb=256):
+    """
+    Пуассоновский бутстрэп средних по ячейкам с перцентильным интервалом уровня level.
+
+    Биды каждой ячейки раскладываются по buckets корзинам по хэшу order_uuid
+    (биды одного заказа всегда вместе), суммы и числа по корзинам — один bincount.
+    Реплика — веса Poisson(1) на корзины, все средние для чанка реплик — одно
+    матричное умножение cells × buckets × replicates; чанк ограничен memory_mb.
+    В ячейках, где заказов не больше buckets, корзина — ранг заказа в ячейке,
+    так что они ресэмплятся по заказам точно (без коллизий хэша).
+
+    Возвращает aggregate_bins с колонками {metric}_lo / {metric}_hi.
+    """
+    cell_code, _ = _assign_cells(binned, eta_width, atob_width)
+    result = aggregate_bins(binned, eta_width, atob_width)
+    n_cells = len(result)
+    index = cell_code * buckets + _order_buckets(cell_code, binned['order_hash'], buckets)
+
+    def per_bucket(weights):
+        return np.bincount(index, weights=weights, minlength=n_cells * buckets).reshape(n_cells, buckets)
+
+    sums = {name: per_bucket(values) for name, values in binned['sums'].items()}
+    # Маски NULL у разных метрик часто совпадают — суммы весов считаются один раз на маску
+    counts, mask_of = {}, {}
+    for name, present in binned['counts'].items():
+        key = present.tobytes()
+        if key not in counts:
+            counts[key] = per_bucket(present)
+        mask_of[name] = key
+
+    rng = np.random.default_rng(seed)
+    chunk = max(1, min(replicates, memory_mb * 2 ** 20 // (8 * n_cells * buckets or 1)))
+    estimates = {name: np.empty((n_cells, replicates)) for name in sums}
+    for lo in range(0, replicates, chunk):
+        hi = min(lo + chunk, replicates)
+        weights = _POISSON[rng.integers(0, len(_POISSON), size=(n_cells, buckets, hi - lo), dtype=np.uint16)]
+        totals = {key: np.einsum('cb,cbr->cr', value, weights) for key, value in counts.items()}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for name, value in sums.items():
+                estimates[name][:, lo:hi] = np.einsum('cb,cbr->cr', value, weights) / totals[mask_of[name]]
+
+    tail = (1 - level) / 2 * 100
+    with warnings.catch_warnings():
+        # Ячейка без единого значения метрики даёт All-NaN — интервал тоже NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        for name, matrix in estimates.items():
+            result[f'{name}_lo'], result[f'{name}_hi'] = np.nanpercentile(matrix, [tail, 100 - tail], axis=1)
+    return result
+
+
+def to_grid(aggregated, metric, **keys):
+    """2D-сетка метрики для одной группы: строки — AtoB_seconds_bin, столбцы — eta_bin."""
+    mask = np.ones(len(aggregated), dtype=bool)
+    for column, value in keys.items():
+        mask &= (aggregated[column] == value).to_numpy()
+    return aggregated[mask].pivot(index='AtoB_seconds_bin', columns='eta_bin', values=metric)
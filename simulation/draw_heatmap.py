@@ -1,54 +1,158 @@
+import argparse
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
+METRIC_PAIRS = [('percent_range_simulated_avg', 'percent_range_avg'),
+                ('distinct_bids_simulated_avg', 'distinct_bids_avg'),
+                ('NearestBid2Rec_simulated_avg', 'NearestBid2Rec_avg')]
+
+CI_HOVER = ('eta=%{x}<br>AtoB=%{y}<br>%{z:.4f} [%{customdata[0]:.4f}; %{customdata[1]:.4f}]'
+            '<br>bids=%{customdata[2]}<extra></extra>')
+
+
+def pivot_grids(df_temp):
+    """
+    Все колонки одной тройки city_id / geo / type_name в виде сеток:
+    строки — AtoB_seconds_bin, столбцы — eta_bin.
+    """
+    keys = ['city_id', 'geo', 'type_name', 'eta_bin', 'AtoB_seconds_bin']
+    values = [c for c in df_temp.select_dtypes('number').columns if c not in keys]
+    wide = df_temp.set_index(['AtoB_seconds_bin', 'eta_bin'])[values].unstack('eta_bin').sort_index()
+    return {
+        'x': wide.columns.get_level_values('eta_bin').unique().sort_values().tolist(),
+        'y': wide.index.tolist(),
+        'z': {column: wide[column].sort_index(axis=1).to_numpy(dtype=np.float64, na_value=np.nan)
+              for column in values},
+    }
+
+
+def _heatmap(grids, column, colorbar):
+    """Тепловая карта по сетке; интервал из binning.bootstrap_bins — в подсказке, если он посчитан."""
+    z = grids['z']
+    extra = {}
+    if f'{column}_lo' in z and 'bids_cnt' in z:
+        extra = dict(customdata=np.dstack([z[f'{column}_lo'], z[f'{column}_hi'], z['bids_cnt']]),
+                     hovertemplate=CI_HOVER)
+    return go.Heatmap(x=grids['x'], y=grids['y'], z=z[column], colorscale='RdBu', zmid=0,
+                      colorbar=colorbar, **extra)
+
+
+def build_figure(city_id, geo, type_name, metric, grids):
+    # Создаем макет с 1 строкой и 2 столбцами
+    fig = make_subplots(rows=1, cols=2, subplot_titles=[
+        f"{metric[0]}",
+        f"{metric[1]}"
+    ], shared_yaxes=True)
+
+    # Первая и вторая тепловые карты; цветовую шкалу второй переместим
+    fig.add_trace(_heatmap(grids, metric[0], dict(title="Value", len=0.8)), row=1, col=1)
+    fig.add_trace(_heatmap(grids, metric[1], dict(title="Value", len=0.8, x=1.02)), row=1, col=2)
+
+    # Настраиваем макет
+    fig.update_layout(
+        title_text=str(geo) + ' (' + str(city_id) + '), ' + str(type_name),
+        width=1200,
+        height=600,
+        template='plotly_white',
+        xaxis_title="ETA (seconds)",
+        yaxis_title="AtoB Seconds",
+        xaxis2_title="ETA (seconds)"
+    )
+    return fig
+
+
+def iter_grids(df):
+    """
+    (city_id, geo, type_name, сетки) — данные группируются и пивотятся один раз на тройку.
+    city_id в ключе: несколько городов с одним geo (или без geo — NULL после LEFT JOIN tbl_city)
+    иначе дали бы повторяющиеся ячейки eta × AtoB в одной сетке.
+    """
+    for (city_id, geo, type_name), df_temp in df.groupby(['city_id', 'geo', 'type_name'], sort=False, dropna=False):
+        yield city_id, geo, type_name, pivot_grids(df_temp)
+
+
 def draw_heatmap(df):
-    for geo in df['geo'].unique():
-        for type_name in df['type_name'].unique():
-            for metric in [('percent_range_simulated_avg', 'percent_range_avg'),
-                        ('distinct_bids_simulated_avg', 'distinct_bids_avg'),
-                        ('NearestBid2Rec_simulated_avg', 'NearestBid2Rec_avg')]:
-                # Создаем макет с 1 строкой и 2 столбцами
-                fig = make_subplots(rows=1, cols=2, subplot_titles=[
-                    f"{metric[0]}",
-                    f"{metric[1]}"
-                ], shared_yaxes=True)
-
-                df_temp = df[(df['geo'] == geo) & (df['type_name'] == type_name)]
-
-                # Первая тепловая карта
-                heatmap1 = go.Heatmap(
-                    x=df_temp['eta_bin'],
-                    y=df_temp['AtoB_seconds_bin'],
-                    z=df_temp[metric[0]],
-                    colorscale='RdBu',
-                    zmid=0,
-                    colorbar=dict(title="Value", len=0.8)
-                )
-
-                # Вторая тепловая карта
-                heatmap2 = go.Heatmap(
-                    x=df_temp['eta_bin'],
-                    y=df_temp['AtoB_seconds_bin'],
-                    z=df_temp[metric[1]],
-                    colorscale='RdBu',
-                    zmid=0,
-                    colorbar=dict(title="Value", len=0.8, x=1.02)  # Переместим цветовую шкалу
-                )
-
-                # Добавляем графики в макет
-                fig.add_trace(heatmap1, row=1, col=1)
-                fig.add_trace(heatmap2, row=1, col=2)
-
-                # Настраиваем макет
-                fig.update_layout(
-                    title_text=str(geo) + ', ' + str(type_name),
-                    width=1200,
-                    height=600,
-                    template='plotly_white',
-                    xaxis_title="ETA (seconds)",
-                    yaxis_title="AtoB Seconds",
-                    xaxis2_title="ETA (seconds)"
-                )
-
-                # Показываем график
-                fig.show()
+    for city_id, geo, type_name, grids in iter_grids(df):
+        for metric in METRIC_PAIRS:
+            # Показываем график
+            build_figure(city_id, geo, type_name, metric, grids).show()
+
+
+# ── Экспорт без ноутбука ──────────────────────────────────────────────────────
+def _slug(value):
+    return re.sub(r'[^0-9A-Za-z]+', '_', str(value)).strip('_') or 'none'
+
+
+def _render(task):
+    """Рендер одной фигуры в файлы; выполняется в процессе-воркере."""
+    city_id, geo, type_name, metric, grids, out_dir, formats = task
+    fig = build_figure(city_id, geo, type_name, metric, grids)
+    # str.removesuffix появился только в 3.9
+    suffix = '_simulated_avg'
+    metric_name = metric[0][:-len(suffix)] if metric[0].endswith(suffix) else metric[0]
+    name = f'{_slug(city_id)}__{_slug(geo)}__{_slug(type_name)}__{metric_name}'
+    files = {}
+    for fmt in formats:
+        path = os.path.join(out_dir, f'{name}.{fmt}')
+        if fmt == 'html':
+            fig.write_html(path, include_plotlyjs='cdn')
+        else:
+            # PNG / SVG / PDF через kaleido
+            fig.write_image(path)
+        files[fmt] = os.path.basename(path)
+    return {'city_id': None if pd.isna(city_id) else int(city_id),
+            'geo': None if pd.isna(geo) else str(geo), 'type_name': str(type_name),
+            'metric': metric[0], 'baseline': metric[1], 'files': files}
+
+
+def export_heatmaps(df, out_dir, formats=('html',), workers=None):
+    """
+    Все тепловые карты draw_heatmap в файлы (html / png / svg / pdf) без fig.show():
+    фигуры рендерятся в пуле процессов, список файлов пишется в out_dir/manifest.json.
+    """
+    if any(fmt != 'html' for fmt in formats):
+        try:
+            import kaleido  # noqa: F401
+        except ImportError:
+            raise SystemExit("Для PNG / SVG / PDF нужен kaleido: pip install kaleido")
+    os.makedirs(out_dir, exist_ok=True)
+    tasks = [(city_id, geo, type_name, metric, grids, out_dir, tuple(formats))
+             for city_id, geo, type_name, grids in iter_grids(df)
+             for metric in METRIC_PAIRS]
+
+    if workers == 1 or len(tasks) <= 1:
+        entries = [_render(task) for task in tasks]
+    else:
+        chunksize = max(1, len(tasks) // (4 * (workers or os.cpu_count())))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            entries = list(pool.map(_render, tasks, chunksize=chunksize))
+
+    with open(os.path.join(out_dir, 'manifest.json'), 'w') as f:
+        json.dump(entries, f, ensure_ascii=False, indent=2)
+    return entries
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Экспорт тепловых карт get_pictures_data в файлы")
+    parser.add_argument("input", help="pictures_data в parquet или csv")
+    parser.add_argument("out_dir", help="папка для файлов и manifest.json")
+    parser.add_argument("--format", nargs="+", default=["html"], choices=["html", "png", "svg", "pdf"])
+    parser.add_argument("--workers", type=int, default=None, help="число процессов (по умолчанию — все ядра)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.input.endswith(".parquet"):
+        pictures_data = pd.read_parquet(args.input)
+    else:
+        pictures_data = pd.read_csv(args.input)
+    entries = export_heatmaps(pictures_data, args.out_dir, args.format, args.workers)
+    print(f"{len(entries)} heatmaps -> {args.out_dir}")
@@ -0,0 +1,233 @@
+"""
+Локальная симуляция вместо options_assign из get_pictures_data / get_agg_data.
+
+Сырые биды с полями заказа (my_strm_full) выгружаются из BigQuery один раз
+и кэшируются в parquet; max_bid, new_bids_bool, last_step и simulated_bids
+с двухшаговым округлением считаются векторно для любых параметров по
+городам / типам без повторного сканирования order_global_strm и bid_global_strm.
+
+Пример:
+    extract = load_extract('2025-02-09', '2025-02-10', city_type_conditions)
+    pictures_data = get_pictures_data_local(extract, city_type_params, '2025-02-09', '2025-02-10')
+"""
+import hashlib
+import itertools
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from binning import GROUP_KEYS, METRIC_COLUMNS, aggregate_bins, bid_metrics, distinct_count, prepare_binning, safe_divide
+from get_data import CACHE_DIR, stream_ctes
+from rounding import round_two_step_ragged
+
+# alpha, pickup_eta_minutes, step1, step2 — ветки ELSE в CASE из ноутбука
+DEFAULT_PARAMS = (0, 5, 10, 20)
+
+
+def extract_query(start_date, stop_date, city_type_conditions):
+    """Биды из my_strm_full с geo; фильтры, не зависящие от параметров симуляции."""
+    return f'''
+    {stream_ctes(start_date, stop_date, city_type_conditions)}
+
+    SELECT t1.city_id,
+           t2.geo,
+           t1.timezone,
+           t1.type_name,
+           t1.order_uuid,
+           t1.tender_uuid,
+           t1.price_type,
+           t1.price,
+           t1.available_prices,
+           t1.last_step,
+           t1.start_price_value,
+           t1.price_highrate_value,
+           t1.accepted_tender_uuid,
+           t1.AtoB_seconds,
+           t1.eta,
+           t1.modified_at_utc,
+           t1.order_done
+    FROM my_strm_full t1
+    LEFT JOIN (SELECT DISTINCT tc.id AS city_id,
+                      CONCAT(tc.name, ' (', tc.id, ') ', tcc.name) AS geo
+               FROM `indriver-e6e40.ods_geo_config.tbl_city` tc
+               JOIN `indriver-e6e40.ods_geo_config.tbl_country` tcc
+               ON tc.country_id = tcc.id) t2
+           ON t1.city_id = t2.city_id
+    WHERE true
+      AND t1.eta IS NOT NULL
+      AND t1.available_prices IS NOT NULL
+      AND t1.price_highrate_value IS NOT NULL
+      AND t1.price_type = 'bid_price'
+      AND DATE(DATETIME(TIMESTAMP(t1.modified_at_utc), t1.timezone)) BETWEEN DATE('{start_date}') AND DATE('{stop_date}')
+    '''
+
+
+def load_extract(start_date, stop_date, city_type_conditions, cache_dir=CACHE_DIR, refresh=False):
+    """Выгрузка бидов за период; повторный вызов с теми же аргументами читает parquet-кэш."""
+    key = hashlib.sha1(str(city_type_conditions).encode()).hexdigest()[:10]
+    path = os.path.join(cache_dir, f'extract_{start_date}_{stop_date}_{key}.parquet')
+    if os.path.exists(path) and not refresh:
+        return pd.read_parquet(path)
+
+    df = pd.read_gbq(extract_query(start_date, stop_date, city_type_conditions))
+    os.makedirs(cache_dir, exist_ok=True)
+    df.to_parquet(path, index=False)
+    return df
+
+
+# ── Вспомогательные функции ───────────────────────────────────────────────────
+def pack_ragged(lists):
+    """Колонка списков -> (values, offsets); None — пустой список."""
+    lengths = np.fromiter((0 if x is None else len(x) for x in lists), dtype=np.int64, count=len(lists))
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    values = np.fromiter(
+        itertools.chain.from_iterable(x for x in lists if x is not None), dtype=np.float64, count=int(offsets[-1])
+    )
+    return values, offsets
+
+
+def unpack_ragged(values, offsets):
+    """(values, offsets) -> список списков."""
+    return [values[lo:hi].tolist() for lo, hi in zip(offsets[:-1], offsets[1:])]
+
+
+def _row_params(df, city_type_params, default=DEFAULT_PARAMS):
+    """CASE WHEN city_id = ... AND type_name = ... -> колонки alpha, pickup_eta_minutes, step1, step2."""
+    names = ['alpha', 'pickup_eta_minutes', 'step1', 'step2']
+    params = pd.DataFrame(
+        [(city, type_name, *values) for (city, type_name), values in city_type_params.items()],
+        columns=['city_id', 'type_name'] + names,
+    )
+    merged = df[['city_id', 'type_name']].merge(params, on=['city_id', 'type_name'], how='left')
+    return [merged[name].fillna(value).to_numpy(dtype=np.float64) for name, value in zip(names, default)]
+
+
+# ── Симуляция ─────────────────────────────────────────────────────────────────
+@dataclass
+class Simulation:
+    """Результат options_assign: колонки бидов и ragged-массивы цен (values, offsets)."""
+    frame: pd.DataFrame
+    available_prices: tuple
+    simulated_bids: tuple
+
+    def to_frame(self):
+        """Колонки как в options_assign, массивы — списками."""
+        return self.frame.assign(
+            available_prices=unpack_ragged(*self.available_prices),
+            simulated_bids=unpack_ragged(*self.simulated_bids),
+        )
+
+
+def simulate(extract, city_type_params, start_date=None, stop_date=None, default=DEFAULT_PARAMS):
+    """
+    options_assign над локальной выгрузкой.
+
+    :param extract: биды из load_extract (колонки my_strm_full + geo)
+    :param city_type_params: {(city_id, type_name): (alpha, pickup_eta_minutes, step1, step2)}
+    :param default: параметры для остальных городов / типов
+    """
+    df = extract[(extract['price_type'] == 'bid_price')
+                 & extract['eta'].notna()
+                 & extract['available_prices'].notna()
+                 & extract['price_highrate_value'].notna()].reset_index(drop=True)
+
+    modified_at_utc = pd.to_datetime(df['modified_at_utc'], utc=True)
+    modified_at_local = pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+    for timezone, index in df.groupby('timezone').groups.items():
+        modified_at_local[index] = modified_at_utc[index].dt.tz_convert(timezone).dt.tz_localize(None)
+    if start_date is not None:
+        date = modified_at_local.dt.normalize()
+        keep = (date >= pd.Timestamp(start_date)) & (date <= pd.Timestamp(stop_date))
+        df, modified_at_local = df[keep].reset_index(drop=True), modified_at_local[keep].reset_index(drop=True)
+
+    alpha, pickup_eta_minutes, step1, step2 = _row_params(df, city_type_params, default)
+    price = df['price'].to_numpy(dtype=np.float64, na_value=np.nan)
+    start_price = df['start_price_value'].to_numpy(dtype=np.float64, na_value=np.nan)
+    price_highrate = df['price_highrate_value'].to_numpy(dtype=np.float64, na_value=np.nan)
+    AtoB = df['AtoB_seconds'].to_numpy(dtype=np.float64, na_value=np.nan)
+    eta = df['eta'].to_numpy(dtype=np.float64, na_value=np.nan)
+    last_step = df['last_step'].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    # GREATEST в BigQuery возвращает NULL, если любой аргумент NULL — как np.maximum с NaN
+    greatest = np.maximum(price_highrate, start_price)
+    max_bid = safe_divide((1 + alpha) * greatest * (AtoB + eta), AtoB + pickup_eta_minutes * 60)
+    ratio = safe_divide(safe_divide(price, AtoB + eta), safe_divide(greatest, AtoB + pickup_eta_minutes * 60))
+    # CASE WHEN last_step <= max_bid THEN false ELSE true: NULL в сравнении -> true
+    new_bids_bool = ~(last_step <= max_bid)
+
+    values, offsets = pack_ragged(df['available_prices'].tolist())
+    lengths = np.diff(offsets)
+    row = np.repeat(np.arange(len(df)), lengths)
+    n = np.arange(len(values)) - offsets[:-1][row] + 1
+    new_bids = start_price[row] + safe_divide(n, lengths[row]) * (max_bid[row] - start_price[row])
+    rounded = round_two_step_ragged(new_bids, offsets, step1, step2)
+    simulated = np.where(new_bids_bool[row], rounded, values)
+
+    frame = pd.DataFrame({
+        'city_id': df['city_id'],
+        'geo': df['geo'] if 'geo' in df else None,
+        'type_name': df['type_name'],
+        'order_uuid': df['order_uuid'],
+        'tender_uuid': df['tender_uuid'],
+        'price_type': df['price_type'],
+        'price': price,
+        'start_price_value': start_price,
+        'price_highrate_value': price_highrate,
+        'AtoB_seconds': df['AtoB_seconds'],
+        'eta': df['eta'],
+        # CAST(FLOOR(x / 60) * 60 AS INT64): NULL остаётся <NA>, а не INT64_MIN
+        'AtoB_seconds_bin': pd.array(np.floor(AtoB / 60) * 60, dtype='Int64'),
+        'eta_bin': pd.array(np.floor(eta / 60) * 60, dtype='Int64'),
+        'accepted_tender_uuid': df['accepted_tender_uuid'],
+        'order_done': df['order_done'],
+        'modified_at_local': modified_at_local,
+        'ratio': ratio,
+        'last_step': last_step,
+        'new_bids_bool': new_bids_bool,
+        'max_bid': max_bid,
+    })
+    if 'sample_weight' in df:
+        # Вес заказа в выборке (preview.py)
+        frame['sample_weight'] = df['sample_weight'].to_numpy()
+    return Simulation(frame, (values, offsets), (simulated, offsets))
+
+
+def get_pictures_data_local(extract, city_type_params, start_date=None, stop_date=None, default=DEFAULT_PARAMS,
+                            eta_width=60, atob_width=60):
+    """То же, что get_pictures_data, но над локальной выгрузкой: средние по city / geo / type / eta_bin / AtoB_bin."""
+    simulation = simulate(extract, city_type_params, start_date, stop_date, default)
+    result = aggregate_bins(prepare_binning(simulation), eta_width, atob_width)
+    return result[GROUP_KEYS + ['eta_bin', 'AtoB_seconds_bin'] + METRIC_COLUMNS]
+
+
+def agg_metrics(simulation):
+    """Финальный SELECT из get_agg_data: доли пересчёта и средние метрики по city_id / type_name."""
+    frame = simulation.frame
+    new_bids = frame['new_bids_bool'].to_numpy()
+    distinct = distinct_count(*simulation.simulated_bids)
+    rows = pd.DataFrame({
+        'city_id': frame['city_id'],
+        'type_name': frame['type_name'],
+        'total_bids_cnt': 1,
+        'new_bids_cnt': new_bids.astype(np.int64),
+        **{f'new_bids_unique_{k}_cnt': (new_bids & (distinct == k)).astype(np.int64) for k in (3, 2, 1)},
+    })
+    metrics = bid_metrics(simulation)
+    metrics.columns = [f'{c}_avg' for c in metrics.columns]
+    grouped = pd.concat([rows, metrics], axis=1).groupby(['city_id', 'type_name'], dropna=False, sort=False)
+
+    counts = grouped[[c for c in rows.columns if c.endswith('_cnt')]].sum()
+    result = pd.DataFrame({'total_bids_cnt': counts['total_bids_cnt'],
+                           'new_bids_share': safe_divide(counts['new_bids_cnt'], counts['total_bids_cnt'])},
+                          index=counts.index)
+    for k in (3, 2, 1):
+        result[f'new_bids_unique_{k}_share'] = safe_divide(counts[f'new_bids_unique_{k}_cnt'], counts['new_bids_cnt'])
+    result = result.join(grouped[METRIC_COLUMNS].mean())
+    return result.reset_index()
+
+
+def get_agg_data_local(extract, city_type_params, start_date=None, stop_date=None, default=DEFAULT_PARAMS):
+    """То же, что get_agg_data, но над локальной выгрузкой."""
+    return agg_metrics(simulate(extract, city_type_params, start_date, stop_date, default))
@@ -1,17 +1,39 @@
-import pandas as pd
 import json
+import os
 import warnings
 
-def get_rounding_data(start_date = '2024-12-01', stop_date = '2024-12-31'):
-    pd.set_option('display.max_columns', None)
-    pd.options.display.float_format ='{:,.4f}'.format
-    warnings.filterwarnings('ignore')
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+
+# Ключи settings тарифа и типы колонок; object — списки / словари / строки как есть
+SETTINGS_KEYS = {
+    'min_price': 'Float64',
+    'custom_text': 'object',
+    'price_round': 'Float64',
+    'dynamic_round': 'object',
+    'show_block_stt': 'boolean',
+    'two_step_round': 'object',
+    'autofill_percent': 'Float64',
+    'surgeon_model_id': 'Int64',
+    'rush_hour_by_surge': 'boolean',
+    'dynamic_min_percent': 'Float64',
+    'dynamic_surge_enabled': 'boolean',
+    'dynamic_min_ignore_surge': 'boolean',
+}
+ROUNDING_KEYS = ('price_round', 'two_step_round')
 
-    pd.set_option('display.max_columns', None)
-    pd.options.display.float_format ='{:,.4f}'.format
-    warnings.filterwarnings('ignore')
 
-    new_df = pd.read_gbq(f"""
+def rounding_query(start_date, stop_date):
+    """Тарифы с settings (status = default, с 2020 года) и число поездок по городу / типу за период."""
+    return f"""
     with incity as (select city_id,
                       case
                           when order_type = 'auto_econom' then 1
@@ -41,38 +63,61 @@ def get_rounding_data(start_date = '2024-12-01', stop_date = '2024-12-31'):
                     and t.order_type_id = incity.order_type_id
     where created_date >= '2020-01-01'
     and t.status = 'default'
-    """)
-
-    new_df['settings_list'] = new_df.apply(lambda x: {} if x['settings'] is None else json.loads(x['settings']), axis = 1)
-    new_df['min_price'] = new_df['settings_list'].map(lambda x: x.get('min_price'))
-    new_df['custom_text'] = new_df['settings_list'].map(lambda x: x.get('custom_text'))
-    new_df['price_round'] = new_df['settings_list'].map(lambda x: x.get('price_round'))
-    new_df['dynamic_round'] = new_df['settings_list'].map(lambda x: x.get('dynamic_round'))
-    new_df['show_block_stt'] = new_df['settings_list'].map(lambda x: x.get('show_block_stt'))
-    new_df['two_step_round'] = new_df['settings_list'].map(lambda x: x.get('two_step_round'))
-    new_df['autofill_percent'] = new_df['settings_list'].map(lambda x: x.get('autofill_percent'))
-    new_df['surgeon_model_id'] = new_df['settings_list'].map(lambda x: x.get('surgeon_model_id'))
-    new_df['rush_hour_by_surge'] = new_df['settings_list'].map(lambda x: x.get('rush_hour_by_surge'))
-    new_df['dynamic_min_percent'] = new_df['settings_list'].map(lambda x: x.get('dynamic_min_percent'))
-    new_df['dynamic_surge_enabled'] = new_df['settings_list'].map(lambda x: x.get('dynamic_surge_enabled'))
-    new_df['dynamic_min_ignore_surge'] = new_df['settings_list'].map(lambda x: x.get('dynamic_min_ignore_surge'))
-
-    new_df = new_df[['city_id', 'order_type_id', 'created_date', 'macroregion_name', 'city_name', 'cn_rides_dates', 'price_round', 'two_step_round']]
+    """
 
-    return new_df
 
+def extract_settings(settings, keys=ROUNDING_KEYS):
+    """
+    Колонки keys из JSON-строк settings за один проход: каждая различная строка
+    парсится один раз (orjson, если установлен), значения раздаются строкам по коду.
+    None / отсутствующий ключ — NA.
+    """
+    codes, uniques = pd.factorize(pd.Series(settings, dtype=object))
+    parsed = [_loads(s) for s in uniques]
+    columns = {}
+    for key in keys:
+        dtype = SETTINGS_KEYS.get(key, 'object')
+        if dtype == 'object':
+            # код -1 (settings IS NULL) указывает на последний элемент — None
+            values = np.empty(len(parsed) + 1, dtype=object)
+            values[:-1] = [d.get(key) for d in parsed]
+            columns[key] = pd.Series(values[codes], dtype=object)
+        else:
+            values = pd.array([d.get(key) for d in parsed], dtype=dtype)
+            columns[key] = values.take(codes, allow_fill=True)
+    return pd.DataFrame(columns)
 
 
+def get_rounding_data(start_date = '2024-12-01', stop_date = '2024-12-31', keys=ROUNDING_KEYS,
+                      cache_dir=CACHE_DIR, refresh=False):
+    pd.set_option('display.max_columns', None)
+    pd.options.display.float_format ='{:,.4f}'.format
+    warnings.filterwarnings('ignore')
 
-def get_pictures_data(start_date = '2025-02-01',
-                      stop_date = '2025-02-04',
-                      pickup_eta_minutes_case = 0,
-                      alpha_case = 0,
-                      step1_case = 0.1,
-                      step2_case = 1.0,
-                      city_type_conditions = ()):
-    df_og = pd.read_gbq(f'''
-                     WITH rider_data AS (SELECT city_id                     AS city_id,
+    # Выгрузка тарифов кэшируется по периоду; разбор settings на каждом вызове — секунды
+    path = os.path.join(cache_dir, f'tariff_{start_date}_{stop_date}.parquet')
+    if os.path.exists(path) and not refresh:
+        new_df = pd.read_parquet(path)
+    else:
+        new_df = pd.read_gbq(rounding_query(start_date, stop_date))
+        os.makedirs(cache_dir, exist_ok=True)
+        new_df.to_parquet(path, index=False)
+
+    settings = extract_settings(new_df['settings'].tolist(), keys)
+    new_df = pd.concat([new_df.drop(columns='settings').reset_index(drop=True), settings], axis=1)
+
+    new_df = new_df[['city_id', 'order_type_id', 'created_date', 'macroregion_name', 'city_name', 'cn_rides_dates', *keys]]
+
+    return new_df
+
+
+def rider_data_sql(start_date, stop_date, city_type_conditions, qualify='', created_margin=1):
+    """
+    SELECT потока цен райдера из order_global_strm. Заказы с DATE(created_at) в
+    [start_date - created_margin, stop_date + created_margin]; поля из incity_detail
+    всегда берутся с запасом в день с каждой стороны.
+    """
+    return f'''SELECT city_id                     AS city_id,
                            timezone                    AS timezone,
                            type_name                   AS type_name,
                            uuid                        AS order_uuid,
@@ -107,11 +152,14 @@ def get_pictures_data(start_date = '2025-02-01',
                       AND AtoB_seconds > 0
                       AND ({city_type_conditions})
                       AND DATE(created_at) BETWEEN
-                        DATE_SUB('{start_date}', INTERVAL 1 DAY)
-                        AND DATE_ADD('{stop_date}', INTERVAL 1 DAY)
-                    QUALIFY ROW_NUMBER() OVER (PARTITION BY uuid, payment_price_value ORDER BY modified_at) = 1),
+                        DATE_SUB('{start_date}', INTERVAL {created_margin} DAY)
+                        AND DATE_ADD('{stop_date}', INTERVAL {created_margin} DAY)
+                    {qualify}'''
+
 
-     bid_data AS (SELECT DISTINCT CAST(NULL AS INT64)                                      AS city_id,
+def bid_data_sql(start_date, stop_date, margin_before=1, margin_after=1):
+    """SELECT бидов из bid_global_strm для заказов из CTE rider_data; created_at — в окне с запасом."""
+    return f'''SELECT DISTINCT CAST(NULL AS INT64)                                      AS city_id,
                                   CAST(NULL AS STRING)                                     AS timezone,
                                   CAST(NULL AS STRING)                                     AS type_name,
                                   order_uuid                                               AS order_uuid,
@@ -133,8 +181,24 @@ def get_pictures_data(start_date = '2025-02-01',
                     AND order_uuid IN (SELECT order_uuid FROM rider_data)
                     AND status = 'BID_STATUS_ACTIVE'
                     AND DATE(created_at) BETWEEN
-                      DATE_SUB('{start_date}', INTERVAL 1 DAY)
-                      AND DATE_ADD('{stop_date}', INTERVAL 1 DAY)),
+                      DATE_SUB('{start_date}', INTERVAL {margin_before} DAY)
+                      AND DATE_ADD('{stop_date}', INTERVAL {margin_after} DAY)'''
+
+
+def stream_ctes(start_date, stop_date, city_type_conditions, dedup_rider=True):
+    """
+    CTE rider_data / bid_data / my_strm / my_strm_full: поток цен райдера и бидов
+    с полями заказа, протянутыми на каждый бид. Общая часть get_pictures_data
+    и выгрузки для локальной симуляции (engine.py).
+    dedup_rider=False убирает QUALIFY из rider_data — дедупликация тогда
+    делается локально (sessionize.py).
+    """
+    qualify = ('QUALIFY ROW_NUMBER() OVER (PARTITION BY uuid, payment_price_value ORDER BY modified_at) = 1'
+               if dedup_rider else '')
+    return f'''
+    WITH rider_data AS ({rider_data_sql(start_date, stop_date, city_type_conditions, qualify)}),
+
+     bid_data AS ({bid_data_sql(start_date, stop_date)}),
 
      my_strm AS (SELECT city_id,
                         timezone,
@@ -197,7 +261,18 @@ def get_pictures_data(start_date = '2025-02-01',
                       WINDOW w AS (
                               PARTITION BY order_uuid
                               ORDER BY modified_at_utc
-                              ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING )),
+                              ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING ))
+    '''
+
+def get_pictures_data(start_date = '2025-02-01',
+                      stop_date = '2025-02-04',
+                      pickup_eta_minutes_case = 0,
+                      alpha_case = 0,
+                      step1_case = 0.1,
+                      step2_case = 1.0,
+                      city_type_conditions = ()):
+    df_og = pd.read_gbq(f'''
+    {stream_ctes(start_date, stop_date, city_type_conditions)},
 
      options_assign AS (SELECT city_id,
                                type_name,
@@ -0,0 +1,154 @@
+"""
+Инкрементальная выгрузка сырых потоков rider_data / bid_data в локальный
+parquet-датасет с партициями по городу и дню создания заказа:
+
+    cache/streams/rider/city_id=4148/date=2025-02-09/part.parquet
+    cache/streams/bid/city_id=4148/date=2025-02-09/part.parquet
+
+Партиция дня содержит заказы, созданные в этот день (DATE(created_at), UTC),
+и их биды за этот и следующий день, поэтому заказы в партиции полные.
+Существующие партиции не перезапрашиваются: продление анализа на день или
+ежедневное обновление выгружает только недостающие дни. Партиция пишется и
+для города без заказов в этот день — иначе он запрашивался бы снова.
+Дни, окно бидов которых ещё не закрылось (D >= сегодня - 1 по UTC: бидам дня D
+нужен и день D + 1), пишутся с маркером _INCOMPLETE рядом с part.parquet и
+считаются недостающими — следующий запуск выгрузит их заново.
+
+Пример:
+    cities = {city for city, _ in city_type_params}
+    rider, bid, geo = load_streams('2025-02-09', '2025-02-10', cities)
+    extract = sessionize(rider, bid, geo)
+"""
+import os
+
+import pandas as pd
+
+from get_data import CACHE_DIR, bid_data_sql, rider_data_sql
+from sessionize import load_geo
+
+DATASET_DIR = os.path.join(CACHE_DIR, 'streams')
+KINDS = ('rider', 'bid')
+INCOMPLETE_MARKER = '_INCOMPLETE'
+
+
+def day_query(kind, day, cities):
+    """Заказы городов cities, созданные в day, или их биды (с city_id заказа)."""
+    conditions = f"city_id IN ({', '.join(str(int(city)) for city in sorted(cities))})"
+    ctes = f'WITH rider_data AS ({rider_data_sql(day, day, conditions, created_margin=0)})'
+    if kind == 'rider':
+        return f'{ctes} SELECT * FROM rider_data'
+    return f'''{ctes},
+     bid_data AS ({bid_data_sql(day, day, margin_before=0, margin_after=1)})
+    SELECT t2.city_id, t1.* EXCEPT (city_id)
+    FROM bid_data t1
+    JOIN (SELECT DISTINCT order_uuid, city_id FROM rider_data) t2
+    ON t1.order_uuid = t2.order_uuid
+    '''
+
+
+def _partition_path(root, kind, city_id, day):
+    return os.path.join(root, kind, f'city_id={int(city_id)}', f'date={day}', 'part.parquet')
+
+
+def first_open_day(now=None):
+    """Первый день, партиции которого ещё не полные: вчера по UTC (биды дня D добираются до конца D + 1)."""
+    now = pd.Timestamp.now(tz='UTC') if now is None else pd.Timestamp(now)
+    if now.tzinfo is not None:
+        now = now.tz_convert('UTC').tz_localize(None)
+    return (now.normalize() - pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+def existing_partitions(kind, root=DATASET_DIR):
+    """Множество (city_id, 'YYYY-MM-DD') уже выгруженных полных партиций (без маркера _INCOMPLETE)."""
+    result = set()
+    base = os.path.join(root, kind)
+    if not os.path.isdir(base):
+        return result
+    for city_dir in os.listdir(base):
+        for date_dir in os.listdir(os.path.join(base, city_dir)):
+            path = os.path.join(base, city_dir, date_dir)
+            if (os.path.exists(os.path.join(path, 'part.parquet'))
+                    and not os.path.exists(os.path.join(path, INCOMPLETE_MARKER))):
+                result.add((int(city_dir.split('=', 1)[1]), date_dir.split('=', 1)[1]))
+    return result
+
+
+def _write_partition(df, path, complete=True):
+    """
+    Запись через временный файл: оборванная запись не считается выгруженной партицией.
+    Неполная партиция помечается маркером до замены файла, полная — снимает маркер после.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    marker = os.path.join(os.path.dirname(path), INCOMPLETE_MARKER)
+    if not complete:
+        open(marker, 'w').close()
+    tmp = f'{path}.tmp'
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+    if complete and os.path.exists(marker):
+        os.remove(marker)
+
+
+def ingest(start_date, stop_date, cities, root=DATASET_DIR, refresh=False, now=None):
+    """
+    Догружает недостающие партиции за дни [start_date, stop_date]: один запрос
+    на день и поток для всех городов, которых в этом дне ещё нет.
+    Дни с first_open_day(now) и позже пишутся неполными и перевыгружаются при следующем запуске.
+    refresh=True перевыгружает весь период.
+    Возвращает список выгруженных дней.
+    """
+    cities = {int(city) for city in cities}
+    days = [day.strftime('%Y-%m-%d') for day in pd.date_range(start_date, stop_date, freq='D')]
+    open_day = first_open_day(now)
+    existing = {kind: set() if refresh else existing_partitions(kind, root) for kind in KINDS}
+    fetched = []
+    for day in days:
+        for kind in KINDS:
+            missing = {city for city in cities if (city, day) not in existing[kind]}
+            if not missing:
+                continue
+            df = pd.read_gbq(day_query(kind, day, missing))
+            for city_id in missing:
+                part = df[df['city_id'] == city_id].drop(columns='city_id')
+                _write_partition(part, _partition_path(root, kind, city_id, day), complete=day < open_day)
+            fetched.append((kind, day))
+    return sorted({day for _, day in fetched})
+
+
+def read_partitions(kind, start_date, stop_date, cities, root=DATASET_DIR):
+    """Партиции потока за дни [start_date, stop_date] по городам cities (чтение только нужных файлов)."""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    keys = pa.schema([('city_id', pa.int64()), ('date', pa.string())])
+    partitioning = ds.partitioning(keys, flavor='hive')
+    dataset = ds.dataset(os.path.join(root, kind), format='parquet', partitioning=partitioning)
+    condition = (ds.field('city_id').isin([int(city) for city in cities])
+                 & (ds.field('date') >= str(start_date)) & (ds.field('date') <= str(stop_date)))
+    # Пустые партиции хранят колонки без значений как null — схема сводится по всем нужным файлам
+    fragments = list(dataset.get_fragments(filter=condition))
+    if not fragments:
+        return pd.DataFrame(columns=dataset.schema.names).drop(columns='date')
+    schema = pa.unify_schemas([f.physical_schema for f in fragments] + [keys], promote_options='permissive')
+    dataset = ds.dataset([f.path for f in fragments], schema=schema, format='parquet',
+                         partitioning=partitioning, partition_base_dir=os.path.join(root, kind))
+    return dataset.to_table().to_pandas().drop(columns='date')
+
+
+def load_streams(start_date, stop_date, cities, type_names=None, root=DATASET_DIR, cache_dir=CACHE_DIR):
+    """
+    То же, что sessionize.load_streams, но через датасет: догружает недостающие дни
+    окна [start_date - 1, stop_date + 1] (как в stream_ctes) и читает только нужные партиции.
+    type_names — фильтр по типам заказа (в датасете хранятся все типы города).
+    """
+    window_start = (pd.Timestamp(start_date) - pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    window_stop = (pd.Timestamp(stop_date) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    ingest(window_start, window_stop, cities, root)
+
+    rider = read_partitions('rider', window_start, window_stop, cities, root)
+    bid = read_partitions('bid', window_start, window_stop, cities, root)
+    if type_names is not None:
+        rider = rider[rider['type_name'].isin(list(type_names))].reset_index(drop=True)
+    # Как order_uuid IN (SELECT order_uuid FROM rider_data) в bid_data
+    bid = bid[bid['order_uuid'].isin(rider['order_uuid'])].reset_index(drop=True)
+    return rider, bid, load_geo(cache_dir)
@@ -0,0 +1,178 @@
+"""
+Быстрый предпросмотр симуляции на стратифицированной выборке заказов.
+
+Выборка — по order_uuid (биды заказа всегда вместе), страты — город, тип,
+eta_bin и AtoB_bin заказа. Внутри страты берутся заказы с наименьшим хэшем
+order_uuid, поэтому выборка детерминирована для данного seed. Каждой строке
+приписывается вес N_страты / n_страты. Агрегаты get_agg_data оцениваются
+взвешенно, ошибка — методом случайных групп: выборка делится на groups частей
+по хэшу заказа, оценки по частям дают стандартную ошибку (колонки *_se).
+
+Пример:
+    rider, bid = sample_streams(rider, bid, frac=0.05)
+    pictures_data, agg_data = preview(sessionize(rider, bid, geo), city_type_params, '2025-02-09', '2025-02-10')
+"""
+import numpy as np
+import pandas as pd
+
+from binning import aggregate_bins, bid_metrics, distinct_count, prepare_binning, safe_divide
+from engine import DEFAULT_PARAMS, simulate
+
+WEIGHT_COLUMN = 'sample_weight'
+
+
+def _order_hash(uniques, seed):
+    """Хэш order_uuid с солью seed: один и тот же заказ всегда получает одно число."""
+    return pd.util.hash_array(np.asarray(uniques, dtype=object), hash_key=f'{seed:016d}'[-16:], categorize=False)
+
+
+def _first_rows(codes, n):
+    """Индекс первой строки каждого кода (-1, если строк нет)."""
+    first = np.full(n, -1)
+    rows = np.arange(len(codes))
+    # При повторяющихся индексах побеждает последняя запись — идём с конца
+    first[codes[::-1]] = rows[::-1]
+    return first
+
+
+def _order_min(codes, n, values):
+    """Минимум по заказу без учёта NaN (NaN, если значений нет)."""
+    result = np.full(n, np.nan)
+    np.fmin.at(result, codes, np.asarray(values, dtype=np.float64))
+    return result
+
+
+def _bin(values, width):
+    return np.floor(np.asarray(values, dtype=np.float64) / width)
+
+
+def select_orders(strata, order_hash, frac, min_orders=5):
+    """
+    Отбор заказов по стратам: в каждой страте ceil(frac * N) заказов с наименьшим
+    хэшем, но не меньше min(min_orders, N). Возвращает (маска, вес) на заказ.
+
+    :param strata: DataFrame колонок страт, одна строка на заказ
+    """
+    stratum = strata.groupby(list(strata.columns), dropna=False, sort=False).ngroup().to_numpy()
+    sizes = np.bincount(stratum)
+    taken = np.minimum(sizes, np.maximum(np.ceil(frac * sizes), np.minimum(min_orders, sizes))).astype(np.int64)
+
+    order = np.lexsort((order_hash, stratum))
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    position = np.empty(len(order), dtype=np.int64)
+    position[order] = np.arange(len(order)) - starts[stratum[order]]
+    keep = position < taken[stratum]
+    weight = np.where(keep, sizes[stratum] / np.maximum(taken[stratum], 1), 0.0)
+    return keep, weight
+
+
+def sample_extract(extract, frac=0.05, eta_width=60, atob_width=60, min_orders=5, seed=0):
+    """
+    Выборка заказов из выгрузки load_extract / sessionize. Страта заказа — город, тип,
+    AtoB и минимальный eta по его бидам (не зависит от порядка строк).
+    Возвращает строки выбранных заказов с колонкой sample_weight.
+    """
+    codes, uniques = pd.factorize(extract['order_uuid'])
+    first = _first_rows(codes, len(uniques))
+    head = extract[['city_id', 'type_name', 'AtoB_seconds']].iloc[first]
+    eta = extract['eta'].to_numpy(dtype=np.float64, na_value=np.nan)
+    strata = pd.DataFrame({
+        'city_id': head['city_id'].to_numpy(),
+        'type_name': head['type_name'].to_numpy(),
+        'eta_bin': _bin(_order_min(codes, len(uniques), eta), eta_width),
+        'AtoB_bin': _bin(head['AtoB_seconds'].to_numpy(dtype=np.float64, na_value=np.nan), atob_width),
+    })
+    keep, weight = select_orders(strata, _order_hash(uniques, seed), frac, min_orders)
+    rows = keep[codes]
+    return extract[rows].assign(**{WEIGHT_COLUMN: weight[codes][rows]}).reset_index(drop=True)
+
+
+def sample_streams(rider, bid, frac=0.05, eta_width=60, atob_width=60, min_orders=5, seed=0):
+    """
+    Та же выборка до sessionize — на сырых потоках load_streams, чтобы не собирать
+    my_strm_full целиком. Город, тип и AtoB — из первой строки райдера, eta — минимум по бидам;
+    для тех же заказов выборка совпадает с sample_extract.
+    Веса заказов возвращаются колонкой sample_weight у бидов.
+    """
+    codes, uniques = pd.factorize(pd.concat([rider['order_uuid'], bid['order_uuid']], ignore_index=True))
+    rider_codes, bid_codes = codes[:len(rider)], codes[len(rider):]
+    rider_first = _first_rows(rider_codes, len(uniques))
+
+    def first_value(frame, first, column):
+        return pd.api.extensions.take(frame[column].to_numpy(dtype=object), first, allow_fill=True)
+
+    strata = pd.DataFrame({
+        'city_id': first_value(rider, rider_first, 'city_id'),
+        'type_name': first_value(rider, rider_first, 'type_name'),
+        'eta_bin': _bin(_order_min(bid_codes, len(uniques), bid['eta'].to_numpy(dtype=np.float64, na_value=np.nan)),
+                        eta_width),
+        'AtoB_bin': _bin(first_value(rider, rider_first, 'AtoB_seconds'), atob_width),
+    })
+    keep, weight = select_orders(strata, _order_hash(uniques, seed), frac, min_orders)
+    rider = rider[keep[rider_codes]].reset_index(drop=True)
+    bid_rows = keep[bid_codes]
+    bid = bid[bid_rows].assign(**{WEIGHT_COLUMN: weight[bid_codes][bid_rows]}).reset_index(drop=True)
+    return rider, bid
+
+
+def estimate_agg(simulation, weights, order_hash=None, groups=20):
+    """
+    Взвешенные оценки колонок get_agg_data по city_id / type_name и их стандартные ошибки.
+    Доли и средние — отношения взвешенных сумм, total_bids_cnt — взвешенная сумма.
+    """
+    frame = simulation.frame
+    weights = np.asarray(weights, dtype=np.float64)
+    if order_hash is None:
+        order_hash = pd.util.hash_array(frame['order_uuid'].to_numpy(dtype=object))
+    group = (order_hash % np.uint64(groups)).astype(np.int64)
+    key_codes = frame.groupby(['city_id', 'type_name'], dropna=False, sort=False).ngroup().to_numpy()
+    keys = frame[['city_id', 'type_name']].drop_duplicates().reset_index(drop=True)
+    n_keys = len(keys)
+
+    new_bids = frame['new_bids_bool'].to_numpy()
+    distinct = distinct_count(*simulation.simulated_bids)
+    metrics = bid_metrics(simulation)
+    # Каждая колонка — отношение сумм числителя и знаменателя (None — оценка суммы)
+    ratios = {'total_bids_cnt': (np.ones(len(frame)), None),
+              'new_bids_share': (new_bids, np.ones(len(frame)))}
+    for k in (3, 2, 1):
+        ratios[f'new_bids_unique_{k}_share'] = (new_bids & (distinct == k), new_bids)
+    for name in metrics.columns:
+        values = metrics[name].to_numpy()
+        present = ~np.isnan(values)
+        ratios[f'{name}_avg'] = (np.where(present, values, 0.0), present)
+
+    def sums(values):
+        """Взвешенные суммы по (ключ, группа): матрица n_keys × groups."""
+        index = key_codes * groups + group
+        return np.bincount(index, weights=weights * values, minlength=n_keys * groups).reshape(n_keys, groups)
+
+    result = keys.copy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for column, (numerator, denominator) in ratios.items():
+            by_group = sums(numerator)
+            if denominator is None:
+                estimate = by_group.sum(axis=1)
+                replicates = by_group * groups
+            else:
+                by_group_denominator = sums(denominator)
+                estimate = safe_divide(by_group.sum(axis=1), by_group_denominator.sum(axis=1))
+                replicates = safe_divide(by_group, by_group_denominator)
+            result[column] = estimate
+            result[f'{column}_se'] = np.nanstd(replicates, axis=1, ddof=1) / np.sqrt(groups)
+    return result
+
+
+def preview(extract, city_type_params, start_date=None, stop_date=None, default=DEFAULT_PARAMS,
+            frac=0.05, eta_width=60, atob_width=60, min_orders=5, groups=20, seed=0):
+    """
+    get_pictures_data_local + get_agg_data_local на выборке заказов.
+    Если в extract уже есть sample_weight (sample_streams), повторной выборки нет.
+    :return: (pictures_data со взвешенными средними, agg_data с колонками *_se)
+    """
+    if WEIGHT_COLUMN not in extract:
+        extract = sample_extract(extract, frac, eta_width, atob_width, min_orders, seed)
+    simulation = simulate(extract, city_type_params, start_date, stop_date, default)
+    weights = simulation.frame[WEIGHT_COLUMN].to_numpy(dtype=np.float64)
+    pictures = aggregate_bins(prepare_binning(simulation, weights=weights), eta_width, atob_width)
+    return pictures, estimate_agg(simulation, weights, groups=groups)
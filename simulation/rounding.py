@@ -0,0 +1,55 @@
+"""
+Двухшаговое округление цен из options_assign (get_pictures_data / get_agg_data):
+
+    step2 >= 0:  price <= (FLOOR(price / step2) * step2 + CEIL(price / step2) * step2) / 2
+                     -> CEIL(price / step1) * step1
+                 иначе
+                     -> CEIL(price / step2) * step2
+    step2 < 0:   CEIL(price / step1) * step1        (второй шаг выключен)
+
+Работает на плоских массивах цен с параметрами на элемент или на строку
+(ragged: values + offsets), без Python-цикла по ценам.
+"""
+import numpy as np
+
+
+def round_two_step(price, step1, step2, out=None):
+    """
+    Округление массива цен; step1 / step2 — скаляры или массивы,
+    бродкастящиеся к price. Результат пишется в out, если он передан.
+    """
+    price = np.asarray(price, dtype=np.float64)
+    step1 = np.asarray(step1, dtype=np.float64)
+    step2 = np.asarray(step2, dtype=np.float64)
+    shape = np.broadcast_shapes(price.shape, step1.shape, step2.shape)
+    if out is None:
+        out = np.empty(shape, dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # CEIL по первому шагу — ответ по умолчанию
+        np.divide(price, step1, out=out)
+        np.ceil(out, out=out)
+        np.multiply(out, step1, out=out)
+
+        enabled = step2 >= 0
+        if np.any(enabled):
+            quotient = price / step2
+            ceil2 = np.ceil(quotient) * step2
+            half = (np.floor(quotient) * step2 + ceil2) / 2
+            # NOT (price <= half), чтобы NaN вёл себя как ветка ELSE в SQL
+            np.copyto(out, ceil2, where=enabled & ~(price <= half))
+    return out
+
+
+def round_two_step_ragged(values, offsets, step1, step2):
+    """
+    Округление ragged-массива: цены строки i — values[offsets[i]:offsets[i + 1]],
+    step1 / step2 — скаляры или массивы длины n_rows (по одному на строку).
+    """
+    lengths = np.diff(offsets)
+    step1, step2 = np.asarray(step1), np.asarray(step2)
+    if step1.ndim:
+        step1 = np.repeat(step1, lengths)
+    if step2.ndim:
+        step2 = np.repeat(step2, lengths)
+    return round_two_step(values, step1, step2)
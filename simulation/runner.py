@@ -0,0 +1,83 @@
+"""
+Параллельный прогон симуляции по парам (city_id, type_name).
+
+Каждая пара — отдельная партиция: simulate, агрегаты get_agg_data и сетка
+eta × AtoB для draw_heatmap считаются в своём процессе, в конце результаты
+склеиваются. Партиции не пересекаются по ключам, поэтому склейка — просто concat.
+Выгрузку можно передать путём к parquet (load_extract кладёт её в simulation/cache/):
+тогда каждый воркер сам читает только свою пару, и данные не пересылаются между процессами.
+
+Пример:
+    pictures_data, agg_data = run(extract, city_type_params, '2025-02-09', '2025-02-10', workers=8)
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from binning import aggregate_bins, prepare_binning
+from engine import DEFAULT_PARAMS, agg_metrics, simulate
+
+PARTITION_KEYS = ['city_id', 'type_name']
+
+
+def partitions(extract):
+    """Пары (city_id, type_name) и число бидов в каждой, по убыванию размера."""
+    if isinstance(extract, str):
+        extract = pd.read_parquet(extract, columns=PARTITION_KEYS)
+    sizes = extract.groupby(PARTITION_KEYS, sort=False).size().sort_values(ascending=False)
+    return list(sizes.items())
+
+
+def _read_partition(source, key):
+    """source — уже выделенная партиция или путь к parquet всей выгрузки."""
+    if isinstance(source, str):
+        city_id, type_name = key
+        return pd.read_parquet(source, filters=[('city_id', '==', city_id), ('type_name', '==', type_name)])
+    return source
+
+
+def run_partition(source, key, params, start_date=None, stop_date=None, default=DEFAULT_PARAMS,
+                  eta_width=60, atob_width=60):
+    """Симуляция и агрегаты одной пары (city_id, type_name)."""
+    part = _read_partition(source, key)
+    city_type_params = {key: params} if params is not None else {}
+    simulation = simulate(part, city_type_params, start_date, stop_date, default)
+    pictures = aggregate_bins(prepare_binning(simulation), eta_width, atob_width).drop(columns='bids_cnt')
+    return pictures, agg_metrics(simulation)
+
+
+def run(extract, city_type_params, start_date=None, stop_date=None, default=DEFAULT_PARAMS,
+        workers=None, eta_width=60, atob_width=60, only_listed=True):
+    """
+    get_pictures_data_local + get_agg_data_local по партициям в пуле процессов.
+
+    :param extract: выгрузка load_extract (DataFrame) или путь к её parquet
+    :param workers: число процессов (по умолчанию — все ядра); 1 — без пула
+    :param only_listed: считать только пары из city_type_params
+    :return: (pictures_data, agg_data)
+    """
+    keys = [key for key, _ in partitions(extract)]
+    if only_listed:
+        keys = [key for key in keys if key in city_type_params]
+    if isinstance(extract, str):
+        sources = dict.fromkeys(keys, extract)
+    else:
+        # Воркеру уходит только его партиция, а не вся выгрузка
+        sources = dict(iter(extract.groupby(PARTITION_KEYS, sort=False)))
+    jobs = [(sources[key], key, city_type_params.get(key), start_date, stop_date, default, eta_width, atob_width)
+            for key in keys]
+
+    workers = workers or os.cpu_count()
+    if workers == 1 or len(jobs) <= 1:
+        results = [run_partition(*job) for job in jobs]
+    else:
+        # Партиции отсортированы по убыванию размера: крупные стартуют первыми
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            results = list(pool.map(run_partition, *zip(*jobs)))
+
+    if not results:
+        return pd.DataFrame(), pd.DataFrame()
+    pictures = pd.concat([r[0] for r in results], ignore_index=True)
+    agg = pd.concat([r[1] for r in results], ignore_index=True)
+    return pictures, agg
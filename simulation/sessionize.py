@@ -0,0 +1,150 @@
+"""
+Локальная сборка my_strm_full из сырых потоков rider_data и bid_data.
+
+В SQL поля заказа протягиваются на каждый бид через UNION ALL, ORDER BY и
+~9 окон LAST_VALUE(... IGNORE NULLS) OVER (PARTITION BY order_uuid ...).
+Здесь потоки сортируются один раз по (order_uuid, modified_at_utc), последнее
+непустое значение каждого поля райдера берётся сегментной редукцией по заказу
+и раздаётся бидам по коду заказа. QUALIFY ROW_NUMBER() из rider_data тоже
+применяется локально, поэтому сырые CDC-выгрузки можно держать на диске.
+
+Пример:
+    rider, bid, geo = load_streams('2025-02-09', '2025-02-10', city_type_conditions)
+    extract = sessionize(rider, bid, geo)
+    pictures_data = get_pictures_data_local(extract, city_type_params, '2025-02-09', '2025-02-10')
+"""
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from engine import CACHE_DIR, pack_ragged, unpack_ragged
+from get_data import stream_ctes
+
+# Поля райдера, которые my_strm_full протягивает на биды (LAST_VALUE ... OVER w)
+RIDER_FIELDS = ['city_id', 'timezone', 'type_name', 'price', 'price_highrate_value',
+                'accepted_tender_uuid', 'AtoB_seconds', 'order_done', 'multiplier']
+
+GEO_QUERY = '''
+    SELECT DISTINCT tc.id AS city_id,
+           CONCAT(tc.name, ' (', tc.id, ') ', tcc.name) AS geo
+    FROM `indriver-e6e40.ods_geo_config.tbl_city` tc
+    JOIN `indriver-e6e40.ods_geo_config.tbl_country` tcc
+    ON tc.country_id = tcc.id
+'''
+
+
+def load_geo(cache_dir=CACHE_DIR, refresh=False):
+    """Справочник city_id -> geo, кэшируется в parquet."""
+    path = os.path.join(cache_dir, 'geo.parquet')
+    if os.path.exists(path) and not refresh:
+        return pd.read_parquet(path)
+    df = pd.read_gbq(GEO_QUERY)
+    os.makedirs(cache_dir, exist_ok=True)
+    df.to_parquet(path, index=False)
+    return df
+
+
+def load_streams(start_date, stop_date, city_type_conditions, cache_dir=CACHE_DIR, refresh=False):
+    """Сырые rider_data (без QUALIFY), bid_data и справочник geo; каждый кэшируется в parquet."""
+    key = hashlib.sha1(str(city_type_conditions).encode()).hexdigest()[:10]
+    ctes = stream_ctes(start_date, stop_date, city_type_conditions, dedup_rider=False)
+    queries = {
+        'rider': f'{ctes} SELECT * FROM rider_data',
+        'bid': f'{ctes} SELECT * FROM bid_data',
+    }
+
+    frames = []
+    for name, query in queries.items():
+        path = os.path.join(cache_dir, f'{name}_{start_date}_{stop_date}_{key}.parquet')
+        if os.path.exists(path) and not refresh:
+            frames.append(pd.read_parquet(path))
+            continue
+        df = pd.read_gbq(query)
+        os.makedirs(cache_dir, exist_ok=True)
+        df.to_parquet(path, index=False)
+        frames.append(df)
+    return (*frames, load_geo(cache_dir, refresh))
+
+
+def _segment_ends(codes):
+    """Маска последней строки каждого сегмента в отсортированном массиве кодов."""
+    last = np.ones(len(codes), dtype=bool)
+    last[:-1] = codes[1:] != codes[:-1]
+    return last
+
+
+def sessionize(rider, bid, geo=None):
+    """
+    Биды с полями заказа, как в my_strm_full (только price_type = 'bid_price'),
+    в схеме load_extract из engine.py.
+
+    Цены бидов делятся на COALESCE(multiplier, 100) своей строки, как в SQL;
+    у бидов multiplier всегда NULL, поэтому делитель — 100.
+    """
+    # sort=True: коды заказов упорядочены как order_uuid — для финального ORDER BY
+    codes, uniques = pd.factorize(
+        pd.concat([rider['order_uuid'], bid['order_uuid']], ignore_index=True), sort=True
+    )
+    rider_codes, bid_codes = codes[:len(rider)], codes[len(rider):]
+    modified_at = rider['modified_at_utc'].values
+    price_codes = pd.factorize(rider['price'])[0]
+
+    # QUALIFY: первая по времени строка в каждой паре (заказ, цена)
+    order = np.lexsort((modified_at, price_codes, rider_codes))
+    partition = rider_codes[order], price_codes[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (partition[0][1:] != partition[0][:-1]) | (partition[1][1:] != partition[1][:-1])
+    kept = order[first]
+
+    # Одна сортировка потока райдера по (order_uuid, modified_at_utc)
+    kept = kept[np.lexsort((modified_at[kept], rider_codes[kept]))]
+    sorted_codes = rider_codes[kept]
+
+    def broadcast(field, dtype=None):
+        """LAST_VALUE(field IGNORE NULLS) OVER w для каждого бида."""
+        column = rider[field].array.take(kept)
+        present = ~pd.isna(column)
+        positions = np.flatnonzero(present)
+        ends = positions[_segment_ends(sorted_codes[present])]
+        last_row = np.full(len(uniques), -1)
+        last_row[sorted_codes[ends]] = ends
+        values = pd.api.extensions.take(column, last_row[bid_codes], allow_fill=True)
+        return pd.array(values, dtype=dtype) if dtype else values
+
+    divisor = bid['multiplier'].fillna(100).to_numpy(dtype=np.float64) if 'multiplier' in bid else 100.0
+    values, offsets = pack_ragged(bid['available_prices'].tolist())
+    values = values / np.repeat(np.broadcast_to(divisor, (len(bid),)), np.diff(offsets))
+    lengths = np.diff(offsets)
+    last_step = np.full(len(bid), np.nan)
+    last_step[lengths > 0] = values[offsets[1:][lengths > 0] - 1]
+
+    result = pd.DataFrame({
+        'city_id': broadcast('city_id', 'Int64'),
+        'timezone': broadcast('timezone'),
+        'type_name': broadcast('type_name'),
+        'order_uuid': bid['order_uuid'].to_numpy(),
+        'tender_uuid': bid['tender_uuid'].to_numpy(),
+        'price_type': 'bid_price',
+        'price': bid['price'].to_numpy(dtype=np.float64, na_value=np.nan) / divisor,
+        'available_prices': unpack_ragged(values, offsets),
+        'last_step': last_step,
+        'start_price_value': broadcast('price', 'Float64').to_numpy(dtype=np.float64, na_value=np.nan) / divisor,
+        'price_highrate_value': broadcast('price_highrate_value', 'Float64').to_numpy(dtype=np.float64, na_value=np.nan) / divisor,
+        'accepted_tender_uuid': broadcast('accepted_tender_uuid'),
+        'AtoB_seconds': broadcast('AtoB_seconds', 'Int64'),
+        'eta': bid['eta'].to_numpy(),
+        'modified_at_utc': bid['modified_at_utc'].array,
+        'order_done': broadcast('order_done', 'boolean'),
+        'multiplier': broadcast('multiplier', 'Int64'),
+    })
+    if 'sample_weight' in bid:
+        # Вес заказа из preview.sample_streams
+        result['sample_weight'] = bid['sample_weight'].to_numpy()
+    if geo is not None:
+        result.insert(1, 'geo', result['city_id'].map(geo.drop_duplicates('city_id').set_index('city_id')['geo']))
+
+    # ORDER BY order_uuid, modified_at_utc
+    order = np.lexsort((bid['modified_at_utc'].values, bid_codes))
+    return result.iloc[order].reset_index(drop=True)